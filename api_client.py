@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import count, observe
+
+# Explicit (connect, read) timeouts so a stuck connection can't hang a whole run
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# Bounded exponential backoff on transient failures
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Transient transport errors, including a connection dropped mid-body and a garbled gzip body
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError
+)
+
+# Connections kept alive per host, should cover the number of requests in flight
+POOL_SIZE = 16
+
+# The sellers API has been called with certificate verification off
+VERIFY_SSL = False
+
+_session = None
+_session_lock = threading.Lock()
+
+class ApiRequestError(Exception):
+    """Raised when a request still fails after all retries."""
+
+def create_session(pool_size=POOL_SIZE):
+    """
+    Create a requests.Session with a keep-alive connection pool and gzip negotiation.
+
+    Args:
+        pool_size (int): Maximum pooled connections per host (default: 16)
+
+    Returns:
+        requests.Session: Configured session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+def get_session():
+    """Return the shared session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header into seconds.
+
+    Args:
+        value (str): Header value, either delta-seconds or an HTTP date
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (0-based).
+
+    Uses full-jitter exponential backoff capped at BACKOFF_MAX, unless the
+    server asked for a specific delay with Retry-After.
+    """
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def post_json(url, headers=None, json_body=None, session=None, timeout=None, max_retries=MAX_RETRIES, verify=VERIFY_SSL):
+    """
+    POST a JSON body and return the response, retrying transient failures.
+
+    Retries on RETRY_EXCEPTIONS and RETRY_STATUS_CODES, honoring the
+    Retry-After header when the server sends one. Any other requests error
+    (e.g. too many redirects) is raised as ApiRequestError right away.
+
+    Args:
+        url (str): Endpoint URL
+        headers (dict): Extra request headers
+        json_body (dict): Body to send as JSON
+        session (requests.Session): Session to use (default: shared pooled session)
+        timeout (tuple): (connect, read) timeout in seconds (default: CONNECT_TIMEOUT, READ_TIMEOUT)
+        max_retries (int): Retries after the first attempt (default: 4)
+        verify (bool): Verify TLS certificates (default: VERIFY_SSL)
+
+    Returns:
+        tuple: (response, retries) where retries is the number of retried attempts
+
+    Raises:
+        ApiRequestError: If the request still fails after max_retries retries, or fails with a non-transient error
+    """
+    session = session or get_session()
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        try:
+            response = session.post(url, headers=headers, json=json_body, timeout=timeout, verify=verify)
+        except RETRY_EXCEPTIONS as e:
+            error = f"{type(e).__name__}: {e}"
+            reason = type(e).__name__
+        except requests.RequestException as e:
+            count('api_failed_attempts_total', reason=type(e).__name__)
+            raise ApiRequestError(f"Request to {url} failed: {type(e).__name__}: {e}") from e
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response, attempt
+            error = f"HTTP {response.status_code}"
+            reason = str(response.status_code)
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+        count('api_failed_attempts_total', reason=reason)
+        if attempt == max_retries:
+            break
+        delay = backoff_delay(attempt, retry_after)
+        print(f"[RETRY] {error}, retrying in {delay:.2f}s ({attempt + 1}/{max_retries})")
+        observe('api_retry_sleep_seconds', delay)
+        time.sleep(delay)
+
+    raise ApiRequestError(f"Request to {url} failed after {max_retries + 1} attempts: {error}")
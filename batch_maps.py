@@ -0,0 +1,170 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from render_manifest import RenderManifest
+from run_maps import create_sellers_map_with_target
+
+# Processes rendering maps in batch mode (None = one per CPU)
+BATCH_PROCESSES = None
+
+# Seller data shared by the render workers, set once per process by _init_worker
+_sellers_info = None
+_spatial_index = None
+_thumbnails = None
+
+def load_targets(path):
+    """
+    Read the targets of a batch run from a JSON or CSV file.
+
+    JSON files hold a list of objects, CSV files a header row; both with the
+    fields name, latitude, longitude, zoom, radius_km and output. Only
+    latitude, longitude and output are required.
+
+    Args:
+        path (str): .json or .csv file
+
+    Returns:
+        list: Target dictionaries with numeric latitude/longitude and zoom/radius_km (None when not given)
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+
+    targets = []
+    outputs = set()
+    for number, row in enumerate(rows, 1):
+        missing = [field for field in ('latitude', 'longitude', 'output') if row.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"Target {number} in {path} is missing {', '.join(missing)}")
+        output = str(row['output'])
+        if output in outputs:
+            raise ValueError(f"Target {number} in {path} writes to {output} like an earlier target")
+        outputs.add(output)
+        targets.append({
+            'name': str(row.get('name') or os.path.splitext(os.path.basename(output))[0]),
+            'latitude': float(row['latitude']),
+            'longitude': float(row['longitude']),
+            'zoom': int(row['zoom']) if row.get('zoom') not in (None, '') else None,
+            'radius_km': float(row['radius_km']) if row.get('radius_km') not in (None, '') else None,
+            'output': output
+        })
+    return targets
+
+def _init_worker(sellers_info, spatial_index, thumbnails):
+    """Keep the seller data in the worker, so it is sent once per process rather than once per map."""
+    global _sellers_info, _spatial_index, _thumbnails
+    _sellers_info = sellers_info
+    _spatial_index = spatial_index
+    _thumbnails = thumbnails
+
+def render_target(target, map_options):
+    """
+    Render and save the map of one target from the worker's seller data.
+
+    Args:
+        target (dict): Target from load_targets
+        map_options (dict): Keyword arguments for create_sellers_map_with_target shared by all targets,
+            zoom_start and max_radius_km are the defaults for targets without their own
+
+    Returns:
+        tuple: (target, seconds, error message or None)
+    """
+    started = time.perf_counter()
+    options = dict(map_options)
+    if target['zoom'] is not None:
+        options['zoom_start'] = target['zoom']
+    if target['radius_km'] is not None:
+        options['max_radius_km'] = target['radius_km']
+    if options.pop('popup_sidecar', False) and options.get('lazy_popups'):
+        options['popup_data_file'] = os.path.splitext(target['output'])[0] + '_popups.js'
+    incremental = options.pop('incremental', False)
+    thumbnails = _thumbnails.get(os.path.dirname(os.path.abspath(target['output']))) if _thumbnails else None
+
+    try:
+        directory = os.path.dirname(target['output'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        manifest = RenderManifest(target['output']) if incremental else None
+        try:
+            # The map's progress output of many workers would interleave, only the batch summary is printed
+            with contextlib.redirect_stdout(io.StringIO()):
+                google_map = create_sellers_map_with_target(
+                    _sellers_info,
+                    target['latitude'],
+                    target['longitude'],
+                    spatial_index=_spatial_index,
+                    thumbnails=thumbnails,
+                    manifest=manifest,
+                    **options
+                )
+                if google_map is None:
+                    return target, time.perf_counter() - started, "no sellers to show"
+                if manifest is None or not manifest.unchanged():
+                    google_map.save(target['output'])
+                    if manifest is not None:
+                        manifest.commit()
+        finally:
+            if manifest is not None:
+                manifest.close()
+    except Exception as e:
+        return target, time.perf_counter() - started, f"{type(e).__name__}: {e}"
+    return target, time.perf_counter() - started, None
+
+def generate_maps(sellers_info, targets, spatial_index=None, thumbnails=None, processes=BATCH_PROCESSES, **map_options):
+    """
+    Render one map per target from one seller dataset, in parallel across a process pool.
+
+    The sellers, spatial index and thumbnails are handed to each worker
+    process once (inherited without copying where processes are forked);
+    only the small target dictionaries travel per map.
+
+    Args:
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+        targets (list): Targets from load_targets
+        spatial_index (SpatialIndex): Index over sellers_info (default: built by every map)
+        thumbnails (dict): {absolute output directory: thumbnails.prepare_thumbnails result} (optional)
+        processes (int): Worker processes (default: one per CPU, 1 renders in this process)
+        **map_options: Keyword arguments for create_sellers_map_with_target shared by all maps
+            (zoom_start, max_radius_km, nearest_count, render_mode, lazy_popups, tile_proxy),
+            plus popup_sidecar=True to write each map's popup data next to it and incremental=True to keep a
+            render_manifest next to each map (unchanged maps are not rewritten)
+
+    Returns:
+        list: (target, seconds, error message or None) per target, in the order the maps finished
+    """
+    started = time.perf_counter()
+    processes = min(processes or os.cpu_count() or 1, len(targets)) or 1
+    print(f"[BATCH] Rendering {len(targets)} maps of {len(sellers_info)} sellers with {processes} processes")
+
+    results = []
+
+    def report(result):
+        target, seconds, error = result
+        results.append(result)
+        if error:
+            print(f"[BATCH] ❌ {target['name']}: {error}")
+        else:
+            print(f"[BATCH] ✅ {target['name']} -> {target['output']} ({seconds:.2f}s) [{len(results)}/{len(targets)}]")
+
+    if processes == 1:
+        _init_worker(sellers_info, spatial_index, thumbnails)
+        for target in targets:
+            report(render_target(target, map_options))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(sellers_info, spatial_index, thumbnails)
+        ) as executor:
+            futures = [executor.submit(render_target, target, map_options) for target in targets]
+            for future in as_completed(futures):
+                report(future.result())
+
+    failed = sum(1 for _, _, error in results if error)
+    print(f"[BATCH] {len(results) - failed} of {len(targets)} maps written in {time.perf_counter() - started:.2f}s")
+    return results
@@ -0,0 +1,53 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from batch_maps import generate_maps
+from benchmarks.synthetic import generate_sellers_info
+from spatial_index import SpatialIndex
+
+def make_targets(count, directory, seed=0):
+    """Venues spread over the synthetic sellers' area, each with its own zoom, radius and output file."""
+    rng = random.Random(seed)
+    return [
+        {
+            'name': f"venue_{number}",
+            'latitude': rng.uniform(13.0, 16.0),
+            'longitude': rng.uniform(100.0, 102.5),
+            'zoom': rng.choice([10, 11, 12]),
+            'radius_km': rng.choice([20.0, 40.0, 80.0]),
+            'output': os.path.join(directory, f"venue_{number}.html")
+        }
+        for number in range(count)
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time batch map rendering in one process against a process pool")
+    parser.add_argument('--sellers', type=int, default=5000)
+    parser.add_argument('--targets', type=int, default=12)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--mode', default='cluster')
+    args = parser.parse_args(argv)
+
+    sellers_info = generate_sellers_info(args.sellers)
+    spatial_index = SpatialIndex.from_sellers(sellers_info)
+    print(f"{args.targets} maps of {args.sellers} sellers ({args.mode}), {os.cpu_count()} CPUs")
+    print(f"{'processes':>9}  {'time':>9}  {'per map':>9}")
+    for processes in dict.fromkeys(args.processes):
+        with tempfile.TemporaryDirectory() as directory:
+            targets = make_targets(args.targets, directory)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = generate_maps(
+                    sellers_info, targets, spatial_index=spatial_index, processes=processes, render_mode=args.mode
+                )
+            seconds = time.perf_counter() - started
+            failed = sum(1 for _, _, error in results if error)
+            print(f"{processes:>9}  {seconds:>8.2f}s  {seconds / len(targets):>8.2f}s" + (f"  ({failed} failed)" if failed else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import math
+import time
+
+from benchmarks.synthetic import generate_sellers_info
+from geo import EARTH_RADIUS_KM, distances_to_target, nearest_indices
+from seller_record import SellerBatch
+
+TARGET_LATITUDE = 14.4428927
+TARGET_LONGITUDE = 101.3728028
+
+def loop_distances(sellers, target_lat, target_lon):
+    """Per-seller Python loop, the baseline the vectorized path replaces."""
+    distances = []
+    for seller in sellers:
+        lat = seller['location']['latitude']
+        lon = seller['location']['longitude']
+        if not (lat and lon):
+            distances.append(math.nan)
+            continue
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat, lon, target_lat, target_lon))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a)))
+    return distances
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare vectorized and per-seller distance-to-target ranking")
+    parser.add_argument('--count', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"{'sellers':>8}  {'loop+sort':>10}  {'dicts':>10}  {'batch':>10}")
+    for count in args.count:
+        sellers_info = generate_sellers_info(count)
+        batch = SellerBatch(sellers_info)
+
+        def loop_nearest():
+            distances = loop_distances(sellers_info, TARGET_LATITUDE, TARGET_LONGITUDE)
+            return sorted((d, i) for i, d in enumerate(distances) if not math.isnan(d))[:args.k]
+
+        def vectorized_nearest(sellers):
+            return nearest_indices(distances_to_target(sellers, TARGET_LATITUDE, TARGET_LONGITUDE), args.k)
+
+        expected, loop_seconds = timed(loop_nearest)
+        from_dicts, dict_seconds = timed(vectorized_nearest, sellers_info)
+        from_batch, batch_seconds = timed(vectorized_nearest, batch)
+        assert [i for _, i in expected] == list(from_dicts) == list(from_batch)
+        print(f"{count:>8}  {loop_seconds * 1000:>8.1f}ms  {dict_seconds * 1000:>8.1f}ms  {batch_seconds * 1000:>8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_sellers_info
+from seller_export import EXPORT_FORMATS, export_sellers, load_sellers
+
+def directory_bytes(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sellers as columnar tables and time the reload against JSON")
+    parser.add_argument('--count', type=int, nargs='+', default=[10000, 100000], help="sellers (100 to 100000)")
+    parser.add_argument('--formats', nargs='+', default=list(EXPORT_FORMATS), choices=list(EXPORT_FORMATS))
+    args = parser.parse_args(argv)
+
+    # Import pyarrow once up front, so the load times below are the files, not the import
+    try:
+        started = time.perf_counter()
+        import pyarrow.parquet  # noqa: F401
+        print(f"pyarrow import: {(time.perf_counter() - started) * 1000:.0f} ms")
+    except ImportError:
+        args.formats = [format for format in args.formats if format == 'csv']
+        print("pyarrow is not installed, only CSV is measured")
+
+    print(f"{'sellers':>8}  {'format':>8}  {'size':>8}  {'export':>8}  {'load':>9}  {'+records':>9}")
+    for count in args.count:
+        sellers_info = generate_sellers_info(count)
+        with tempfile.TemporaryDirectory() as directory:
+            # The cached form: one JSON document parsed in full on every load
+            path = os.path.join(directory, 'sellers.json')
+            started = time.perf_counter()
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(sellers_info, f, ensure_ascii=False)
+            written = time.perf_counter() - started
+            started = time.perf_counter()
+            with open(path, encoding='utf-8') as f:
+                json.load(f)
+            loaded = time.perf_counter() - started
+            print(f"{count:>8}  {'json':>8}  {os.path.getsize(path) / 2**20:>6.1f}MB  {written:>7.2f}s"
+                  f"  {loaded * 1000:>7.1f}ms  {'':>9}")
+
+            for format in args.formats:
+                export_dir = os.path.join(directory, format)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    export_sellers(sellers_info, export_dir, format)
+                    written = time.perf_counter() - started
+                    started = time.perf_counter()
+                    batch = load_sellers(export_dir)
+                    loaded = time.perf_counter() - started
+                    started = time.perf_counter()
+                    batch.records
+                    built = time.perf_counter() - started
+                print(f"{count:>8}  {format:>8}  {directory_bytes(export_dir) / 2**20:>6.1f}MB  {written:>7.2f}s"
+                      f"  {loaded * 1000:>7.1f}ms  {built:>8.2f}s")
+
+if __name__ == "__main__":
+    main()
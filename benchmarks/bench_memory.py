@@ -0,0 +1,36 @@
+import argparse
+import gc
+import tracemalloc
+
+from benchmarks.synthetic import generate_sellers_info
+from seller_record import SellerBatch, SellerRecord
+
+def measure(build):
+    """Return (result, bytes allocated by build()) measured with tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare memory of seller dicts, SellerRecord and SellerBatch")
+    parser.add_argument('--count', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args(argv)
+
+    # Each form is built from freshly generated sellers and only what it retains is counted
+    generate_sellers_info(100)
+    print(f"{'sellers':>8}  {'dicts':>10}  {'records':>10}  {'batch':>10}  {'saved':>6}")
+    for count in args.count:
+        sellers_info, dict_bytes = measure(lambda: generate_sellers_info(count))
+        del sellers_info
+        records, record_bytes = measure(lambda: [SellerRecord(seller) for seller in generate_sellers_info(count)])
+        del records
+        batch, batch_bytes = measure(lambda: SellerBatch(generate_sellers_info(count)))
+        del batch
+        print(f"{count:>8}  {dict_bytes / 2**20:>8.1f}MB  {record_bytes / 2**20:>8.1f}MB  "
+              f"{batch_bytes / 2**20:>8.1f}MB  {1 - batch_bytes / dict_bytes:>5.0%}")
+
+if __name__ == "__main__":
+    main()
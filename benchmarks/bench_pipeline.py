@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.mock_api import start_mock_api
+
+# Stored results the runs are compared against, written with --save-baseline
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Slower or bigger than the baseline by more than this share counts as a regression,
+# time differences under MIN_TIME_DELTA seconds are noise
+TIME_TOLERANCE = 0.25
+RSS_TOLERANCE = 0.15
+MIN_TIME_DELTA = 0.05
+
+STAGES = ('call_api', 'create_map', 'save_map')
+
+TARGET_LATITUDE = 14.4428927
+TARGET_LONGITUDE = 101.3728028
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / 2**20 if sys.platform == 'darwin' else peak / 1024, 1)
+
+def run_pipeline(api_url, count, settings, results):
+    """
+    Fetch, render and save one map in a fresh process, with a fresh cache.
+
+    Peak RSS only grows, so each stage reports the peak of the run up to
+    the end of that stage.
+    """
+    import fetch_data
+    from run_maps import create_sellers_map_with_target, save_and_open_map
+
+    with tempfile.TemporaryDirectory() as directory:
+        fetch_data.CACHE_FILE = os.path.join(directory, 'api_cache.sqlite')
+        stages = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            _, pagination, sellers_info = fetch_data.call_api(
+                business_types=['500040001'],
+                limit=settings['page_size'],
+                api_url=api_url,
+                api_token='benchmark',
+                business_category='accommodation',
+                max_workers=settings['workers'],
+                requests_per_second=None
+            )
+            stages['call_api'] = {
+                'seconds': round(time.perf_counter() - started, 4),
+                'peak_rss_mb': peak_rss_mb(),
+                # The SQLite file plus its write-ahead log
+                'output_bytes': sum(
+                    os.path.getsize(os.path.join(directory, name))
+                    for name in os.listdir(directory) if name.startswith('api_cache.sqlite')
+                )
+            }
+            if not sellers_info or len(sellers_info) != count:
+                results.put({'error': f"fetched {len(sellers_info or [])} of {count} sellers ({pagination})"})
+                return
+
+            started = time.perf_counter()
+            google_map = create_sellers_map_with_target(
+                sellers_info, TARGET_LATITUDE, TARGET_LONGITUDE,
+                render_mode=settings['render_mode'], lazy_popups=settings['lazy_popups']
+            )
+            stages['create_map'] = {'seconds': round(time.perf_counter() - started, 4), 'peak_rss_mb': peak_rss_mb()}
+
+            path = os.path.join(directory, 'map.html')
+            started = time.perf_counter()
+            save_and_open_map(google_map, path, open_browser=False)
+            stages['save_map'] = {
+                'seconds': round(time.perf_counter() - started, 4),
+                'peak_rss_mb': peak_rss_mb(),
+                'output_bytes': os.path.getsize(path)
+            }
+    results.put(stages)
+
+def measure(count, settings):
+    """
+    Run the pipeline for count sellers against a mock API, each in its own process.
+
+    Returns:
+        tuple: (stage results or {'error': message}, mock API request counters)
+    """
+    mock, api_url, stats_url = start_mock_api(
+        count=count, latency=settings['latency'], error_rate=settings['error_rate'],
+        throttle_rate=settings['throttle_rate'], page_size=settings['page_size']
+    )
+    try:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_pipeline, args=(api_url, count, settings, results))
+        process.start()
+        stages = results.get()
+        process.join()
+        with urllib.request.urlopen(stats_url) as response:
+            mock_stats = json.load(response)
+    finally:
+        mock.terminate()
+        mock.join()
+    return stages, mock_stats
+
+def median_stages(runs):
+    """Per-stage medians of repeated runs, one noisy run does not decide the result."""
+    return {
+        stage: {key: round(statistics.median(run[stage][key] for run in runs), 4) for key in runs[0][stage]}
+        for stage in STAGES
+    }
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def compare(value, base, tolerance, min_delta=0.0):
+    """Change against the baseline as text, and whether it is a regression."""
+    if base is None:
+        return '', False
+    change = (value - base) / base if base else 0.0
+    return f"{change:+.0%}", change > tolerance and value - base > min_delta
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time fetch -> render -> save against a local mock sellers API")
+    parser.add_argument('--count', type=int, nargs='+', default=[1000, 10000], help="sellers (100 to 100000)")
+    parser.add_argument('--latency', type=float, default=0.02, help="mock API seconds per request")
+    parser.add_argument('--page-size', type=int, default=100, help="sellers per page")
+    parser.add_argument('--workers', type=int, default=4, help="page requests in flight")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of HTTP 500 answers")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of HTTP 429 answers")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per size, the median is reported")
+    parser.add_argument('--mode', default='cluster', help="render mode")
+    parser.add_argument('--lazy', action='store_true', help="lazy popups")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 on a regression against the baseline")
+    args = parser.parse_args(argv)
+
+    settings = {
+        'latency': args.latency, 'page_size': args.page_size, 'workers': args.workers, 'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate, 'render_mode': args.mode, 'lazy_popups': args.lazy
+    }
+    baseline = None if args.save_baseline else load_baseline(args.baseline)
+    if baseline and baseline['settings'] != settings:
+        print(f"⚠️ Baseline {args.baseline} was recorded with other settings, not comparing: {baseline['settings']}")
+        baseline = None
+
+    print(f"{'sellers':>8}  {'stage':>10}  {'time':>9}  {'Δ':>5}  {'peak RSS':>9}  {'Δ':>5}  {'output':>9}")
+    results = {}
+    regressions = []
+    for count in args.count:
+        runs = [measure(count, settings) for _ in range(max(1, args.repeat))]
+        failed = [stages['error'] for stages, _ in runs if 'error' in stages]
+        if failed:
+            print(f"{count:>8}  ❌ {failed[0]}")
+            regressions.append(f"{count} sellers: {failed[0]}")
+            continue
+        stages = median_stages([stages for stages, _ in runs])
+        mock_stats = runs[-1][1]
+        results[str(count)] = stages
+        base_stages = (baseline or {}).get('results', {}).get(str(count), {})
+        for stage in STAGES:
+            result = stages[stage]
+            base = base_stages.get(stage, {})
+            time_change, slower = compare(result['seconds'], base.get('seconds'), TIME_TOLERANCE, MIN_TIME_DELTA)
+            rss_change, bigger = compare(result['peak_rss_mb'], base.get('peak_rss_mb'), RSS_TOLERANCE)
+            output = f"{result['output_bytes'] / 2**20:.1f}MB" if 'output_bytes' in result else ''
+            print(f"{count:>8}  {stage:>10}  {result['seconds']:>8.2f}s  {time_change:>5}"
+                  f"  {result['peak_rss_mb']:>7.0f}MB  {rss_change:>5}  {output:>9}")
+            if slower:
+                regressions.append(f"{count} sellers {stage}: {time_change} time")
+            if bigger:
+                regressions.append(f"{count} sellers {stage}: {rss_change} peak RSS")
+        print(f"{'':>8}  mock API: {mock_stats['requests']} requests, {mock_stats['errors']} errors,"
+              f" {mock_stats['throttled']} throttled")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"⚠️ {len(regressions)} regression(s) beyond {TIME_TOLERANCE:.0%} time / {RSS_TOLERANCE:.0%} RSS:")
+        for regression in regressions:
+            print(f"  {regression}")
+    if args.check and regressions:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_sellers_info
+from run_maps import RENDER_MODES, create_sellers_map_with_target
+
+TARGET_LATITUDE = 14.4428927
+TARGET_LONGITUDE = 101.3728028
+
+def render(sellers_info, render_mode, path, lazy_popups=False):
+    """Build the map and write it to path, returns seconds taken (map building plus HTML rendering)."""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        google_map = create_sellers_map_with_target(
+            sellers_info, TARGET_LATITUDE, TARGET_LONGITUDE, render_mode=render_mode, lazy_popups=lazy_popups
+        )
+        google_map.save(path)
+    return time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare map render time and HTML size per render mode")
+    parser.add_argument('--count', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--mode', nargs='+', choices=RENDER_MODES, default=list(RENDER_MODES))
+    parser.add_argument('--max-markers', type=int, default=10000,
+                        help="skip the per-marker mode above this many sellers (it needs several GB at 50k)")
+    parser.add_argument('--lazy', action='store_true', help="also render every mode with lazy popups")
+    args = parser.parse_args(argv)
+
+    variants = [(mode, False) for mode in args.mode] + ([(mode, True) for mode in args.mode] if args.lazy else [])
+    print(f"{'sellers':>8}  {'mode':>13}  {'time':>9}  {'size':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.count:
+            sellers_info = generate_sellers_info(count)
+            for render_mode, lazy_popups in variants:
+                label = f"{render_mode}+lazy" if lazy_popups else render_mode
+                if render_mode == 'markers' and not lazy_popups and count > args.max_markers:
+                    print(f"{count:>8}  {label:>13}  {'skipped':>9}  (--max-markers {args.max_markers})")
+                    continue
+                path = os.path.join(directory, f"{label}_{count}.html")
+                seconds = render(sellers_info, render_mode, path, lazy_popups)
+                print(f"{count:>8}  {label:>13}  {seconds:>8.2f}s  {os.path.getsize(path) / 2**20:>8.1f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_api import start_mock_api
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The fetch command as main.py ran it before the CLI: the map code (folium, NumPy) imported up front
+EAGER_FETCH = "import sys, run_maps, cli; sys.exit(cli.main(sys.argv[1:]))"
+
+def run(command, directory, env):
+    """Wall time of one process, from spawn to exit."""
+    started = time.perf_counter()
+    subprocess.run(command, cwd=directory, env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start time of `cli.py fetch` with and without the map imports")
+    parser.add_argument('--count', type=int, default=200, help="sellers behind the mock API")
+    parser.add_argument('--repeat', type=int, default=7, help="runs per variant, the median is reported")
+    args = parser.parse_args(argv)
+
+    mock, api_url, _ = start_mock_api(count=args.count, latency=0.0, page_size=100)
+    env = dict(os.environ, API_TOKEN='benchmark', PYTHONPATH=ROOT)
+    fetch = ['fetch', '--api-url', api_url, '--provinces', 'นครนายก']
+    variants = {
+        'interpreter only': [sys.executable, '-c', 'pass'],
+        'eager imports': [sys.executable, '-c', EAGER_FETCH] + fetch,
+        'cli.py fetch': [sys.executable, os.path.join(ROOT, 'cli.py')] + fetch,
+        'cli.py stats': [sys.executable, os.path.join(ROOT, 'cli.py'), 'stats']
+    }
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            # Fill the cache once, so the timed runs measure start-up and the cache read, not the API
+            run(variants['cli.py fetch'], directory, env)
+            print(f"{'variant':>20}  {'median':>8}  {'min':>8}")
+            for label, command in variants.items():
+                times = [run(command, directory, env) for _ in range(args.repeat)]
+                print(f"{label:>20}  {statistics.median(times) * 1000:>6.0f}ms  {min(times) * 1000:>6.0f}ms")
+    finally:
+        mock.terminate()
+        mock.join()
+
+if __name__ == "__main__":
+    main()
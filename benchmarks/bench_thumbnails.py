@@ -0,0 +1,121 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from PIL import Image
+
+from benchmarks.synthetic import IMAGE_HOST, generate_sellers_info
+from thumbnails import collect_image_jobs, prepare_thumbnails
+
+# Size of the stand-in images, about what sellers upload from a phone
+IMAGE_SIZE = (1600, 1200)
+
+def make_image(seed):
+    """A JPEG of IMAGE_SIZE with some noise, so it does not compress to nothing."""
+    rng = random.Random(seed)
+    image = Image.new('RGB', IMAGE_SIZE, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    noise = Image.effect_noise((IMAGE_SIZE[0] // 8, IMAGE_SIZE[1] // 8), 64).convert('RGB').resize(IMAGE_SIZE)
+    image = Image.blend(image, noise, 0.3)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=85)
+    return output.getvalue()
+
+class ImageServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the image CDN.
+
+    Every path gets one of a few pre-encoded JPEGs, except a share of paths
+    that answer 404 like deleted images do. Requests are counted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, broken_ratio=0.05, latency=0.02, variants=8):
+        super().__init__(('127.0.0.1', 0), ImageHandler)
+        self.images = [make_image(seed) for seed in range(variants)]
+        self.broken_ratio = broken_ratio
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.latency)
+        rng = random.Random(self.path)
+        if rng.random() < server.broken_ratio:
+            self.send_error(404)
+            return
+        body = server.images[rng.randrange(len(server.images))]
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def point_images_at(sellers_info, base_url):
+    """Rewrite the synthetic image URLs to the local server."""
+    def local(url):
+        return base_url + urlsplit(url).path if url.startswith(IMAGE_HOST) else url
+    for seller in sellers_info:
+        seller['images'] = [local(url) for url in seller['images']]
+        for room in seller['rooms']:
+            room['images'] = [local(url) for url in room.get('images') or []]
+
+def run(sellers_info, directory, server, **kwargs):
+    """Prepare thumbnails once, returns (seconds, requests made, thumbnails)."""
+    requests_before = server.requests
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        thumbnails = prepare_thumbnails(sellers_info, directory, **kwargs)
+    return time.perf_counter() - started, server.requests - requests_before, thumbnails
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time cold and warm thumbnail runs against a local image server")
+    parser.add_argument('--count', type=int, default=200, help="sellers")
+    parser.add_argument('--workers', type=int, default=8, help="download workers")
+    parser.add_argument('--processes', type=int, default=None, help="thumbnail processes")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per image request")
+    parser.add_argument('--broken', type=float, default=0.05, help="share of images that answer 404")
+    args = parser.parse_args(argv)
+
+    server = ImageServer(args.broken, args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sellers_info = generate_sellers_info(args.count)
+    point_images_at(sellers_info, server.base_url)
+    images = len(collect_image_jobs(sellers_info))
+
+    print(f"{args.count} sellers, {images} popup images, {args.workers} download workers")
+    print(f"{'run':>6}  {'time':>9}  {'requests':>9}  {'thumbnails':>10}  {'broken':>7}  {'cache':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label in ('cold', 'warm'):
+            seconds, requests, thumbnails = run(
+                sellers_info, directory, server, download_workers=args.workers, processes=args.processes
+            )
+            sources = [src for kind in thumbnails.values() for src in kind.values()]
+            broken = sum(1 for src in sources if src is None)
+            cache_bytes = sum(
+                os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names
+            )
+            print(f"{label:>6}  {seconds:>8.2f}s  {requests:>9}  {len(sources):>10}  {broken:>7}"
+                  f"  {cache_bytes / 2**20:>7.1f}MB")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import contextlib
+import io
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from benchmarks.synthetic import generate_sellers_info
+from tile_cache import TileCache, TileProxy, prewarm_sellers, tiles_in_bbox
+
+# Stand-in tiles, about the size of real street tiles
+TILE_BYTES = 20 * 1024
+
+class TileSourceServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Google tile servers.
+
+    Answers /vt?lyrs=<layer>&x=&y=&z= with a PNG-looking body of TILE_BYTES
+    after a fixed latency. Requests are counted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.03):
+        super().__init__(('127.0.0.1', 0), TileSourceHandler)
+        self.latency = latency
+        self.body = b'\x89PNG\r\n\x1a\n' + bytes(random.Random(0).getrandbits(8) for _ in range(TILE_BYTES - 8))
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def source_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/vt?lyrs={{layer}}&x={{x}}&y={{y}}&z={{z}}"
+
+class TileSourceHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.latency)
+        query = parse_qs(urlsplit(self.path).query)
+        if not all(key in query for key in ('lyrs', 'x', 'y', 'z')):
+            self.send_error(400)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+def view(proxy_url, tiles, workers=6):
+    """Load a map view's tiles through the proxy like a browser does (6 connections), returns seconds."""
+    session = requests.Session()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for response in executor.map(lambda tile: session.get(f"{proxy_url}/tiles/m/{tile[2]}/{tile[0]}/{tile[1]}"), tiles):
+            response.raise_for_status()
+    session.close()
+    return time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time map views through the tile proxy against a local tile source")
+    parser.add_argument('--latency', type=float, default=0.03, help="seconds per upstream tile request")
+    parser.add_argument('--zoom', type=int, default=12, help="zoom of the viewed tiles")
+    parser.add_argument('--views', type=int, default=3, help="repeat views after the first")
+    args = parser.parse_args(argv)
+
+    source = TileSourceServer(args.latency)
+    threading.Thread(target=source.serve_forever, daemon=True).start()
+    sellers_info = generate_sellers_info(500)
+
+    # One screen of tiles (about 1600x1000 px) around the first seller
+    location = sellers_info[0]['location']
+    tiles = [
+        (x, y, args.zoom)
+        for x, y in tiles_in_bbox(location['latitude'] - 0.1, location['longitude'] - 0.2,
+                                  location['latitude'] + 0.1, location['longitude'] + 0.2, args.zoom)
+    ]
+
+    print(f"{len(tiles)} tiles per view at zoom {args.zoom}, {args.latency * 1000:.0f} ms upstream latency")
+    print(f"{'run':>8}  {'time':>8}  {'upstream':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TileCache(directory, source_url=source.source_url)
+        proxy = TileProxy(('127.0.0.1', 0), cache)
+        threading.Thread(target=proxy.serve_forever, daemon=True).start()
+
+        for label in ['cold'] + [f'repeat {n}' for n in range(1, args.views + 1)]:
+            before = source.requests
+            seconds = view(proxy.url, tiles)
+            print(f"{label:>8}  {seconds * 1000:>6.0f}ms  {source.requests - before:>8}")
+
+        before = source.requests
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            counts = prewarm_sellers(cache, sellers_info, (8, 11), layers=('m',))
+        print(f"pre-warm zooms 8-11 around {len(sellers_info)} sellers: {counts['fetched']} tiles fetched"
+              f" ({source.requests - before} upstream) in {time.perf_counter() - started:.2f}s")
+
+        # Eviction: cap the cache below its size and add one more tile
+        cache.max_bytes = cache.bytes // 2
+        started = time.perf_counter()
+        cache.get('m', 1, 0, 0)
+        print(f"eviction to {cache.max_bytes / 2**20:.1f} MB cap: {cache.bytes / 2**20:.1f} MB left"
+              f" in {time.perf_counter() - started:.2f}s")
+
+        proxy.shutdown()
+        cache.close()
+    source.shutdown()
+
+if __name__ == "__main__":
+    main()
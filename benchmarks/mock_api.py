@@ -0,0 +1,175 @@
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import generate_api_sellers
+
+# Largest page the mock hands out, whatever limit the client asks for
+MAX_PAGE_SIZE = 100
+
+class MockSellersApi(ThreadingHTTPServer):
+    """
+    Local stand-in for the sellers endpoint.
+
+    Answers POSTs with a JSON body {"page": n, "limit": size, ...} in the
+    real API's shape ({"success": true, "data": {"data": [...], "totalPages",
+    "totalItems"}}) from a fixed set of synthetic sellers. The filters in the
+    body are ignored, every query sees the same sellers. Failures are drawn
+    from a seeded generator, so a run with the same settings sees the same
+    sequence of errors.
+
+    Args:
+        count (int): Sellers behind the endpoint
+        latency (float): Seconds before each answer
+        error_rate (float): Share of requests answered with HTTP 500
+        throttle_rate (float): Share of requests answered with HTTP 429 and a Retry-After header
+        retry_after (float): Retry-After seconds sent with the 429s
+        page_size (int): Page size used when the request has no limit (capped at MAX_PAGE_SIZE)
+        seed (int): Seed of the sellers and the failures
+        port (int): Port to listen on (0 picks a free port)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, count=1000, latency=0.05, error_rate=0.0, throttle_rate=0.0, retry_after=0.1,
+                 page_size=20, seed=0, port=0):
+        super().__init__(('127.0.0.1', port), MockSellersHandler)
+        self.sellers = generate_api_sellers(count, seed=seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'pages': 0, 'errors': 0, 'throttled': 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/mobile/buyer/booking/sellers"
+
+    @property
+    def stats_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/stats"
+
+    def draw(self):
+        """Decide the fate of one request: 'error', 'throttle' or 'ok'."""
+        with self.lock:
+            self.stats['requests'] += 1
+            roll = self.rng.random()
+        if roll < self.error_rate:
+            return 'error'
+        if roll < self.error_rate + self.throttle_rate:
+            return 'throttle'
+        return 'ok'
+
+    def page(self, page, limit):
+        limit = max(1, min(limit or self.page_size, MAX_PAGE_SIZE))
+        total_pages = max(1, -(-len(self.sellers) // limit))
+        return {
+            'success': True,
+            'data': {
+                'data': self.sellers[(page - 1) * limit:page * limit],
+                'page': page,
+                'totalPages': total_pages,
+                'totalItems': len(self.sellers)
+            }
+        }
+
+class MockSellersHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Request counters, for benchmarks running the mock in another process
+        if self.path == '/stats':
+            with self.server.lock:
+                stats = dict(self.server.stats)
+            self.send_json(200, stats)
+        else:
+            self.send_json(404, {'success': False, 'message': 'not found'})
+
+    def do_POST(self):
+        server = self.server
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            page = int(body.get('page', 1))
+        except (ValueError, TypeError):
+            self.send_json(400, {'success': False, 'message': 'invalid body'})
+            return
+
+        time.sleep(server.latency)
+        fate = server.draw()
+        if fate == 'error':
+            with server.lock:
+                server.stats['errors'] += 1
+            self.send_json(500, {'success': False, 'message': 'internal error'})
+        elif fate == 'throttle':
+            with server.lock:
+                server.stats['throttled'] += 1
+            self.send_json(429, {'success': False, 'message': 'too many requests'},
+                           {'Retry-After': f"{server.retry_after:g}"})
+        else:
+            with server.lock:
+                server.stats['pages'] += 1
+            self.send_json(200, server.page(page, body.get('limit')))
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def _serve(options, ready):
+    server = MockSellersApi(**options)
+    ready.put((server.url, server.stats_url))
+    server.serve_forever()
+
+def start_mock_api(**options):
+    """
+    Run a MockSellersApi in a separate process, so it takes no CPU time or memory from the process measured.
+
+    Args:
+        **options: MockSellersApi arguments
+
+    Returns:
+        tuple: (process, endpoint URL, request counters URL), terminate the process when done
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(options, ready), daemon=True)
+    process.start()
+    return (process, *ready.get())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the sellers API (point API_URL at it)")
+    parser.add_argument('--count', type=int, default=1000, help="sellers")
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per request")
+    parser.add_argument('--page-size', type=int, default=20, help="page size when the request has no limit")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of HTTP 500 answers")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of HTTP 429 answers")
+    parser.add_argument('--retry-after', type=float, default=0.1, help="Retry-After seconds of the 429s")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = MockSellersApi(args.count, args.latency, args.error_rate, args.throttle_rate, args.retry_after,
+                            args.page_size, args.seed, args.port)
+    print(f"Mock sellers API with {args.count} sellers at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(f"{server.stats}")
+
+if __name__ == "__main__":
+    main()
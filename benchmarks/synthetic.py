@@ -0,0 +1,111 @@
+import random
+import uuid
+
+# Provinces and districts the real queries cover, with a rough centre for each province
+PROVINCES = {
+    "นครราชสีมา": ((14.97, 102.10), ["เมืองนครราชสีมา", "ปากช่อง", "วังน้ำเขียว", "สีคิ้ว", "ปักธงชัย"]),
+    "นครนายก": ((14.20, 101.21), ["เมืองนครนายก", "บ้านนา", "องครักษ์", "ปากพลี"]),
+    "ปราจีนบุรี": ((14.05, 101.37), ["เมืองปราจีนบุรี", "กบินทร์บุรี", "นาดี", "ศรีมหาโพธิ"]),
+}
+
+ROOM_NAMES = ["Deluxe room", "Superior room", "เตียงเดี่ยว", "เตียงคู่", "Family room", "Triple deluxe", "Bungalow"]
+IMAGE_HOST = "https://d1ul5b6o47o6vl.cloudfront.net"
+
+def _image_urls(rng, owner, folder, count):
+    return [f"{IMAGE_HOST}/{owner}/branch_001/{folder}/{uuid.UUID(int=rng.getrandbits(128))}.jpg" for _ in range(count)]
+
+def generate_api_seller(rng, seller_id, restaurant=False):
+    """
+    Build one seller in the shape the sellers API returns.
+
+    Args:
+        rng (random.Random): Random source
+        seller_id (int): Seller branch id
+        restaurant (bool): Build a restaurant (no rooms) instead of an accommodation
+
+    Returns:
+        dict: Raw API seller
+    """
+    province = rng.choice(list(PROVINCES))
+    (center_lat, center_lon), districts = PROVINCES[province]
+    owner = str(uuid.UUID(int=rng.getrandbits(128)))
+    rooms = []
+    if not restaurant:
+        for room_number in range(rng.choice([0, 1, 2, 3, 3, 3])):
+            rooms.append({
+                "id": seller_id * 10 + room_number,
+                "sellerBranchId": seller_id,
+                "name": rng.choice(ROOM_NAMES),
+                "numberOfRoom": rng.randint(1, 40),
+                "price": str(rng.choice([450, 590, 750, 890, 990, 1200, 1500, 2500])),
+                "images": _image_urls(rng, owner, f"img_room_{room_number + 1:03d}", rng.randint(0, 5))
+            })
+    return {
+        "id": seller_id,
+        "branchNo": 1,
+        "sellerId": 30000 + seller_id,
+        "nameTh": f"{'ร้านอาหาร' if restaurant else 'โรงแรม'}ทดสอบ {seller_id}",
+        "nameEn": f"Test {'Restaurant' if restaurant else 'Hotel'} {seller_id}",
+        "numberOfEmployee": 0,
+        "numberOfRoom": sum(room["numberOfRoom"] for room in rooms),
+        "addressNo": f"{rng.randint(1, 999)}/{rng.randint(1, 9)}",
+        "moo": str(rng.choice(["", 1, 2, 3, 4, 5, 6, 7, 8, 9])),
+        "village": "",
+        "trok": "",
+        "road": "",
+        "district": rng.choice(districts),
+        "subDistrict": rng.choice(districts),
+        "province": province,
+        "postalCode": str(rng.choice([30000, 30130, 26000, 25000, 25110])),
+        "location": {
+            "type": "Point",
+            "coordinates": [
+                round(center_lon + rng.gauss(0, 0.35), 6),
+                round(center_lat + rng.gauss(0, 0.35), 6)
+            ]
+        },
+        "contactMobilePhoneNo": f"0{rng.randint(600000000, 999999999)}",
+        "contactEmail": f"seller{seller_id}@example.com",
+        "contactAdditionalChannel": "",
+        "bizContactWebsite": rng.choice(["", f"www.seller{seller_id}.example.com"]),
+        "bizContactFacebook": rng.choice(["", f"seller{seller_id}"]),
+        "bizContactInstagram": rng.choice(["", "", f"seller_{seller_id}"]),
+        "bizContactLine": rng.choice(["", f"@seller{seller_id}"]),
+        "maximumDailyIncome": "0",
+        "regionScope": "ภาคตะวันออกเฉียงเหนือ",
+        "description": None,
+        "images": _image_urls(rng, owner, "img_enterprise", rng.choice([0, 2, 4, 6, 8, 10, 10, 10, 20])),
+        "rooms": rooms
+    }
+
+def generate_api_sellers(count, seed=0, restaurant_ratio=0.3, start_id=1):
+    """
+    Generate raw API sellers, deterministic for a given seed.
+
+    Args:
+        count (int): Number of sellers
+        seed (int): Random seed (default: 0)
+        restaurant_ratio (float): Share of restaurants (default: 0.3)
+        start_id (int): First seller id (default: 1)
+
+    Returns:
+        list: Raw API seller dictionaries
+    """
+    rng = random.Random(seed)
+    return [
+        generate_api_seller(rng, start_id + i, restaurant=rng.random() < restaurant_ratio)
+        for i in range(count)
+    ]
+
+def generate_sellers_info(count, seed=0, restaurant_ratio=0.3):
+    """
+    Generate sellers normalized the way call_api returns them.
+
+    Returns:
+        list: seller_info dictionaries with business_category and contact_urls
+    """
+    from fetch_data import parse_seller
+    return [
+        parse_seller(seller, 'restaurant' if not seller['rooms'] and seller['nameEn'].startswith('Test Restaurant') else 'accommodation')
+        for seller in generate_api_sellers(count, seed=seed, restaurant_ratio=restaurant_ratio)
+    ]
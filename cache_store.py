@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+
+# SQLite file holding one row per cache key, replaces the monolithic api_cache.json
+CACHE_DB = 'api_cache.sqlite'
+LEGACY_CACHE_FILE = 'api_cache.json'
+
+# Size cap for all entries together, least recently used entries are evicted past it
+MAX_CACHE_BYTES = 500 * 1024 * 1024
+
+# Default time-to-live for new entries in seconds (None = never expire)
+DEFAULT_TTL = None
+
+# size sits before value so reading it never touches the value's overflow pages. The running total
+# lives in meta and is kept by triggers, inside the same transaction as every INSERT/REPLACE/DELETE.
+_SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at REAL,
+    value BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at, size);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('bytes', (SELECT COALESCE(SUM(size), 0) FROM entries));
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+BEGIN UPDATE meta SET value = value + NEW.size WHERE name = 'bytes'; END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+BEGIN UPDATE meta SET value = value - OLD.size WHERE name = 'bytes'; END;
+COMMIT;
+"""
+
+class CacheStore:
+    """
+    Key/value cache stored in SQLite, one row per entry.
+
+    A lookup reads only the requested row and a write touches only that row
+    and the running size total, so cost no longer grows with the number of
+    cached queries. Values are any JSON-serializable object.
+
+    Args:
+        path (str): SQLite database file (default: api_cache.sqlite)
+        max_bytes (int): Size cap for all values, LRU entries are evicted past it (None disables)
+        default_ttl (float): Default time-to-live in seconds for new entries (None = never expire)
+        read_only (bool): Open an existing database for reading only, without creating or migrating it
+
+    Raises:
+        sqlite3.OperationalError: With read_only, if the database does not exist
+    """
+
+    def __init__(self, path=CACHE_DB, max_bytes=MAX_CACHE_BYTES, default_ttl=DEFAULT_TTL, read_only=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        if read_only:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            return
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Makes INSERT OR REPLACE fire the delete trigger for the row it replaces
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return default
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value under key.
+
+        Args:
+            key (str): Cache key
+            value: JSON-serializable value
+            ttl (float): Time-to-live in seconds (default: the store's default_ttl)
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now, expires_at)
+            )
+            over = self.max_bytes and self._total_bytes() > self.max_bytes
+        if over:
+            self.evict(self.max_bytes)
+
+    def delete(self, key):
+        """Remove key, returns True if it existed."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount > 0
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def keys(self, prefix=None):
+        """Return all keys, optionally only those starting with prefix."""
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM entries WHERE substr(key, 1, ?) = ? ORDER BY key", (len(prefix), prefix)
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM entries ORDER BY key").fetchall()
+        return [row[0] for row in rows]
+
+    def entries(self):
+        """Return metadata (key, size, created_at, accessed_at, expires_at) for every entry, newest access first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, size, created_at, accessed_at, expires_at FROM entries ORDER BY accessed_at DESC"
+            ).fetchall()
+        return [
+            {'key': key, 'size': size, 'created_at': created_at, 'accessed_at': accessed_at, 'expires_at': expires_at}
+            for key, size, created_at, accessed_at, expires_at in rows
+        ]
+
+    def _total_bytes(self):
+        try:
+            return self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        except sqlite3.OperationalError:
+            # A database from before the running total, opened read-only so it was not migrated
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self):
+        """Return entry count, total value bytes and the number of expired entries."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self._total_bytes()
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).fetchone()[0]
+        return {'path': self.path, 'entries': count, 'bytes': total, 'expired': expired, 'max_bytes': self.max_bytes}
+
+    def prune_expired(self):
+        """Delete expired entries, returns the number removed."""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def evict(self, max_bytes):
+        """Delete least recently used entries until the total size is at most max_bytes, returns the number removed."""
+        with self._lock:
+            excess = self._total_bytes() - max_bytes
+            if excess <= 0:
+                return 0
+            # Walks the (accessed_at, size) index only, oldest first, until enough bytes are found
+            victims = []
+            for rowid, size in self._conn.execute("SELECT rowid, size FROM entries ORDER BY accessed_at ASC"):
+                victims.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM entries WHERE rowid = ?", victims)
+            except BaseException:
+                # Leave the shared connection out of the transaction, later writes must not join it
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return len(victims)
+
+    def clear(self):
+        """Delete every entry, returns the number removed."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM entries").rowcount
+
+    def vacuum(self):
+        """Give space freed by deleted entries back to the filesystem."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def import_json(self, path=LEGACY_CACHE_FILE):
+        """
+        Import every entry of a legacy api_cache.json file.
+
+        Args:
+            path (str): JSON cache file mapping keys to values
+
+        Returns:
+            int: Number of entries imported
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+        for key, value in legacy.items():
+            self.set(key, value)
+        return len(legacy)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_cache(path=CACHE_DB, max_bytes=MAX_CACHE_BYTES, default_ttl=DEFAULT_TTL, legacy_file=LEGACY_CACHE_FILE):
+    """
+    Open the cache store, importing the legacy JSON cache the first time the database is created.
+
+    Args:
+        path (str): SQLite database file
+        max_bytes (int): Size cap for all values (None disables)
+        default_ttl (float): Default time-to-live in seconds (None = never expire)
+        legacy_file (str): Legacy api_cache.json to import when the database does not exist yet
+
+    Returns:
+        CacheStore: Opened store
+    """
+    is_new = not os.path.exists(path)
+    store = CacheStore(path, max_bytes=max_bytes, default_ttl=default_ttl)
+    if is_new and legacy_file and os.path.exists(legacy_file):
+        try:
+            imported = store.import_json(legacy_file)
+            print(f"[CACHE] Imported {imported} entries from {legacy_file} into {path}")
+        except (OSError, ValueError) as e:
+            print(f"[CACHE] Could not import {legacy_file}: {e}")
+    return store
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) if timestamp else '-'
+
+def main(argv=None):
+    """Command line interface to inspect and prune the cache."""
+    parser = argparse.ArgumentParser(description="Inspect and prune the API cache")
+    parser.add_argument('--db', default=CACHE_DB, help=f"cache database (default: {CACHE_DB})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="show entry count and size")
+    commands.add_parser('list', help="list entries, most recently used first")
+    show = commands.add_parser('show', help="print one entry as JSON")
+    show.add_argument('key')
+    delete = commands.add_parser('delete', help="delete entries")
+    delete.add_argument('keys', nargs='+')
+    prune = commands.add_parser('prune', help="delete expired entries and evict LRU entries over a size cap")
+    prune.add_argument('--max-mb', type=float, help="evict least recently used entries until the cache fits")
+    commands.add_parser('clear', help="delete every entry")
+    import_json = commands.add_parser('import-json', help="import a legacy api_cache.json file")
+    import_json.add_argument('path', nargs='?', default=LEGACY_CACHE_FILE)
+    args = parser.parse_args(argv)
+
+    store = CacheStore(args.db, max_bytes=None)
+    try:
+        if args.command == 'stats':
+            stats = store.stats()
+            print(f"Cache: {stats['path']}")
+            print(f"Entries: {stats['entries']} ({stats['expired']} expired)")
+            print(f"Size: {_format_bytes(stats['bytes'])}")
+        elif args.command == 'list':
+            for entry in store.entries():
+                print(f"{entry['key']}  {_format_bytes(entry['size']):>10}  "
+                      f"used {_format_time(entry['accessed_at'])}  expires {_format_time(entry['expires_at'])}")
+        elif args.command == 'show':
+            value = store.get(args.key)
+            if value is None:
+                print(f"No entry for key {args.key}")
+                return 1
+            print(json.dumps(value, ensure_ascii=False, indent=2))
+        elif args.command == 'delete':
+            for key in args.keys:
+                print(f"{'Deleted' if store.delete(key) else 'Not found'}: {key}")
+        elif args.command == 'prune':
+            removed = store.prune_expired()
+            print(f"Removed {removed} expired entries")
+            if args.max_mb is not None:
+                evicted = store.evict(int(args.max_mb * 1024 * 1024))
+                print(f"Evicted {evicted} least recently used entries")
+            store.vacuum()
+        elif args.command == 'clear':
+            print(f"Removed {store.clear()} entries")
+            store.vacuum()
+        elif args.command == 'import-json':
+            print(f"Imported {store.import_json(args.path)} entries from {args.path}")
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.exit(main())
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Command line entry point for scheduled and headless runs.
+
+    python cli.py fetch [--refresh]      refresh the cached seller data (no map code is loaded)
+    python cli.py render [--no-open]     make the map from the cached seller data, without calling the API
+    python cli.py serve-cache            serve the map of the cached seller data locally
+    python cli.py stats                  show what the API, tile and thumbnail caches hold
+
+Settings default to the values in main.py. A JSON config file (--config) with
+any of those names (case-insensitive), and the flags below, override them
+without editing main.py. Modules are imported by the commands that need them,
+so `fetch` never loads folium or NumPy.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Same directory as thumbnails.THUMBNAIL_DIR, not imported from there so `stats` does not load Pillow and requests
+THUMBNAIL_DIR = 'thumbnails'
+
+def load_config(path=None):
+    """
+    Settings from main.py, overridden by a JSON config file.
+
+    Args:
+        path (str): JSON file of {"setting": value}, names as in main.py in any case (optional)
+
+    Returns:
+        dict: UPPER_CASE setting -> value
+    """
+    import main as defaults
+
+    config = {name: getattr(defaults, name) for name in dir(defaults) if name.isupper()}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            overrides = json.load(f)
+        if not isinstance(overrides, dict):
+            raise ValueError(f"{path}: expected a JSON object of settings")
+        for key, value in overrides.items():
+            name = key.upper()
+            if name not in config:
+                raise ValueError(f"{path}: unknown setting '{key}'")
+            config[name] = value
+    return config
+
+def apply_flags(config, args):
+    """Override config settings with the command line flags that were given."""
+    flags = {
+        'API_URL': args.api_url,
+        'OUTPUT_FILENAME': args.output,
+        'SEARCH_PROVINCES': args.provinces,
+        'RENDER_MODE': args.mode,
+        'MAX_RADIUS_KM': args.radius,
+        'MAP_ZOOM_START': args.zoom,
+        'TARGETS_FILE': args.targets,
+        'METRICS_FILE': args.metrics,
+        # Export and snapshot flags belong to fetch only
+        'EXPORT_DIR': getattr(args, 'export', None),
+        'EXPORT_FORMAT': getattr(args, 'export_format', None),
+        'CHANGES_FILE': getattr(args, 'changes', None),
+        'CHANGES_MAP': getattr(args, 'changes_map', None)
+    }
+    if getattr(args, 'snapshot', False) or flags['CHANGES_FILE'] or flags['CHANGES_MAP']:
+        flags['SNAPSHOTS'] = True
+    if args.target:
+        flags['TARGET_LATITUDE'], flags['TARGET_LONGITUDE'] = args.target
+    if args.lazy_popups:
+        flags['LAZY_POPUPS'] = True
+    if args.no_open:
+        flags['OPEN_BROWSER'] = False
+    config.update((name, value) for name, value in flags.items() if value is not None)
+    return config
+
+def category_queries(config):
+    """One fetch query per configured category, as main.py builds them."""
+    queries = []
+    if config['ACCOMMODATION_TYPES']:
+        queries.append({
+            'business_category': 'accommodation',
+            'business_types': config['ACCOMMODATION_TYPES'],
+            'limit': config['ACCOMMODATION_LIMIT']
+        })
+    if config['RESTAURANT_TYPES']:
+        queries.append({
+            'business_category': 'restaurant',
+            'business_types': config['RESTAURANT_TYPES'],
+            'limit': config['RESTAURANT_LIMIT']
+        })
+    return queries
+
+def report_metrics_at_exit(config):
+    """Write the metrics report when the command ends, if METRICS_FILE is set."""
+    if not config['METRICS_FILE']:
+        return
+    import atexit
+    from metrics import METRICS
+
+    def report_metrics():
+        METRICS.summary()
+        METRICS.write_report(config['METRICS_FILE'], config['METRICS_PROMETHEUS_FILE'])
+        print(f"[METRICS] Report written to {config['METRICS_FILE']}")
+
+    atexit.register(report_metrics)
+
+def load_cached_sellers(config, export_dir=None):
+    """
+    The configured query's sellers from the API cache, for the commands that must not call the API.
+
+    Args:
+        config (dict): Settings
+        export_dir (str): Load the tables export_sellers wrote there instead of reading the API cache (optional)
+
+    Returns:
+        list: Sellers (compact records with COMPACT_SELLERS or from an export), None if part of the query is not cached
+    """
+    if export_dir:
+        from seller_export import load_sellers
+        try:
+            return load_sellers(export_dir)
+        except FileNotFoundError as e:
+            print(f"❌ {e}, run `python cli.py fetch --export {export_dir}` first")
+            return None
+
+    from fetch_data import load_cached_categories
+
+    sellers_info, missing = load_cached_categories(category_queries(config), provinces=config['SEARCH_PROVINCES'])
+    if missing:
+        print(f"❌ {len(missing)} query cell(s) not cached, run `python cli.py fetch` first:")
+        for business_category, province, business_type in missing:
+            print(f"   {business_category}: {province or 'all provinces'} / {business_type}")
+        return None
+    if not sellers_info:
+        print("❌ No sellers in the cached data. Please check your configuration.")
+        return None
+    print(f"✅ Loaded {len(sellers_info)} sellers from the cache")
+    if config['COMPACT_SELLERS']:
+        from seller_record import compact_sellers
+        sellers_info = compact_sellers(sellers_info)
+    return sellers_info
+
+def command_fetch(config, args):
+    """Fetch the configured categories into the API cache, the exit status reports incomplete queries."""
+    from main import require_api_config
+    try:
+        require_api_config(config['API_URL'], config['API_TOKEN'])
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    from fetch_data import fetch_categories
+    from metrics import span
+
+    print(f"📥 Fetching seller data{' (refreshing cached queries)' if args.refresh else ''}...")
+    with span('fetch'):
+        sellers_info, category_results = fetch_categories(
+            category_queries(config),
+            provinces=config['SEARCH_PROVINCES'],
+            api_url=config['API_URL'],
+            api_token=config['API_TOKEN'],
+            max_workers=config['MAX_CONCURRENT_REQUESTS'],
+            requests_per_second=config['REQUESTS_PER_SECOND'],
+            refresh=args.refresh
+        )
+    incomplete = [
+        business_category for business_category, (_, pagination, _) in category_results.items()
+        if pagination is None or pagination.get('failedCells')
+    ]
+    print(f"✅ {len(sellers_info)} sellers cached")
+    if config['SNAPSHOTS'] and incomplete:
+        # An incomplete fetch would show its missing sellers as removed, so it is not snapshotted
+        print(f"⚠️ Incomplete categories ({', '.join(incomplete)}), no snapshot taken")
+    elif config['SNAPSHOTS']:
+        from snapshots import snapshot_and_diff
+        with span('snapshot'):
+            snapshot_and_diff(
+                sellers_info,
+                label=f"{', '.join(query['business_category'] for query in category_queries(config))} / "
+                      f"{', '.join(config['SEARCH_PROVINCES']) or 'all provinces'}",
+                changes_file=config['CHANGES_FILE'],
+                changes_map=config['CHANGES_MAP'],
+                target=(config['TARGET_LATITUDE'], config['TARGET_LONGITUDE']),
+                zoom_start=config['MAP_ZOOM_START'],
+                render_mode=config['RENDER_MODE'],
+                lazy_popups=config['LAZY_POPUPS'],
+                tile_proxy=config['TILE_PROXY_URL'] if config['TILE_CACHE'] else None
+            )
+    if config['EXPORT_DIR']:
+        from seller_export import export_sellers
+        with span('export'):
+            export_sellers(sellers_info, config['EXPORT_DIR'], config['EXPORT_FORMAT'])
+    if incomplete:
+        print(f"⚠️ Incomplete categories: {', '.join(incomplete)}, run fetch again to fill the gaps")
+        return 1
+    return 0
+
+def command_render(config, args):
+    """Make the map (or the batch maps of TARGETS_FILE) from the cached sellers."""
+    sellers_info = load_cached_sellers(config, args.from_export)
+    if sellers_info is None:
+        return 1
+
+    from run_maps import create_sellers_map_with_target, save_and_open_map
+    from spatial_index import load_or_build_index
+    from metrics import span
+
+    output = config['OUTPUT_FILENAME']
+    tile_proxy = config['TILE_PROXY_URL'] if config['TILE_CACHE'] else None
+    with span('spatial_index'):
+        seller_index = load_or_build_index(sellers_info)
+
+    if config['TARGETS_FILE']:
+        from batch_maps import generate_maps, load_targets
+        targets = load_targets(config['TARGETS_FILE'])
+        print(f"\n🗂️ Creating {len(targets)} maps from {config['TARGETS_FILE']}...")
+        batch_thumbnails = None
+        if config['THUMBNAILS']:
+            from thumbnails import prepare_thumbnails
+            batch_thumbnails = {
+                directory: prepare_thumbnails(sellers_info, base_dir=directory)
+                for directory in {os.path.dirname(os.path.abspath(target['output'])) for target in targets}
+            }
+        results = generate_maps(
+            sellers_info,
+            targets,
+            spatial_index=seller_index,
+            thumbnails=batch_thumbnails,
+            processes=config['BATCH_PROCESSES'],
+            zoom_start=config['MAP_ZOOM_START'],
+            max_radius_km=config['MAX_RADIUS_KM'],
+            nearest_count=config['NEAREST_LIST_SIZE'],
+            render_mode=config['RENDER_MODE'],
+            lazy_popups=config['LAZY_POPUPS'],
+            popup_sidecar=config['POPUP_SIDECAR'],
+            incremental=config['INCREMENTAL'],
+            tile_proxy=tile_proxy
+        )
+        failed = [target['name'] for target, _, error in results if error]
+        if failed:
+            print(f"❌ {len(failed)} maps failed: {', '.join(failed)}")
+            return 1
+        print(f"\n🎉 {len(results)} maps created successfully")
+        return 0
+
+    manifest = None
+    if config['INCREMENTAL']:
+        from render_manifest import RenderManifest
+        manifest = RenderManifest(output)
+    thumbnails = None
+    if config['THUMBNAILS']:
+        from thumbnails import prepare_thumbnails
+        thumbnails = prepare_thumbnails(sellers_info, base_dir=os.path.dirname(os.path.abspath(output)))
+
+    print("\n🗺️ Creating interactive map...")
+    google_map = create_sellers_map_with_target(
+        sellers_info,
+        config['TARGET_LATITUDE'],
+        config['TARGET_LONGITUDE'],
+        zoom_start=config['MAP_ZOOM_START'],
+        max_radius_km=config['MAX_RADIUS_KM'],
+        nearest_count=config['NEAREST_LIST_SIZE'],
+        spatial_index=seller_index,
+        render_mode=config['RENDER_MODE'],
+        lazy_popups=config['LAZY_POPUPS'],
+        popup_data_file=os.path.splitext(output)[0] + '_popups.js' if config['POPUP_SIDECAR'] else None,
+        thumbnails=thumbnails,
+        manifest=manifest,
+        tile_proxy=tile_proxy
+    )
+    if not google_map:
+        print("❌ Failed to create map")
+        return 1
+    save_and_open_map(google_map, output, manifest, open_browser=config['OPEN_BROWSER'])
+    print(f"\n🎉 Map created successfully: {output}")
+    return 0
+
+def command_serve_cache(config, args):
+    """Serve the map of the cached sellers (and the tile cache, with TILE_CACHE) without calling the API."""
+    sellers_info = load_cached_sellers(config, args.from_export)
+    if sellers_info is None:
+        return 1
+
+    from map_server import serve
+    from spatial_index import load_or_build_index
+
+    tile_cache = None
+    if config['TILE_CACHE']:
+        from tile_cache import TileCache
+        tile_cache = TileCache()
+    thumbnails = None
+    if config['THUMBNAILS']:
+        from thumbnails import prepare_thumbnails
+        thumbnails = prepare_thumbnails(sellers_info)
+
+    print("\n🖥️ Starting the map server...")
+    served = serve(
+        sellers_info,
+        config['TARGET_LATITUDE'],
+        config['TARGET_LONGITUDE'],
+        host=args.host or config['SERVER_HOST'],
+        port=args.port or config['SERVER_PORT'],
+        open_browser=config['OPEN_BROWSER'],
+        spatial_index=load_or_build_index(sellers_info),
+        zoom_start=config['MAP_ZOOM_START'],
+        max_radius_km=config['MAX_RADIUS_KM'],
+        nearest_count=config['NEAREST_LIST_SIZE'],
+        thumbnails=thumbnails,
+        tile_cache=tile_cache
+    )
+    return 0 if served else 1
+
+def command_stats(config, args):
+    """Print the cache sizes and how much of the configured query is cached."""
+    import sqlite3
+    from cache_store import CacheStore, _format_bytes
+    from fetch_data import CACHE_FILE, get_cache_key, get_query_cells
+
+    # Read-only, so stats never creates the cache or imports the legacy api_cache.json
+    try:
+        cache = CacheStore(CACHE_FILE, max_bytes=None, read_only=True)
+        stats = cache.stats()
+    except sqlite3.OperationalError:
+        cache = None
+        print(f"🗄️ API cache {CACHE_FILE}: none yet, run fetch first")
+    if cache is not None:
+        print(f"🗄️ API cache {stats['path']}: {stats['entries']} entries ({stats['expired']} expired), "
+              f"{_format_bytes(stats['bytes'])}")
+        for query in category_queries(config):
+            cells = get_query_cells(config['SEARCH_PROVINCES'], query['business_types'])
+            cached = sum(
+                1 for province, business_type in cells
+                if get_cache_key([province] if province else [], [business_type], query['limit']) in cache
+            )
+            print(f"   {query['business_category']}: {cached} of {len(cells)} query cells cached")
+        cache.close()
+
+    from tile_cache import TILE_DIR, TileCache
+    if os.path.isdir(TILE_DIR):
+        tile_cache = TileCache(TILE_DIR)
+        tiles = tile_cache.stats()
+        tile_cache.close()
+        print(f"🧱 Tile cache {tiles['directory']}: {tiles['tiles']} tiles, {_format_bytes(tiles['bytes'])}")
+    else:
+        print(f"🧱 Tile cache {TILE_DIR}: empty")
+
+    if os.path.isdir(THUMBNAIL_DIR):
+        sizes = [
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(THUMBNAIL_DIR) for name in names
+        ]
+        print(f"🖼️ Thumbnails {THUMBNAIL_DIR}: {len(sizes)} files, {_format_bytes(sum(sizes))}")
+    return 0
+
+COMMANDS = {
+    'fetch': command_fetch,
+    'render': command_render,
+    'serve-cache': command_serve_cache,
+    'stats': command_stats
+}
+
+def main(argv=None):
+    # Flags shared by every command, accepted after the command name
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', help="JSON file of settings, names as in main.py")
+    common.add_argument('--api-url', help="API endpoint (the token stays in .env or the config file)")
+    common.add_argument('--target', nargs=2, type=float, metavar=('LAT', 'LON'), help="target location")
+    common.add_argument('--provinces', nargs='+', help="search provinces")
+    common.add_argument('--output', help="map file")
+    common.add_argument('--mode', choices=('markers', 'cluster', 'geojson'), help="render mode")
+    common.add_argument('--radius', type=float, help="only sellers within this many km of the target")
+    common.add_argument('--zoom', type=int, help="initial zoom level")
+    common.add_argument('--lazy-popups', action='store_true', help="build popups in the browser when opened")
+    common.add_argument('--targets', help="targets file for batch maps")
+    common.add_argument('--metrics', help="write a JSON lines metrics report to this file")
+    common.add_argument('--no-open', action='store_true', help="do not open a browser (headless runs)")
+
+    parser = argparse.ArgumentParser(description="Sellers map: fetch, render and serve from the local caches")
+    commands = parser.add_subparsers(dest='command', required=True)
+    fetch = commands.add_parser('fetch', parents=[common], help="fetch the sellers into the API cache")
+    fetch.add_argument('--refresh', action='store_true', help="fetch cached queries again")
+    fetch.add_argument('--export', metavar='DIR', help="also write the sellers as columnar tables to DIR")
+    fetch.add_argument('--export-format', choices=('arrow', 'parquet', 'csv'), help="format of --export")
+    fetch.add_argument('--snapshot', action='store_true', help="store the fetch as a snapshot")
+    fetch.add_argument('--changes', metavar='FILE', help="snapshot, and write the changes since the last snapshot")
+    fetch.add_argument('--changes-map', metavar='FILE', help="snapshot, and map the sellers that changed")
+    render = commands.add_parser('render', parents=[common], help="make the map from the cached sellers")
+    render.add_argument('--from-export', metavar='DIR', help="load the sellers from the tables exported to DIR")
+    serve = commands.add_parser('serve-cache', parents=[common], help="serve the map of the cached sellers")
+    serve.add_argument('--from-export', metavar='DIR', help="load the sellers from the tables exported to DIR")
+    serve.add_argument('--host', help="address to listen on")
+    serve.add_argument('--port', type=int, help="port to listen on")
+    commands.add_parser('stats', parents=[common], help="show the cache contents")
+    args = parser.parse_args(argv)
+
+    try:
+        config = apply_flags(load_config(args.config), args)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+    report_metrics_at_exit(config)
+    return COMMANDS[args.command](config, args)
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.exit(main())
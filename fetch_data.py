@@ -1,16 +1,90 @@
-import requests
 import json
 import sys
 import time
 import hashlib
-import os
-import random
+import threading
+import queue
+from contextlib import nullcontext
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from api_client import ApiRequestError, post_json
+from cache_store import CACHE_DB, open_cache
+from metrics import count, observe, span
 
 # API configuration must be provided by the calling code
 
-CACHE_FILE = 'api_cache.json'
+CACHE_FILE = CACHE_DB
+
+# Time-to-live for cached queries in seconds (None = keep until evicted or pruned)
+CACHE_TTL = None
+
+# Concurrency defaults for fetching pages 2..N once page 1 reports totalPages
+MAX_CONCURRENT_REQUESTS = 4
+REQUESTS_PER_SECOND = 2.0
+
+# Sellers buffered between fetch threads and a streaming consumer such as the map renderer
+STREAM_BUFFER = 200
+
+# Average of the random 0.7-1.5 s sleep the serial loop used between pages,
+# used to report the speedup of the concurrent fetch against it
+SERIAL_PAGE_DELAY = 1.1
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces request starts to a requests-per-second budget.
+    
+    Used as a context manager around a request it also caps the number of
+    requests in flight, so one limiter can be shared by every fetch of a run.
+    
+    Args:
+        requests_per_second (float): Maximum request starts per second (None or 0 disables the limit)
+        max_in_flight (int): Maximum concurrent requests (None = no cap)
+    """
+    
+    def __init__(self, requests_per_second, max_in_flight=None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+    
+    def __enter__(self):
+        if self._in_flight:
+            self._in_flight.acquire()
+        self.wait()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._in_flight:
+            self._in_flight.release()
+    
+    def wait(self):
+        """Block until the caller may start its next request."""
+        if not self.interval:
+            return
+        with self._lock:
+            slot = max(time.monotonic(), self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        observe('rate_limit_wait_seconds', max(delay, 0.0))
+        if delay > 0:
+            time.sleep(delay)
+
+def normalize_query(provinces, business_types):
+    """
+    Normalize a query so the same search always maps to the same cache entry.
+    
+    Args:
+        provinces (list): Province names (None or empty = all provinces)
+        business_types (list): Business type codes
+    
+    Returns:
+        tuple: (provinces, business_types) as sorted lists without duplicates
+    """
+    return sorted(set(provinces or [])), sorted(set(business_types or []))
 
 def get_cache_key(provinces, business_types, limit):
+    provinces, business_types = normalize_query(provinces, business_types)
     key_str = json.dumps({
         'provinces': provinces,
         'business_types': business_types,
@@ -18,34 +92,285 @@ def get_cache_key(provinces, business_types, limit):
     }, sort_keys=True, ensure_ascii=False)
     return hashlib.md5(key_str.encode('utf-8')).hexdigest()
 
+def get_page_cache_key(cache_key, page):
+    """Cache key for the checkpoint of one page of a query."""
+    return f"{cache_key}:page:{page}"
+
+_cache = None
+_cache_lock = threading.Lock()
+
 def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            try:
-                return json.load(f)
-            except Exception:
-                return {}
-    return {}
+    """Return the shared cache store, opening CACHE_FILE on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.path != CACHE_FILE:
+            _cache = open_cache(CACHE_FILE)
+    return _cache
 
-def save_cache(cache):
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+def load_entry(cache, key, entry):
+    """Read a cache entry inside a cache_load span, entry is 'query' or 'page'."""
+    with span('cache_load', entry=entry) as fields:
+        value = cache.get(key)
+        fields['hit'] = value is not None
+    return value
 
-def call_api(provinces=None, business_types=None, limit=20, api_url=None, api_token=None, business_category=None):
+def save_entry(cache, key, value, entry):
+    """Write a cache entry inside a cache_save span, entry is 'query' or 'page'."""
+    with span('cache_save', entry=entry):
+        cache.set(key, value, ttl=CACHE_TTL)
+
+def fetch_page(api_url, headers, body_template, page, rate_limiter=None):
     """
-    Fetch all pages of API data with 500ms delay between calls
-    Adds local caching to avoid unnecessary API calls.
+    Fetch a single page of sellers from the API through the pooled, retrying client.
     
     Args:
-        provinces (list): List of province names to search (default: ["นครราชสีมา"])
-        business_types (list): List of business type codes (default: all accommodation types)
-        limit (int): Number of items per page (default: 20)
-        api_url (str): API endpoint URL (required)
-        api_token (str): API authentication token (required)
-        business_category (str): Business category like 'accommodation' or 'restaurant' (required)
+        api_url (str): API endpoint URL
+        headers (dict): Request headers including the bearer token
+        body_template (dict): Request body without the page number
+        page (int): Page number to fetch (1-based)
+        rate_limiter (RateLimiter): Optional limiter holding the request's slot while it is sent
     
     Returns:
-        tuple: (api_response, pagination, sellers_info)
+        tuple: (response_data, elapsed_seconds)
+    
+    Raises:
+        ApiRequestError: If the page still fails after retries
+    """
+    body = body_template.copy()
+    body["page"] = page
+    
+    with rate_limiter or nullcontext():
+        print(f"Fetching page {page}...")
+        print(f"Body: {body}")
+        started = time.perf_counter()
+        with span('api_page') as fields:
+            response, retries = post_json(api_url, headers=headers, json_body=body)
+            fields.update(page=page, status=response.status_code, bytes=len(response.content), retries=retries)
+    observe('api_page_bytes', len(response.content))
+    if retries:
+        count('api_retries_total', retries)
+    try:
+        with span('api_json_parse'):
+            response_data = response.json()
+    except ValueError as e:
+        raise ApiRequestError(f"Page {page} returned invalid JSON (HTTP {response.status_code}): {e}")
+    return response_data, time.perf_counter() - started
+
+def build_contact_urls(contact):
+    """
+    Build clickable contact URLs from a seller's contact fields.
+    
+    Args:
+        contact (dict): The seller_info 'contact' dictionary
+    
+    Returns:
+        dict: URLs keyed by 'website', 'facebook', 'instagram' and 'line' (only those present)
+    """
+    contact_urls = {}
+    
+    # Website
+    if contact.get('website'):
+        website_url = contact['website']
+        if not (website_url.startswith('http') or website_url.startswith('https')):
+            website_url = f"https://{website_url}"
+        contact_urls['website'] = website_url
+    
+    # Facebook
+    if contact.get('facebook'):
+        facebook_url = contact['facebook']
+        if not ('facebook.com' in facebook_url or '.com' in facebook_url or '.co.th' in facebook_url or facebook_url.startswith('http') or facebook_url.startswith('https')):
+            facebook_url = f"https://www.facebook.com/{facebook_url}"
+        contact_urls['facebook'] = facebook_url
+    
+    # Instagram
+    if contact.get('instagram'):
+        instagram_url = contact['instagram']
+        if not ('instagram.com' in instagram_url or '.com' in instagram_url or '.co.th' in instagram_url or instagram_url.startswith('http') or instagram_url.startswith('https')):
+            instagram_url = f"https://www.instagram.com/{instagram_url}"
+        contact_urls['instagram'] = instagram_url
+    
+    # Line
+    if contact.get('line'):
+        contact_urls['line'] = f"https://line.me/ti/p/{contact['line']}"
+    
+    return contact_urls
+
+def parse_seller(seller, business_category):
+    """
+    Convert a raw API seller into the seller_info dictionary used by the map.
+    
+    Args:
+        seller (dict): Seller object from the API response
+        business_category (str): Business category like 'accommodation' or 'restaurant'
+    
+    Returns:
+        dict: Normalized seller information including contact_urls
+    """
+    seller_info = {
+        'id': seller.get('id'),
+        'name_th': seller.get('nameTh'),
+        'name_en': seller.get('nameEn'),
+        'business_category': business_category,  # Add business category
+        'address': {
+            'no': seller.get('addressNo'),
+            'moo': seller.get('moo'),
+            'district': seller.get('district'),
+            'sub_district': seller.get('subDistrict'),
+            'province': seller.get('province'),
+            'postal_code': seller.get('postalCode')
+        },
+        'location': {
+            'longitude': seller.get('location', {}).get('coordinates', [])[0] if seller.get('location', {}).get('coordinates') else None,
+            'latitude': seller.get('location', {}).get('coordinates', [])[1] if seller.get('location', {}).get('coordinates') else None,
+            'type': seller.get('location', {}).get('type') if seller.get('location') else None
+        },
+        'contact': {
+            'mobile': seller.get('contactMobilePhoneNo'),
+            'email': seller.get('contactEmail'),
+            'additional': seller.get('contactAdditionalChannel'),
+            'website': seller.get('bizContactWebsite'),
+            'facebook': seller.get('bizContactFacebook'),
+            'instagram': seller.get('bizContactInstagram'),
+            'line': seller.get('bizContactLine')
+        },
+        'rooms': seller.get('rooms', []),
+        'images': seller.get('images', [])
+    }
+    seller_info['contact_urls'] = build_contact_urls(seller_info['contact'])
+    return seller_info
+
+def is_valid_page(response_data):
+    """Return True if a page response carries seller data."""
+    return bool(response_data and response_data.get('success') and response_data.get('data'))
+
+def load_or_fetch_page(cache, cache_key, api_url, headers, body_template, page, business_category, rate_limiter=None,
+                       refresh=False):
+    """
+    Load a page from its checkpoint, or fetch it and checkpoint it right away.
+    
+    A later run of the same query loads checkpointed pages instead of
+    fetching them again, so an interrupted pull only refetches the missing pages.
+    
+    Args:
+        cache (CacheStore): Cache holding the page checkpoints
+        cache_key (str): Cache key of the whole query
+        api_url (str): API endpoint URL
+        headers (dict): Request headers including the bearer token
+        body_template (dict): Request body without the page number
+        page (int): Page number (1-based)
+        business_category (str): Business category like 'accommodation' or 'restaurant'
+        rate_limiter (RateLimiter): Optional limiter holding the request's slot while it is sent
+        refresh (bool): Ignore an existing checkpoint, the page is fetched and its checkpoint overwritten
+    
+    Returns:
+        tuple: (page_response, sellers, elapsed_seconds), elapsed_seconds is None for a checkpointed
+               page and page_response/sellers are None if the API answered without data
+    
+    Raises:
+        ApiRequestError: If the page still fails after retries
+    """
+    checkpoint = None if refresh else load_entry(cache, get_page_cache_key(cache_key, page), 'page')
+    if checkpoint is not None:
+        return checkpoint['response_data'], checkpoint['sellers'], None
+    
+    page_response, latency = fetch_page(api_url, headers, body_template, page, rate_limiter)
+    if not is_valid_page(page_response):
+        return None, None, latency
+    
+    sellers = [parse_seller(seller, business_category) for seller in page_response['data'].get('data', [])]
+    save_entry(cache, get_page_cache_key(cache_key, page), {
+        'response_data': page_response,
+        'sellers': sellers
+    }, 'page')
+    return page_response, sellers, latency
+
+def iter_pages(cache, cache_key, api_url, headers, body_template, business_category,
+               max_workers=MAX_CONCURRENT_REQUESTS, rate_limiter=None, refresh=False):
+    """
+    Yield the pages of a query in page order while later pages are still being fetched.
+    
+    Page 1 is loaded first to learn totalPages. The remaining pages are
+    fetched concurrently, with at most two pages per worker buffered ahead
+    of the consumer so memory stays flat however many pages there are.
+    
+    Args:
+        cache (CacheStore): Cache holding the page checkpoints
+        cache_key (str): Cache key of the whole query
+        api_url (str): API endpoint URL
+        headers (dict): Request headers including the bearer token
+        body_template (dict): Request body without the page number
+        business_category (str): Business category like 'accommodation' or 'restaurant'
+        max_workers (int): Maximum number of page requests in flight (default: 4)
+        rate_limiter (RateLimiter): Optional limiter shared by all page requests
+        refresh (bool): Fetch every page even when it has a checkpoint from an earlier run
+    
+    Yields:
+        tuple: (page, page_response, sellers), page_response and sellers are None for a failed page
+    
+    Raises:
+        ApiRequestError: If page 1 fails after retries, the number of pages is unknown without it
+    """
+    fetch_started = time.perf_counter()
+    page_latencies = []
+    resumed_pages = 0
+    
+    # Page 1 tells us how many pages there are
+    page_response, sellers, latency = load_or_fetch_page(
+        cache, cache_key, api_url, headers, body_template, 1, business_category, rate_limiter, refresh
+    )
+    if latency is None:
+        resumed_pages += 1
+    else:
+        page_latencies.append(latency)
+    yield 1, page_response, sellers
+    if page_response is None:
+        return
+    
+    data = page_response['data']
+    total_pages = data.get('totalPages') or 1
+    print(f"Total pages: {total_pages}, Total items: {data.get('totalItems')}")
+    
+    if total_pages > 1:
+        workers = max(1, max_workers)
+        print(f"Fetching pages 2-{total_pages} with up to {workers} requests in flight...")
+        pending = deque()
+        next_page = 2
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while next_page <= total_pages or pending:
+                # Keep a bounded window of pages in flight ahead of the consumer
+                while next_page <= total_pages and len(pending) < workers * 2:
+                    pending.append((next_page, executor.submit(
+                        load_or_fetch_page, cache, cache_key, api_url, headers, body_template,
+                        next_page, business_category, rate_limiter, refresh
+                    )))
+                    next_page += 1
+                
+                page, future = pending.popleft()
+                try:
+                    page_response, sellers, latency = future.result()
+                except ApiRequestError as e:
+                    print(f"Page {page} failed after retries: {e}")
+                    page_response, sellers, latency = None, None, 0.0
+                if latency is None:
+                    resumed_pages += 1
+                else:
+                    page_latencies.append(latency)
+                yield page, page_response, sellers
+    
+    if resumed_pages:
+        print(f"[CACHE] Resumed {resumed_pages} of {total_pages} pages from checkpoints")
+    if page_latencies:
+        fetch_elapsed = time.perf_counter() - fetch_started
+        serial_estimate = sum(page_latencies) + SERIAL_PAGE_DELAY * (len(page_latencies) - 1)
+        print(f"Fetched {len(page_latencies)} pages in {fetch_elapsed:.2f}s "
+              f"(serial loop estimate {serial_estimate:.2f}s, speedup {serial_estimate / max(fetch_elapsed, 1e-9):.1f}x)")
+
+def build_request(provinces, business_types, limit, api_url, api_token, business_category):
+    """
+    Validate a query and build its request headers and body template.
+    
+    Returns:
+        tuple: (headers, body_template)
     """
     
     # Validate required API configuration
@@ -55,6 +380,8 @@ def call_api(provinces=None, business_types=None, limit=20, api_url=None, api_to
         raise ValueError("api_token is required")
     if not business_category:
         raise ValueError("business_category is required (e.g., 'accommodation' or 'restaurant')")
+    if business_types is None:
+        raise ValueError("business_types is required")
     
     # Request headers with bearer token
     headers = {
@@ -62,116 +389,166 @@ def call_api(provinces=None, business_types=None, limit=20, api_url=None, api_to
         'Content-Type': 'application/json'
     }
     
+    # Request body template
+    body_template = {
+        "limit": limit,
+        "businessType": business_types
+    }
+    
+    # Only add province if provided
+    if provinces:
+        body_template["province"] = provinces
+    
+    return headers, body_template
+
+def save_query(cache, cache_key, response_data, pagination, sellers_info):
+    """
+    Cache a complete query result and delete the page checkpoints it was assembled from.
+    
+    Args:
+        cache (CacheStore): Cache holding the query and its page checkpoints
+        cache_key (str): Cache key of the whole query
+        response_data (dict): Last page response
+        pagination (dict): Pagination summary, its totalPages tells which checkpoints to delete
+        sellers_info (list): All sellers of the query in page order
+    """
+    save_entry(cache, cache_key, {
+        'response_data': response_data,
+        'pagination': pagination,
+        'all_sellers_info': sellers_info
+    }, 'query')
+    for page in range(1, (pagination['totalPages'] or 1) + 1):
+        cache.delete(get_page_cache_key(cache_key, page))
+
+def stream_query_pages(cache, cache_key, api_url, headers, body_template, business_category,
+                       max_workers=MAX_CONCURRENT_REQUESTS, rate_limiter=None):
+    """
+    Yield the sellers of each page of a query, and cache the query once every page arrived.
+    
+    Like call_api, a complete query is saved as one entry and its page
+    checkpoints are deleted; after a failed page the checkpoints are kept
+    so the next run fetches only the missing pages.
+    
+    Args:
+        cache (CacheStore): Cache holding the query and its page checkpoints
+        cache_key (str): Cache key of the whole query
+        api_url (str): API endpoint URL
+        headers (dict): Request headers including the bearer token
+        body_template (dict): Request body without the page number
+        business_category (str): Business category like 'accommodation' or 'restaurant'
+        max_workers (int): Maximum number of page requests in flight (default: 4)
+        rate_limiter (RateLimiter): Optional limiter shared by all page requests
+    
+    Yields:
+        list: seller_info dictionaries of one page, empty for a failed page
+    """
+    sellers_info = []
+    response_data = None
+    total_pages = None
+    total_items = 0
+    failed_pages = []
+    for page, page_response, sellers in iter_pages(
+        cache, cache_key, api_url, headers, body_template, business_category, max_workers, rate_limiter
+    ):
+        if page_response is None:
+            failed_pages.append(page)
+            yield []
+            continue
+        if page == 1:
+            total_pages = page_response['data'].get('totalPages') or 1
+            total_items = page_response['data'].get('totalItems')
+        response_data = page_response
+        sellers_info.extend(sellers)
+        yield sellers
+    
+    if failed_pages:
+        print(f"⚠️ {len(failed_pages)} page(s) failed ({failed_pages}), cell not cached")
+        return
+    save_query(cache, cache_key, response_data, {
+        'totalPages': total_pages,
+        'totalItems': total_items,
+        'pagesFetched': total_pages,
+        'totalSellers': len(sellers_info),
+        'failedPages': failed_pages
+    }, sellers_info)
+
+def call_api(provinces=None, business_types=None, limit=20, api_url=None, api_token=None, business_category=None,
+             max_workers=MAX_CONCURRENT_REQUESTS, requests_per_second=REQUESTS_PER_SECOND, rate_limiter=None,
+             refresh=False):
+    """
+    Fetch all pages of API data, fetching pages after the first concurrently.
+    Adds local caching to avoid unnecessary API calls.
+    
+    Args:
+        provinces (list): List of province names to search (default: ["นครราชสีมา"])
+        business_types (list): List of business type codes (default: all accommodation types)
+        limit (int): Number of items per page (default: 20)
+        api_url (str): API endpoint URL (required)
+        api_token (str): API authentication token (required)
+        business_category (str): Business category like 'accommodation' or 'restaurant' (required)
+        max_workers (int): Maximum number of page requests in flight (default: 4, 1 fetches serially)
+        requests_per_second (float): Request start budget across all workers (default: 2.0, None disables)
+        rate_limiter (RateLimiter): Shared limiter to use instead of one built from requests_per_second
+        refresh (bool): Fetch even when the query or its pages are cached, the cached result is replaced once the new one is complete
+    
+    Returns:
+        tuple: (api_response, pagination, sellers_info)
+    """
+    
     # Default values
     if provinces is None:
         provinces = []
     
-    if business_types is None:
-         raise ValueError("business_types is required")
+    headers, body_template = build_request(provinces, business_types, limit, api_url, api_token, business_category)
     
     # Caching logic
     cache = load_cache()
     cache_key = get_cache_key(provinces, business_types, limit)
-    if cache_key in cache:
+    cached = None if refresh else load_entry(cache, cache_key, 'query')
+    if cached is not None:
         print(f"[CACHE] Loading API data from cache: {CACHE_FILE} (key={cache_key})")
-        cached = cache[cache_key]
         return cached['response_data'], cached['pagination'], cached['all_sellers_info']
     print(f"[API] Fetching data from API (no cache found for key={cache_key})...")
     
-    # Request body template
-    body_template = {
-        "limit": limit,
-        "businessType": business_types
-    }
-    
-    # Only add province if provided
-    if provinces:
-        body_template["province"] = provinces
-    
     print("Fetching all pages from API...")
     print("-" * 50)
     
     all_sellers_info = []
-    current_page = 1
+    response_data = None
     total_pages = None
     total_items = 0
+    pages_fetched = 0
+    failed_pages = []
+    rate_limiter = rate_limiter or RateLimiter(requests_per_second)
     
     try:
-        while True:
-            # Update page number
-            body = body_template.copy()
-            body["page"] = current_page
-            print(f"Fetching page {current_page}...")
-            print(f"Body: {body}")
-            
-            response = requests.post(api_url, headers=headers, json=body, verify=False)
-            response_data = response.json()
-            
-            if not response_data.get('success') or not response_data.get('data'):
+        # Assemble sellers in page order, a failed page is recorded and skipped instead of dropping the run
+        for current_page, page_response, sellers in iter_pages(
+            cache, cache_key, api_url, headers, body_template, business_category, max_workers, rate_limiter, refresh
+        ):
+            if page_response is None:
                 print(f"Failed to fetch page {current_page}")
-                break
-            
-            data = response_data['data']
-            sellers = data.get('data', [])
+                failed_pages.append(current_page)
+                continue
             
             # Update pagination info on first page
             if current_page == 1:
-                total_pages = data.get('totalPages')
-                total_items = data.get('totalItems')
-                print(f"Total pages: {total_pages}, Total items: {total_items}")
+                total_pages = page_response['data'].get('totalPages') or 1
+                total_items = page_response['data'].get('totalItems')
             
-            # Process sellers from this page
-            for seller in sellers:
-                seller_info = {
-                    'id': seller.get('id'),
-                    'name_th': seller.get('nameTh'),
-                    'name_en': seller.get('nameEn'),
-                    'business_category': business_category,  # Add business category
-                    'address': {
-                        'no': seller.get('addressNo'),
-                        'moo': seller.get('moo'),
-                        'district': seller.get('district'),
-                        'sub_district': seller.get('subDistrict'),
-                        'province': seller.get('province'),
-                        'postal_code': seller.get('postalCode')
-                    },
-                    'location': {
-                        'longitude': seller.get('location', {}).get('coordinates', [])[0] if seller.get('location', {}).get('coordinates') else None,
-                        'latitude': seller.get('location', {}).get('coordinates', [])[1] if seller.get('location', {}).get('coordinates') else None,
-                        'type': seller.get('location', {}).get('type') if seller.get('location') else None
-                    },
-                    'contact': {
-                        'mobile': seller.get('contactMobilePhoneNo'),
-                        'email': seller.get('contactEmail'),
-                        'additional': seller.get('contactAdditionalChannel'),
-                        'website': seller.get('bizContactWebsite'),
-                        'facebook': seller.get('bizContactFacebook'),
-                        'instagram': seller.get('bizContactInstagram'),
-                        'line': seller.get('bizContactLine')
-                    },
-                    'rooms': seller.get('rooms', []),
-                    'images': seller.get('images', [])
-                }
-                all_sellers_info.append(seller_info)
+            response_data = page_response
+            all_sellers_info.extend(sellers)
+            pages_fetched += 1
             
             print(f"Page {current_page} of {total_pages}: Found {len(sellers)} sellers (Total so far: {len(all_sellers_info)})")
-            
-            # Check if there are more pages
-            if not data.get('hasNextPage') or current_page >= total_pages:
-                break
-            
-            # Wait 1000ms before next request
-            random_wait = random.uniform(0.7, 1.5)
-            print(f"Waiting {random_wait} seconds before next page...")
-            time.sleep(random_wait)
-            current_page += 1
         
         # Create final pagination info
         pagination = {
             'totalPages': total_pages,
             'totalItems': total_items,
-            'pagesFetched': current_page,
-            'totalSellers': len(all_sellers_info)
+            'pagesFetched': pages_fetched,
+            'totalSellers': len(all_sellers_info),
+            'failedPages': failed_pages
         }
         
         print("\n" + "="*50)
@@ -188,54 +565,29 @@ def call_api(provinces=None, business_types=None, limit=20, api_url=None, api_to
             print(f"  Location: {seller['location']}")
             print(f"  📱 Mobile: {seller['contact']['mobile']}")
             
-            # Calculate and log contact URLs
-            contact_urls = {}
-            
-            # Website
-            if seller['contact'].get('website'):
-                website_url = seller['contact']['website']
-                if not (website_url.startswith('http') or website_url.startswith('https')):
-                    website_url = f"https://{website_url}"
-                contact_urls['website'] = website_url
+            # Log contact URLs calculated by parse_seller
+            contact_urls = seller.setdefault('contact_urls', build_contact_urls(seller['contact']))
+            if contact_urls.get('website'):
                 print(f"  🌐 Website: {contact_urls['website']}")
-            
-            # Facebook
-            if seller['contact'].get('facebook'):
-                facebook_url = seller['contact']['facebook']
-                if not ('facebook.com' in facebook_url or '.com' in facebook_url or '.co.th' in facebook_url or facebook_url.startswith('http') or facebook_url.startswith('https')):
-                    facebook_url = f"https://www.facebook.com/{facebook_url}"
-                contact_urls['facebook'] = facebook_url
+            if contact_urls.get('facebook'):
                 print(f"  📘 Facebook: {contact_urls['facebook']}")
-            
-            # Instagram
-            if seller['contact'].get('instagram'):
-                instagram_url = seller['contact']['instagram']
-                if not ('instagram.com' in instagram_url or '.com' in instagram_url or '.co.th' in instagram_url or instagram_url.startswith('http') or instagram_url.startswith('https')):
-                    instagram_url = f"https://www.instagram.com/{instagram_url}"
-                contact_urls['instagram'] = instagram_url
+            if contact_urls.get('instagram'):
                 print(f"  📷 Instagram: {contact_urls['instagram']}")
-            
-            # Line
-            if seller['contact'].get('line'):
-                contact_urls['line'] = f"https://line.me/ti/p/{seller['contact']['line']}"
+            if contact_urls.get('line'):
                 print(f"  💬 Line: {contact_urls['line']}")
             
-            # Add calculated URLs to seller data
-            seller['contact_urls'] = contact_urls
-            
             print(f"  🏠 Number of rooms: {len(seller['rooms'])}")
             print(f"  📸 Number of images: {len(seller['images'])}")
         
         print("="*50)
         
-        # Save to cache
-        cache[cache_key] = {
-            'response_data': response_data,
-            'pagination': pagination,
-            'all_sellers_info': all_sellers_info
-        }
-        save_cache(cache)
-        print(f"API data cached to {CACHE_FILE} (key={cache_key})")
+        # Save to cache, partial results are returned but not cached so the next run refetches them
+        if failed_pages:
+            print(f"⚠️ {len(failed_pages)} page(s) failed ({failed_pages}), result not cached. "
+                  f"Fetched pages are checkpointed, run again to fetch only the missing ones")
+        else:
+            save_query(cache, cache_key, response_data, pagination, all_sellers_info)
+            print(f"API data cached to {CACHE_FILE} (key={cache_key})")
         
         # Return the data for use in other modules
         return response_data, pagination, all_sellers_info
@@ -244,6 +596,352 @@ def call_api(provinces=None, business_types=None, limit=20, api_url=None, api_to
         print(f"Exception occurred: {e}")
         return None, None, None
 
+def iter_sellers(provinces=None, business_types=None, limit=20, api_url=None, api_token=None, business_category=None,
+                 max_workers=MAX_CONCURRENT_REQUESTS, requests_per_second=REQUESTS_PER_SECOND, rate_limiter=None):
+    """
+    Yield normalized sellers page by page instead of collecting them first.
+    
+    The query is split into the same (province, business type) cells as
+    fetch_sellers. Cached cells are yielded from the cache and the rest are
+    streamed page by page while later pages are still being fetched, so a
+    consumer such as create_sellers_map_with_target can work on early pages
+    without waiting for the last one. A cell whose pages all arrived is
+    cached like call_api caches it; after a failed page the fetched pages
+    stay checkpointed, so a later run fetches only the missing ones.
+    Sellers already yielded are skipped by id.
+    
+    Args:
+        provinces (list): List of province names to search (empty = all provinces)
+        business_types (list): List of business type codes (required)
+        limit (int): Number of items per page (default: 20)
+        api_url (str): API endpoint URL (required)
+        api_token (str): API authentication token (required)
+        business_category (str): Business category like 'accommodation' or 'restaurant' (required)
+        max_workers (int): Maximum number of page requests in flight (default: 4)
+        requests_per_second (float): Request start budget (default: 2.0, None disables)
+        rate_limiter (RateLimiter): Shared limiter to use instead of one built from requests_per_second
+    
+    Yields:
+        dict: seller_info dictionaries, in the same shape call_api returns
+    """
+    rate_limiter = rate_limiter or RateLimiter(requests_per_second, max_in_flight=max_workers)
+    cache = load_cache()
+    seen_ids = set()
+    
+    for province, business_type in get_query_cells(provinces, business_types):
+        cell_provinces = [province] if province else []
+        headers, body_template = build_request(cell_provinces, [business_type], limit, api_url, api_token, business_category)
+        cache_key = get_cache_key(cell_provinces, [business_type], limit)
+        
+        cached = load_entry(cache, cache_key, 'query')
+        if cached is not None:
+            print(f"[CACHE] Streaming cell {province or 'all provinces'} x {business_type} from cache")
+            page_sellers = [cached['all_sellers_info']]
+        else:
+            print(f"[API] Streaming cell {province or 'all provinces'} x {business_type} from API...")
+            page_sellers = stream_query_pages(
+                cache, cache_key, api_url, headers, body_template, business_category, max_workers, rate_limiter
+            )
+        
+        try:
+            for sellers in page_sellers:
+                for seller in sellers:
+                    seller_id = seller.get('id')
+                    if seller_id is not None:
+                        if seller_id in seen_ids:
+                            continue
+                        seen_ids.add(seller_id)
+                    yield seller
+        except ApiRequestError as e:
+            print(f"Cell {province or 'all provinces'} x {business_type} failed: {e}")
+
+def get_query_cells(provinces, business_types):
+    """
+    Split a query into (province, business_type) cells, each cached on its own.
+    
+    Args:
+        provinces (list): Province names (None or empty = all provinces, one cell per business type)
+        business_types (list): Business type codes
+    
+    Returns:
+        list: Sorted (province, business_type) tuples, province is None when not filtering by province
+    """
+    provinces, business_types = normalize_query(provinces, business_types)
+    return [(province, business_type) for province in (provinces or [None]) for business_type in business_types]
+
+def merge_sellers(seller_lists):
+    """
+    Merge seller lists, keeping the first occurrence of each seller id.
+    
+    Args:
+        seller_lists (list): Lists of seller_info dictionaries
+    
+    Returns:
+        list: Deduplicated sellers in their original order
+    """
+    merged = []
+    seen_ids = set()
+    for sellers in seller_lists:
+        for seller in sellers:
+            seller_id = seller.get('id')
+            if seller_id is not None:
+                if seller_id in seen_ids:
+                    continue
+                seen_ids.add(seller_id)
+            merged.append(seller)
+    return merged
+
+def fetch_sellers(provinces=None, business_types=None, limit=20, api_url=None, api_token=None, business_category=None,
+                  max_workers=MAX_CONCURRENT_REQUESTS, requests_per_second=REQUESTS_PER_SECOND, rate_limiter=None,
+                  refresh=False):
+    """
+    Fetch sellers for a query by splitting it into (province, business type) cells.
+    
+    Each cell is fetched and cached by call_api on its own, so a query that
+    overlaps earlier ones (reordered, or with one more province) only fetches
+    the cells that are not cached yet. Results are merged and deduplicated by id.
+    
+    Args:
+        provinces (list): List of province names to search (empty = all provinces)
+        business_types (list): List of business type codes (required)
+        limit (int): Number of items per page (default: 20)
+        api_url (str): API endpoint URL (required)
+        api_token (str): API authentication token (required)
+        business_category (str): Business category like 'accommodation' or 'restaurant' (required)
+        max_workers (int): Maximum number of page requests in flight per cell (default: 4)
+        requests_per_second (float): Request start budget (default: 2.0, None disables)
+        rate_limiter (RateLimiter): Shared limiter to use instead of one built from requests_per_second
+        refresh (bool): Fetch every cell again, cached cells are replaced once their new result is complete
+    
+    Returns:
+        tuple: (api_response, pagination, sellers_info) like call_api, api_response is the last cell's
+    """
+    if business_types is None:
+        raise ValueError("business_types is required")
+    
+    cells = get_query_cells(provinces, business_types)
+    cache = load_cache()
+    cached_cells = 0 if refresh else sum(
+        1 for province, business_type in cells
+        if get_cache_key([province] if province else [], [business_type], limit) in cache
+    )
+    print(f"[CELLS] Query split into {len(cells)} province x business type cells: "
+          f"{cached_cells} cached, {len(cells) - cached_cells} to fetch")
+    
+    response_data = None
+    seller_lists = []
+    failed_cells = []
+    total_items = 0
+    for province, business_type in cells:
+        cell_response, cell_pagination, cell_sellers = call_api(
+            provinces=[province] if province else [],
+            business_types=[business_type],
+            limit=limit,
+            api_url=api_url,
+            api_token=api_token,
+            business_category=business_category,
+            max_workers=max_workers,
+            requests_per_second=requests_per_second,
+            rate_limiter=rate_limiter,
+            refresh=refresh
+        )
+        if cell_pagination is None or cell_pagination.get('failedPages'):
+            failed_cells.append([province, business_type])
+        if cell_pagination is None:
+            continue
+        response_data = cell_response
+        seller_lists.append(cell_sellers)
+        total_items += cell_pagination.get('totalItems') or 0
+    
+    all_sellers_info = merge_sellers(seller_lists)
+    pagination = {
+        'totalItems': total_items,
+        'totalSellers': len(all_sellers_info),
+        'cells': len(cells),
+        'cellsFromCache': cached_cells,
+        'failedCells': failed_cells
+    }
+    print(f"[CELLS] Merged {len(all_sellers_info)} unique sellers from {len(cells)} cells")
+    if failed_cells:
+        print(f"⚠️ {len(failed_cells)} cell(s) incomplete: {failed_cells}")
+    return response_data, pagination, all_sellers_info
+
+def fetch_categories(category_queries, provinces=None, api_url=None, api_token=None,
+                     max_workers=MAX_CONCURRENT_REQUESTS, requests_per_second=REQUESTS_PER_SECOND, refresh=False):
+    """
+    Fetch several category queries concurrently under one shared rate limit.
+    
+    Categories are independent, so they run side by side and the total time
+    approaches the slowest category instead of the sum of all of them.
+    
+    Args:
+        category_queries (list): Dicts with 'business_category', 'business_types' and optional 'limit' (default: 20)
+        provinces (list): List of province names to search for every category
+        api_url (str): API endpoint URL (required)
+        api_token (str): API authentication token (required)
+        max_workers (int): Maximum number of requests in flight across all categories (default: 4)
+        requests_per_second (float): Request start budget shared by all categories (default: 2.0, None disables)
+        refresh (bool): Fetch cached queries again, e.g. for a scheduled data refresh
+    
+    Returns:
+        tuple: (sellers_info, category_results) with the merged sellers and a dict of
+               business_category -> (api_response, pagination, sellers_info)
+    """
+    if not category_queries:
+        return [], {}
+    
+    rate_limiter = RateLimiter(requests_per_second, max_in_flight=max_workers)
+    category_results = {}
+    started = time.perf_counter()
+    print(f"Fetching {len(category_queries)} categories concurrently: "
+          f"{', '.join(query['business_category'] for query in category_queries)}")
+    
+    with ThreadPoolExecutor(max_workers=len(category_queries)) as executor:
+        futures = {
+            executor.submit(
+                fetch_sellers,
+                provinces=provinces,
+                business_types=query['business_types'],
+                limit=query.get('limit', 20),
+                api_url=api_url,
+                api_token=api_token,
+                business_category=query['business_category'],
+                max_workers=max_workers,
+                rate_limiter=rate_limiter,
+                refresh=refresh
+            ): query['business_category']
+            for query in category_queries
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            business_category = futures[future]
+            try:
+                category_results[business_category] = future.result()
+            except Exception as e:
+                print(f"[{business_category}] Failed: {e}")
+                category_results[business_category] = (None, None, None)
+            sellers = category_results[business_category][2] or []
+            print(f"[{business_category}] Done: {len(sellers)} sellers after {time.perf_counter() - started:.2f}s "
+                  f"({done}/{len(category_queries)} categories complete)")
+    
+    # Merge in the order the categories were given
+    sellers_info = merge_sellers(
+        category_results[query['business_category']][2] or [] for query in category_queries
+    )
+    print(f"Fetched {len(sellers_info)} sellers from {len(category_queries)} categories "
+          f"in {time.perf_counter() - started:.2f}s")
+    return sellers_info, category_results
+
+def load_cached_categories(category_queries, provinces=None):
+    """
+    Sellers of several category queries from the cache alone, without calling the API.
+    
+    Reads the same (province, business type) cells fetch_categories caches,
+    so the result matches what fetch_categories would return from a warm cache.
+    
+    Args:
+        category_queries (list): Dicts with 'business_category', 'business_types' and optional 'limit' (default: 20)
+        provinces (list): List of province names to search for every category
+    
+    Returns:
+        tuple: (sellers_info, missing) with the merged sellers and the (business_category, province, business_type)
+               cells that are not cached
+    """
+    cache = load_cache()
+    seller_lists = []
+    missing = []
+    for query in category_queries:
+        for province, business_type in get_query_cells(provinces, query['business_types']):
+            cache_key = get_cache_key([province] if province else [], [business_type], query.get('limit', 20))
+            cached = load_entry(cache, cache_key, 'query')
+            if cached is None:
+                missing.append((query['business_category'], province, business_type))
+            else:
+                seller_lists.append(cached['all_sellers_info'])
+    return merge_sellers(seller_lists), missing
+
+def iter_categories(category_queries, provinces=None, api_url=None, api_token=None,
+                    max_workers=MAX_CONCURRENT_REQUESTS, requests_per_second=REQUESTS_PER_SECOND,
+                    buffer_size=STREAM_BUFFER):
+    """
+    Stream sellers of several categories as they arrive, for a fetch/render pipeline.
+    
+    Each category runs iter_sellers in its own thread under one shared rate
+    limit and feeds a bounded queue, so fetching continues while the consumer
+    works and at most buffer_size sellers wait in memory.
+    
+    Args:
+        category_queries (list): Dicts with 'business_category', 'business_types' and optional 'limit' (default: 20)
+        provinces (list): List of province names to search for every category
+        api_url (str): API endpoint URL (required)
+        api_token (str): API authentication token (required)
+        max_workers (int): Maximum number of requests in flight across all categories (default: 4)
+        requests_per_second (float): Request start budget shared by all categories (default: 2.0, None disables)
+        buffer_size (int): Maximum sellers waiting for the consumer (default: 200)
+    
+    Yields:
+        dict: seller_info dictionaries in arrival order, deduplicated by id
+    """
+    rate_limiter = RateLimiter(requests_per_second, max_in_flight=max_workers)
+    sellers_queue = queue.Queue(maxsize=max(1, buffer_size))
+    stop = threading.Event()
+    done_marker = object()
+    
+    def produce(query):
+        count = 0
+        try:
+            for seller in iter_sellers(
+                provinces=provinces,
+                business_types=query['business_types'],
+                limit=query.get('limit', 20),
+                api_url=api_url,
+                api_token=api_token,
+                business_category=query['business_category'],
+                max_workers=max_workers,
+                rate_limiter=rate_limiter
+            ):
+                # Wait for room in the queue, giving up if the consumer stopped early
+                while not stop.is_set():
+                    try:
+                        sellers_queue.put(seller, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+                count += 1
+            print(f"[{query['business_category']}] Streamed {count} sellers")
+        except Exception as e:
+            print(f"[{query['business_category']}] Failed: {e}")
+        finally:
+            while True:
+                try:
+                    sellers_queue.put(done_marker, timeout=0.1)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        break
+    
+    producers = [threading.Thread(target=produce, args=(query,), daemon=True) for query in category_queries]
+    for producer in producers:
+        producer.start()
+    
+    seen_ids = set()
+    remaining = len(producers)
+    try:
+        while remaining:
+            seller = sellers_queue.get()
+            if seller is done_marker:
+                remaining -= 1
+                continue
+            seller_id = seller.get('id')
+            if seller_id is not None:
+                if seller_id in seen_ids:
+                    continue
+                seen_ids.add(seller_id)
+            yield seller
+    finally:
+        stop.set()
+
 # if __name__ == "__main__":
 #     # Set UTF-8 encoding for stdout to handle Thai characters
 #     sys.stdout.reconfigure(encoding='utf-8')
@@ -0,0 +1,72 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+def seller_coordinates(sellers):
+    """
+    Return seller coordinates as NumPy arrays.
+
+    Args:
+        sellers: List of seller dictionaries/records, or a SellerBatch (its arrays are used directly)
+
+    Returns:
+        tuple: (latitude, longitude) float64 arrays, NaN where a seller has no location
+    """
+    if hasattr(sellers, 'latitude') and hasattr(sellers, 'longitude'):
+        return sellers.latitude, sellers.longitude
+    count = len(sellers)
+    latitude = np.fromiter(
+        (seller['location']['latitude'] or np.nan for seller in sellers), dtype=np.float64, count=count
+    )
+    longitude = np.fromiter(
+        (seller['location']['longitude'] or np.nan for seller in sellers), dtype=np.float64, count=count
+    )
+    return latitude, longitude
+
+def haversine_km(latitude, longitude, target_lat, target_lon):
+    """
+    Great-circle distance in kilometres from every point to the target, in one vectorized pass.
+
+    Args:
+        latitude (np.ndarray or float): Latitudes in degrees
+        longitude (np.ndarray or float): Longitudes in degrees
+        target_lat (float): Target latitude in degrees
+        target_lon (float): Target longitude in degrees
+
+    Returns:
+        np.ndarray or float: Distances in km (NaN where a coordinate is NaN)
+    """
+    lat1 = np.radians(latitude)
+    lon1 = np.radians(longitude)
+    lat2 = np.radians(target_lat)
+    lon2 = np.radians(target_lon)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def distances_to_target(sellers, target_lat, target_lon):
+    """
+    Distance in km from every seller to the target.
+
+    Args:
+        sellers: List of seller dictionaries/records, or a SellerBatch
+        target_lat (float): Target latitude
+        target_lon (float): Target longitude
+
+    Returns:
+        np.ndarray: Distances in the order of sellers, NaN for sellers without a location
+    """
+    latitude, longitude = seller_coordinates(sellers)
+    return haversine_km(latitude, longitude, target_lat, target_lon)
+
+def nearest_indices(distances, k):
+    """
+    Indices of the k smallest distances, nearest first.
+
+    Uses argpartition, so only the k selected distances are sorted.
+    """
+    valid = np.flatnonzero(~np.isnan(distances))
+    k = min(k, len(valid))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = valid[np.argpartition(distances[valid], k - 1)[:k]]
+    return candidates[np.argsort(distances[candidates], kind='stable')]
@@ -2,7 +2,9 @@ import folium
 import webbrowser
 import os
 
-def create_google_maps(latitude, longitude, zoom_start=15):
+from tile_cache import tile_url
+
+def create_google_maps(latitude, longitude, zoom_start=15, tile_proxy=None):
     """
     Create Google Maps with multiple tile layers for the given coordinates.
     
@@ -10,6 +12,7 @@ def create_google_maps(latitude, longitude, zoom_start=15):
         latitude (float): Latitude coordinate
         longitude (float): Longitude coordinate
         zoom_start (int): Initial zoom level (default: 15)
+        tile_proxy (str): Load the tiles through this tile_cache proxy (default: from Google)
     """
     
     print(f"Creating Google Maps for coordinates: {latitude}, {longitude}")
@@ -18,7 +21,7 @@ def create_google_maps(latitude, longitude, zoom_start=15):
     google_map = folium.Map(
         location=[latitude, longitude], 
         zoom_start=zoom_start,
-        tiles='https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}',
+        tiles=tile_url('m', tile_proxy),
         attr='Google Maps'
     )
     
@@ -32,21 +35,21 @@ def create_google_maps(latitude, longitude, zoom_start=15):
     
     # Add satellite view option
     folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
+        tiles=tile_url('s', tile_proxy),
         attr='Google Satellite',
         name='🛰️ Satellite'
     ).add_to(google_map)
     
     # Add terrain view option
     folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}',
+        tiles=tile_url('p', tile_proxy),
         attr='Google Terrain',
         name='🗺️ Terrain'
     ).add_to(google_map)
     
     # Add hybrid view option (satellite with labels)
     folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}',
+        tiles=tile_url('y', tile_proxy),
         attr='Google Hybrid',
         name='🛰️ Hybrid (Satellite + Labels)'
     ).add_to(google_map)
@@ -103,7 +106,7 @@ def create_google_maps(latitude, longitude, zoom_start=15):
     
     return google_map
 
-def create_satellite_map(latitude, longitude, zoom_start=15):
+def create_satellite_map(latitude, longitude, zoom_start=15, tile_proxy=None):
     """
     Create a satellite-only map for the given coordinates.
     
@@ -111,6 +114,7 @@ def create_satellite_map(latitude, longitude, zoom_start=15):
         latitude (float): Latitude coordinate
         longitude (float): Longitude coordinate
         zoom_start (int): Initial zoom level (default: 15)
+        tile_proxy (str): Load the tiles through this tile_cache proxy (default: from Google)
     """
     
     print(f"Creating satellite map for coordinates: {latitude}, {longitude}")
@@ -119,7 +123,7 @@ def create_satellite_map(latitude, longitude, zoom_start=15):
     satellite_map = folium.Map(
         location=[latitude, longitude], 
         zoom_start=zoom_start,
-        tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
+        tiles=tile_url('s', tile_proxy),
         attr='Google Satellite'
     )
     
@@ -20,11 +20,13 @@ load_dotenv()
 API_URL = os.getenv('API_URL')
 API_TOKEN = os.getenv('API_TOKEN')
 
-# Validate required environment variables
-if not API_URL:
-    raise ValueError("API_URL not found in .env file")
-if not API_TOKEN:
-    raise ValueError("API_TOKEN not found in .env file")
+# Validate required environment variables (called by the commands that talk to the API,
+# so importing this file for its settings works without them)
+def require_api_config(api_url=API_URL, api_token=API_TOKEN):
+    if not api_url:
+        raise ValueError("API_URL not found in .env file")
+    if not api_token:
+        raise ValueError("API_TOKEN not found in .env file")
 
 # 🎯 TARGET LOCATION (Your desired location)
 TARGET_LATITUDE = 14.4428927
@@ -53,9 +55,51 @@ RESTAURANT_TYPES = [
 ]
 
 
+# ⚡ FETCH CONCURRENCY
+MAX_CONCURRENT_REQUESTS = 4   # Requests in flight at once across all categories and pages
+REQUESTS_PER_SECOND = 2       # Request budget shared by all categories and pages
+
+
 # 🗺️ MAP SETTINGS
 MAP_ZOOM_START = 10       # Initial zoom level (1-18)
 OUTPUT_FILENAME = "sellers_with_target_map.html"  # Output HTML file name
+STREAM_RENDER = False     # Add markers while later pages are still being fetched
+COMPACT_SELLERS = False   # Keep sellers as compact records instead of nested dicts (large pulls)
+MAX_RADIUS_KM = None      # Only show sellers within this distance of the target (None = no limit)
+NEAREST_LIST_SIZE = 10    # Sellers listed in the "Nearest to target" panel (0 = no panel)
+RENDER_MODE = 'markers'   # 'markers' (one marker per seller), 'cluster' (client-side clustering, for thousands of sellers) or 'geojson' (canvas circles, for tens of thousands)
+LAZY_POPUPS = False       # Build popups in the browser when opened instead of inlining every popup's HTML
+POPUP_SIDECAR = False     # With LAZY_POPUPS, keep the popup data in a separate <map>_popups.js file next to the map
+INCREMENTAL = False       # Keep a manifest next to the map: re-render only changed sellers and skip writing an unchanged map
+THUMBNAILS = False        # Show popup images from local thumbnails (cached in thumbnails/) instead of the full remote images
+OPEN_BROWSER = True       # Open the map in the default browser (False on headless machines)
+
+# 🧱 TILE CACHE
+TILE_CACHE = False                        # Load map tiles through the local tile cache (start it with `python tile_cache.py serve`)
+TILE_PROXY_URL = 'http://127.0.0.1:8766'  # Tile proxy the maps point at when TILE_CACHE is on
+PREWARM_TILE_ZOOMS = None                 # e.g. (8, 14): fetch the tiles around the sellers for these zooms before the map is made
+
+# 🖥️ MAP SERVER
+SERVE_MAP = False         # Serve the map locally and load only the sellers in view, instead of writing one static HTML file
+SERVER_HOST = '127.0.0.1' # Address the map server listens on ('0.0.0.0' to reach it from other machines)
+SERVER_PORT = 8765        # Port of the map server
+
+# 📦 COLUMNAR EXPORT
+EXPORT_DIR = None         # e.g. 'sellers_export': after fetching, write sellers, rooms and images as columnar tables for analytics
+EXPORT_FORMAT = None      # 'arrow' (memory-mapped on load), 'parquet' or 'csv' (None = arrow when pyarrow is installed, else csv)
+
+# 🕓 SNAPSHOTS
+SNAPSHOTS = False         # Store every fetch as a timestamped snapshot in seller_snapshots.sqlite (unchanged sellers are stored once)
+CHANGES_FILE = None       # e.g. 'changes.jsonl': with SNAPSHOTS, write the sellers added, removed and changed since the previous snapshot
+CHANGES_MAP = None        # e.g. 'changes_map.html': with SNAPSHOTS, also map only the added, removed and changed sellers
+
+# 📈 METRICS
+METRICS_FILE = None            # e.g. 'metrics.jsonl': write per-stage spans, latency histograms and run totals as JSON lines
+METRICS_PROMETHEUS_FILE = None # e.g. 'metrics.prom': also write the histograms and counters as Prometheus text
+
+# 🗂️ BATCH MAPS
+TARGETS_FILE = None       # JSON/CSV file of targets (name, latitude, longitude, zoom, radius_km, output): one map per target from one fetch
+BATCH_PROCESSES = None    # Processes rendering the batch maps (None = one per CPU)
 
 # =============================================================================
 # MAIN EXECUTION
@@ -67,9 +111,42 @@ ACCOMMODATION_LIMIT = 20  # Number of accommodation results to fetch
 RESTAURANT_LIMIT = 20     # Number of restaurant results to fetch
 
 if __name__ == "__main__":
-    # Import the main functionality from run_maps.py
-    from run_maps import create_sellers_map_with_target, save_and_open_map
-    from fetch_data import call_api
+    # The map code (folium, NumPy) is imported once there is something to render, so fetching starts sooner
+    from fetch_data import fetch_categories, iter_categories
+    from metrics import METRICS, span
+    import argparse
+    import atexit
+    from contextlib import nullcontext
+    
+    parser = argparse.ArgumentParser(description="Fetch the sellers and create the sellers map")
+    parser.add_argument('--profile', nargs='?', const='profiles', metavar='DIR',
+                        help="profile the fetch, render and save stages, reports go to DIR (default: profiles)")
+    parser.add_argument('--flamegraph', action='store_true',
+                        help="with --profile, also write a collapsed-stack file per stage for flamegraph tools")
+    parser.add_argument('--no-open', action='store_true', help="do not open the map in a browser (headless runs)")
+    args = parser.parse_args()
+    
+    require_api_config()
+    open_browser = OPEN_BROWSER and not args.no_open
+    
+    # cProfile/tracemalloc per stage, only imported and switched on with --profile
+    def stage(name):
+        return nullcontext()
+    if args.profile:
+        from profiling import StageProfiler
+        profiler = StageProfiler(args.profile, collapsed=args.flamegraph)
+        stage = profiler.stage
+        atexit.register(profiler.close)
+    
+    # Per-stage timings, written when the run ends however it ends
+    if METRICS_FILE:
+        def report_metrics():
+            METRICS.summary()
+            METRICS.write_report(METRICS_FILE, METRICS_PROMETHEUS_FILE)
+            print(f"[METRICS] Report written to {METRICS_FILE}"
+                  + (f" and {METRICS_PROMETHEUS_FILE}" if METRICS_PROMETHEUS_FILE else ""))
+        
+        atexit.register(report_metrics)
     
     print("=" * 60)
     print("🗺️ SELLERS MAP GENERATOR")
@@ -81,61 +158,223 @@ if __name__ == "__main__":
     print(f"🍽️ Restaurant Types: {len(RESTAURANT_TYPES)} types")
     print("=" * 60)
     
-    # Fetch accommodation data
+    # One query per category, add more dicts here to fetch future categories alongside these
+    category_queries = []
     if ACCOMMODATION_TYPES:
-        print("🏨 Fetching accommodation data...")
-        accommodation_response, accommodation_pagination, accommodation_sellers = call_api(
-            provinces=SEARCH_PROVINCES,
-            business_types=ACCOMMODATION_TYPES,
-            limit=ACCOMMODATION_LIMIT,
-            api_url=API_URL,
-            api_token=API_TOKEN,
-            business_category='accommodation'
-        )
+        category_queries.append({
+            'business_category': 'accommodation',
+            'business_types': ACCOMMODATION_TYPES,
+            'limit': ACCOMMODATION_LIMIT
+        })
+    if RESTAURANT_TYPES:
+        category_queries.append({
+            'business_category': 'restaurant',
+            'business_types': RESTAURANT_TYPES,
+            'limit': RESTAURANT_LIMIT
+        })
+    else:
+        print("🍽️ Skipping restaurant data (no restaurant types defined)")
     
-    # Initialize variables for restaurant data
-    restaurant_response = None
-    restaurant_pagination = None
-    restaurant_sellers = None
+    # Map tiles through the local tile cache instead of straight from Google
+    tile_proxy = TILE_PROXY_URL if TILE_CACHE else None
     
-    # Fetch restaurant data only if restaurant types are defined
-    if RESTAURANT_TYPES:
-        print("📥 Fetching restaurant data...")
-        restaurant_response, restaurant_pagination, restaurant_sellers = call_api(
+    # Fragments of the last run, reused for unchanged sellers
+    manifest = None
+    if INCREMENTAL and not TARGETS_FILE and not SERVE_MAP:
+        from render_manifest import RenderManifest
+        manifest = RenderManifest(OUTPUT_FILENAME)
+    
+    if STREAM_RENDER and not TARGETS_FILE and not SERVE_MAP:
+        # Pipeline mode: the map consumes sellers while the fetch threads keep going
+        print("\n🗺️ Creating interactive map while fetching seller data...")
+        from run_maps import create_sellers_map_with_target, save_and_open_map
+        sellers_stream = iter_categories(
+            category_queries,
             provinces=SEARCH_PROVINCES,
-            business_types=RESTAURANT_TYPES,
-            limit=RESTAURANT_LIMIT,
             api_url=API_URL,
             api_token=API_TOKEN,
-            business_category='restaurant'
+            max_workers=MAX_CONCURRENT_REQUESTS,
+            requests_per_second=REQUESTS_PER_SECOND
         )
+        if COMPACT_SELLERS:
+            from seller_record import SellerRecord
+            sellers_stream = (SellerRecord.from_dict(seller) for seller in sellers_stream)
+        with stage('fetch_render'):
+            google_map = create_sellers_map_with_target(
+                sellers_stream,
+                TARGET_LATITUDE,
+                TARGET_LONGITUDE,
+                zoom_start=MAP_ZOOM_START,
+                max_radius_km=MAX_RADIUS_KM,
+                nearest_count=NEAREST_LIST_SIZE,
+                render_mode=RENDER_MODE,
+                lazy_popups=LAZY_POPUPS,
+                popup_data_file=os.path.splitext(OUTPUT_FILENAME)[0] + '_popups.js' if POPUP_SIDECAR else None,
+                manifest=manifest,
+                tile_proxy=tile_proxy
+            )
     else:
-        print("🍽️ Skipping restaurant data (no restaurant types defined)")
-    
-    # Combine all sellers
-    sellers_info = []
-    if accommodation_sellers:
-        sellers_info.extend(accommodation_sellers)
-    if restaurant_sellers:
-        sellers_info.extend(restaurant_sellers)
-    
-    if not sellers_info:
-        print("❌ No seller data available. Please check your configuration.")
-        exit(1)
-    
-    print(f"✅ Found {len(sellers_info)} total sellers")
-    
-    # Create and save the map
-    print("\n🗺️ Creating interactive map...")
-    google_map = create_sellers_map_with_target(
-        sellers_info, 
-        TARGET_LATITUDE, 
-        TARGET_LONGITUDE, 
-        zoom_start=MAP_ZOOM_START
-    )
+        # Fetch all categories concurrently under one shared rate limit
+        print("📥 Fetching seller data...")
+        with span('fetch'), stage('fetch'):
+            sellers_info, category_results = fetch_categories(
+                category_queries,
+                provinces=SEARCH_PROVINCES,
+                api_url=API_URL,
+                api_token=API_TOKEN,
+                max_workers=MAX_CONCURRENT_REQUESTS,
+                requests_per_second=REQUESTS_PER_SECOND
+            )
+        
+        if not sellers_info:
+            print("❌ No seller data available. Please check your configuration.")
+            exit(1)
+        
+        print(f"✅ Found {len(sellers_info)} total sellers")
+        
+        # Snapshot of this fetch and what changed since the last one, taken before the sellers are compacted
+        if SNAPSHOTS:
+            # An incomplete fetch would show its missing sellers as removed, so it is not snapshotted
+            incomplete = [
+                business_category for business_category, (_, pagination, _) in category_results.items()
+                if pagination is None or pagination.get('failedCells')
+            ]
+            if incomplete:
+                print(f"⚠️ Incomplete categories ({', '.join(incomplete)}), no snapshot taken")
+            else:
+                from snapshots import snapshot_and_diff
+                with span('snapshot'):
+                    snapshot_and_diff(
+                        sellers_info,
+                        label=f"{', '.join(query['business_category'] for query in category_queries)} / "
+                              f"{', '.join(SEARCH_PROVINCES) or 'all provinces'}",
+                        changes_file=CHANGES_FILE,
+                        changes_map=CHANGES_MAP,
+                        target=(TARGET_LATITUDE, TARGET_LONGITUDE),
+                        zoom_start=MAP_ZOOM_START,
+                        render_mode=RENDER_MODE,
+                        lazy_popups=LAZY_POPUPS,
+                        tile_proxy=tile_proxy
+                    )
+        
+        # Normalized seller/room/image tables, read by analytics jobs and `cli.py render --from-export`
+        if EXPORT_DIR:
+            from seller_export import export_sellers
+            with span('export'):
+                export_sellers(sellers_info, EXPORT_DIR, EXPORT_FORMAT)
+        
+        if COMPACT_SELLERS:
+            from seller_record import compact_sellers
+            sellers_info = compact_sellers(sellers_info)
+        
+        from run_maps import create_sellers_map_with_target, save_and_open_map
+        
+        # Spatial index over the sellers, reused from disk while the seller coordinates are unchanged
+        from spatial_index import load_or_build_index
+        with span('spatial_index'), stage('index'):
+            seller_index = load_or_build_index(sellers_info)
+        
+        # Tiles around the sellers, fetched once so the map opens from the local cache
+        tile_cache = None
+        if TILE_CACHE:
+            from tile_cache import TileCache, prewarm_sellers
+            tile_cache = TileCache()
+            if PREWARM_TILE_ZOOMS:
+                prewarm_sellers(tile_cache, sellers_info, PREWARM_TILE_ZOOMS, target=(TARGET_LATITUDE, TARGET_LONGITUDE))
+        
+        if TARGETS_FILE:
+            # Batch mode: every target's map from the sellers fetched above
+            from batch_maps import generate_maps, load_targets
+            targets = load_targets(TARGETS_FILE)
+            print(f"\n🗂️ Creating {len(targets)} maps from {TARGETS_FILE}...")
+            
+            # Thumbnail paths are relative to each map, so they are resolved per output directory (cached after the first)
+            batch_thumbnails = None
+            if THUMBNAILS:
+                from thumbnails import prepare_thumbnails
+                batch_thumbnails = {}
+                for directory in {os.path.dirname(os.path.abspath(target['output'])) for target in targets}:
+                    batch_thumbnails[directory] = prepare_thumbnails(sellers_info, base_dir=directory)
+            
+            with stage('render'):
+                results = generate_maps(
+                    sellers_info,
+                    targets,
+                    spatial_index=seller_index,
+                    thumbnails=batch_thumbnails,
+                    processes=BATCH_PROCESSES,
+                    zoom_start=MAP_ZOOM_START,
+                    max_radius_km=MAX_RADIUS_KM,
+                    nearest_count=NEAREST_LIST_SIZE,
+                    render_mode=RENDER_MODE,
+                    lazy_popups=LAZY_POPUPS,
+                    popup_sidecar=POPUP_SIDECAR,
+                    incremental=INCREMENTAL,
+                    tile_proxy=tile_proxy
+                )
+            failed = [target['name'] for target, _, error in results if error]
+            if failed:
+                print(f"❌ {len(failed)} maps failed: {', '.join(failed)}")
+                exit(1)
+            print(f"\n🎉 {len(results)} maps created successfully")
+            exit(0)
+        
+        if SERVE_MAP:
+            # Server mode: the page asks for the sellers in view, popups are built when opened
+            from map_server import serve
+            
+            # Thumbnails are served from the thumbnail cache in the current directory
+            thumbnails = None
+            if THUMBNAILS:
+                from thumbnails import prepare_thumbnails
+                thumbnails = prepare_thumbnails(sellers_info)
+            
+            print("\n🖥️ Starting the map server...")
+            served = serve(
+                sellers_info,
+                TARGET_LATITUDE,
+                TARGET_LONGITUDE,
+                host=SERVER_HOST,
+                port=SERVER_PORT,
+                open_browser=open_browser,
+                spatial_index=seller_index,
+                zoom_start=MAP_ZOOM_START,
+                max_radius_km=MAX_RADIUS_KM,
+                nearest_count=NEAREST_LIST_SIZE,
+                thumbnails=thumbnails,
+                tile_cache=tile_cache
+            )
+            exit(0 if served else 1)
+        
+        # Local thumbnails of the popup images, only new images are downloaded and resized
+        thumbnails = None
+        if THUMBNAILS:
+            from thumbnails import prepare_thumbnails
+            with stage('thumbnails'):
+                thumbnails = prepare_thumbnails(sellers_info, base_dir=os.path.dirname(os.path.abspath(OUTPUT_FILENAME)))
+        
+        # Create and save the map
+        print("\n🗺️ Creating interactive map...")
+        with stage('render'):
+            google_map = create_sellers_map_with_target(
+                sellers_info, 
+                TARGET_LATITUDE, 
+                TARGET_LONGITUDE, 
+                zoom_start=MAP_ZOOM_START,
+                max_radius_km=MAX_RADIUS_KM,
+                nearest_count=NEAREST_LIST_SIZE,
+                spatial_index=seller_index,
+                render_mode=RENDER_MODE,
+                lazy_popups=LAZY_POPUPS,
+                popup_data_file=os.path.splitext(OUTPUT_FILENAME)[0] + '_popups.js' if POPUP_SIDECAR else None,
+                thumbnails=thumbnails,
+                manifest=manifest,
+                tile_proxy=tile_proxy
+            )
     
     if google_map:
-        save_and_open_map(google_map, OUTPUT_FILENAME)
+        with stage('save'):
+            save_and_open_map(google_map, OUTPUT_FILENAME, manifest, open_browser=open_browser)
         print(f"\n🎉 Map created successfully: {OUTPUT_FILENAME}")
     else:
         print("❌ Failed to create map") 
\ No newline at end of file
@@ -0,0 +1,310 @@
+import gzip
+import json
+import os
+import posixpath
+import threading
+import time
+import webbrowser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from geo import haversine_km
+from popups import build_seller_popup_data, build_seller_tooltip
+from run_maps import SellerMarkerLayer, create_sellers_map_with_target
+from spatial_index import SpatialIndex
+from tile_cache import send_tile
+
+# Address the map server listens on, 127.0.0.1 keeps it local to this machine
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+
+# Viewports with more sellers than this are answered with grid clusters instead of single sellers
+MAX_VIEWPORT_SELLERS = 2000
+
+# Cluster grid cell size on screen, in px at the requested zoom
+CLUSTER_CELL_PIXELS = 80
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+# Popup images under these URL paths are served from the local thumbnail cache
+STATIC_PREFIXES = ('/thumbnails/',)
+
+class SellerViewport:
+    """
+    Answers the map page's viewport queries from one seller dataset.
+
+    Every seller's row (position, category, tooltip, number) is encoded
+    once up front; a query looks up the sellers in the bounding box through
+    the spatial index and joins their rows. Sellers are numbered like on a
+    static map, so the numbers match the nearest-sellers panel.
+
+    Args:
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+        target_lat (float): Target latitude, distances in tooltips and popups are measured from it
+        target_lon (float): Target longitude
+        spatial_index (SpatialIndex): Index over sellers_info (default: built here)
+        max_radius_km (float): Only serve sellers within this distance of the target (default: no limit)
+        thumbnails (dict): Local image thumbnails from thumbnails.prepare_thumbnails (optional)
+    """
+
+    def __init__(self, sellers_info, target_lat, target_lon, spatial_index=None, max_radius_km=None, thumbnails=None):
+        self.sellers_info = sellers_info
+        self.index = spatial_index or SpatialIndex.from_sellers(sellers_info)
+        self.thumbnails = thumbnails
+        self.distances = haversine_km(self.index.latitude, self.index.longitude, target_lat, target_lon)
+        if max_radius_km is not None:
+            self.served = np.flatnonzero(self.distances <= max_radius_km)
+        else:
+            self.served = np.arange(len(sellers_info))
+
+        # Seller id -> number shown on the map (0 = not served)
+        self.numbers = np.zeros(len(sellers_info), dtype=np.int64)
+        self.numbers[self.served] = np.arange(1, len(self.served) + 1)
+
+        encode = SellerMarkerLayer.encode_row
+        self.rows = {}
+        for seller_id in self.served.tolist():
+            seller = sellers_info[seller_id]
+            lat = seller['location']['latitude']
+            lon = seller['location']['longitude']
+            if not (lat and lon):
+                continue
+            number = int(self.numbers[seller_id])
+            tooltip = build_seller_tooltip(seller, number, float(self.distances[seller_id]))
+            is_restaurant = seller.get('business_category') == 'restaurant'
+            self.rows[int(seller_id)] = f'[{encode(lat)},{encode(lon)},{1 if is_restaurant else 0},{encode(tooltip)},{number}]'
+
+    def query(self, min_lon, min_lat, max_lon, max_lat, zoom):
+        """
+        Sellers inside a bounding box, clustered on a screen grid when there are too many.
+
+        Args:
+            min_lon (float): West edge
+            min_lat (float): South edge
+            max_lon (float): East edge
+            max_lat (float): North edge
+            zoom (int): Map zoom, sets the cluster grid size
+
+        Returns:
+            str: JSON {"sellers": rows, "clusters": [[lat, lon, count], ...], "total": sellers in the box}
+        """
+        ids = self.index.bbox(min_lat, min_lon, max_lat, max_lon)
+        ids = ids[self.numbers[ids] > 0]
+        clusters = []
+        if len(ids) > MAX_VIEWPORT_SELLERS:
+            # One cell is CLUSTER_CELL_PIXELS of the 256 px Web Mercator tiles at this zoom, measured in degrees
+            cell = 360.0 / (256 * 2 ** zoom) * CLUSTER_CELL_PIXELS
+            latitude = self.index.latitude[ids]
+            longitude = self.index.longitude[ids]
+            cells = np.floor(latitude / cell).astype(np.int64) * (1 << 32) + np.floor(longitude / cell).astype(np.int64)
+            _, groups, counts = np.unique(cells, return_inverse=True, return_counts=True)
+            lat_sums = np.bincount(groups, weights=latitude)
+            lon_sums = np.bincount(groups, weights=longitude)
+            clusters = [
+                [round(lat_sum / count, 5), round(lon_sum / count, 5), int(count)]
+                for lat_sum, lon_sum, count in zip(lat_sums, lon_sums, counts)
+                if count > 1
+            ]
+            # Sellers alone in their cell are still shown as sellers
+            ids = ids[counts[groups] == 1]
+        rows = [self.rows[seller_id] for seller_id in ids.tolist() if seller_id in self.rows]
+        total = len(rows) + sum(cluster[2] for cluster in clusters)
+        return (
+            '{"sellers":[' + ','.join(rows) + '],"clusters":'
+            + json.dumps(clusters, separators=(',', ':')) + f',"total":{total}}}'
+        )
+
+    def popup(self, number):
+        """
+        Popup data of the seller with a map number.
+
+        Args:
+            number (int): Seller number from the row
+
+        Returns:
+            str: JSON popup data for renderSellerPopup, or None for an unknown number
+        """
+        if not 1 <= number <= len(self.served):
+            return None
+        seller_id = int(self.served[number - 1])
+        data = build_seller_popup_data(self.sellers_info[seller_id], float(self.distances[seller_id]), self.thumbnails)
+        return SellerMarkerLayer.encode_row(data)
+
+class MapServer(ThreadingHTTPServer):
+    """
+    HTTP server for the base map page and its viewport and popup queries.
+
+    Args:
+        address (tuple): (host, port) to listen on
+        page (str): Base map HTML served at /
+        viewport (SellerViewport): Answers /sellers and /popup
+        static_dir (str): Directory the STATIC_PREFIXES paths are served from (default: current directory)
+        tile_cache (TileCache): Serve the map tiles under /tiles from this cache (optional)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, page, viewport, static_dir='.', tile_cache=None):
+        super().__init__(address, MapRequestHandler)
+        self.page = page.encode('utf-8')
+        self.viewport = viewport
+        self.static_dir = os.path.abspath(static_dir)
+        self.tile_cache = tile_cache
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/':
+            self.send_body(self.server.page, 'text/html; charset=utf-8')
+        elif url.path == '/sellers':
+            try:
+                min_lon, min_lat, max_lon, max_lat = (float(value) for value in params['bbox'].split(','))
+                zoom = min(max(int(params.get('zoom', 10)), 0), 22)
+            except (KeyError, ValueError):
+                self.send_json_error(400, "bbox=west,south,east,north and an integer zoom are required")
+                return
+            self.send_body(self.server.viewport.query(min_lon, min_lat, max_lon, max_lat, zoom))
+        elif url.path == '/popup':
+            try:
+                body = self.server.viewport.popup(int(params['id']))
+            except (KeyError, ValueError):
+                body = None
+            if body is None:
+                self.send_json_error(404, "unknown seller id")
+                return
+            self.send_body(body)
+        elif url.path.startswith('/tiles/') and self.server.tile_cache is not None:
+            send_tile(self, self.server.tile_cache)
+        elif url.path.startswith(STATIC_PREFIXES):
+            self.send_static(url.path)
+        else:
+            self.send_json_error(404, "not found")
+
+    def send_static(self, path):
+        """Serve a file from the static directory, never from outside it."""
+        path = posixpath.normpath(unquote(path))
+        file_path = os.path.join(self.server.static_dir, *path.lstrip('/').split('/'))
+        if not path.startswith(STATIC_PREFIXES) or not os.path.isfile(file_path):
+            self.send_json_error(404, "not found")
+            return
+        content_type = {'.webp': 'image/webp', '.jpg': 'image/jpeg'}.get(os.path.splitext(file_path)[1], 'application/octet-stream')
+        with open(file_path, 'rb') as f:
+            self.send_body(f.read(), content_type, cache=True)
+
+    def send_json_error(self, status, message):
+        self.send_body(json.dumps({'error': message}), status=status)
+
+    def send_body(self, body, content_type='application/json; charset=utf-8', status=200, cache=False):
+        """Send a response, gzip-compressed when the client accepts it and the body is large enough."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        compress = (
+            len(body) >= GZIP_MIN_BYTES and content_type.startswith(('application/json', 'text/'))
+            and 'gzip' in self.headers.get('Accept-Encoding', '')
+        )
+        if compress:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'max-age=86400' if cache else 'no-cache')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def create_map_server(sellers_info, target_lat, target_lon, host=SERVER_HOST, port=SERVER_PORT, spatial_index=None,
+                      zoom_start=10, max_radius_km=None, nearest_count=10, thumbnails=None, static_dir='.',
+                      tile_cache=None):
+    """
+    Build the base map and the seller viewport, and bind a server for them (not started yet).
+
+    The base map is the regular map with the target, nearest-sellers panel
+    and tile layers, but no sellers embedded; the page loads the sellers in
+    view from /sellers and each popup from /popup when it is opened.
+
+    Args:
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+        target_lat (float): Target latitude
+        target_lon (float): Target longitude
+        host (str): Address to listen on (default: 127.0.0.1)
+        port (int): Port to listen on (0 picks a free port)
+        spatial_index (SpatialIndex): Index over sellers_info (default: built here)
+        zoom_start (int): Initial zoom level
+        max_radius_km (float): Only serve sellers within this distance of the target (default: no limit)
+        nearest_count (int): Sellers in the "Nearest to target" panel (0 = no panel)
+        thumbnails (dict): Local thumbnails from thumbnails.prepare_thumbnails with base_dir=static_dir (optional)
+        static_dir (str): Directory the thumbnail files are served from
+        tile_cache (TileCache): Serve the map tiles from this cache instead of the page loading them from Google (optional)
+
+    Returns:
+        MapServer: Bound server, or None if there are no sellers to show
+    """
+    started = time.perf_counter()
+    spatial_index = spatial_index or SpatialIndex.from_sellers(sellers_info)
+    google_map = create_sellers_map_with_target(
+        sellers_info,
+        target_lat,
+        target_lon,
+        zoom_start=zoom_start,
+        max_radius_km=max_radius_km,
+        nearest_count=nearest_count,
+        spatial_index=spatial_index,
+        viewport_url='/sellers',
+        popup_url='/popup',
+        tile_proxy='' if tile_cache is not None else None
+    )
+    if google_map is None:
+        return None
+    viewport = SellerViewport(sellers_info, target_lat, target_lon, spatial_index, max_radius_km, thumbnails)
+    server = MapServer((host, port), google_map.get_root().render(), viewport, static_dir, tile_cache)
+    print(f"[SERVER] {len(viewport.rows)} sellers ready in {time.perf_counter() - started:.2f}s")
+    return server
+
+def serve(sellers_info, target_lat, target_lon, host=SERVER_HOST, port=SERVER_PORT, open_browser=True, **kwargs):
+    """
+    Serve the map until interrupted (Ctrl+C).
+
+    Args:
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+        target_lat (float): Target latitude
+        target_lon (float): Target longitude
+        host (str): Address to listen on (default: 127.0.0.1)
+        port (int): Port to listen on
+        open_browser (bool): Open the map in the default browser (False for headless servers)
+        **kwargs: Further create_map_server arguments
+
+    Returns:
+        bool: False if there were no sellers to serve
+    """
+    server = create_map_server(sellers_info, target_lat, target_lon, host, port, **kwargs)
+    if server is None:
+        return False
+    print(f"[SERVER] Serving the map at {server.url} (Ctrl+C to stop)")
+    if open_browser:
+        webbrowser.open(server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(f"[SERVER] Stopped after {server.requests} requests")
+    return True
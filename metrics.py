@@ -0,0 +1,264 @@
+import bisect
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram buckets (upper bounds), for durations in seconds and for sizes in bytes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+BYTES_BUCKETS = tuple(2 ** power for power in range(10, 27, 2)) + (math.inf,)
+
+# Span events kept for the JSON lines report, older events are dropped past it so a long-running server stays flat
+MAX_SPAN_EVENTS = 100000
+
+# Prefix of the metric names in the Prometheus report
+PROMETHEUS_PREFIX = 'sellers_map_'
+
+class Histogram:
+    """Count, sum, min, max and bucket counts of observed values."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'min': round(self.min, 6) if self.count else None,
+            'max': round(self.max, 6) if self.count else None,
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'buckets': {('+Inf' if bound == math.inf else str(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)}
+        }
+
+class Metrics:
+    """
+    Spans, histograms and counters of one run, reported as JSON lines or Prometheus text.
+
+    A span times a block and observes its duration in the histogram
+    <name>_seconds; spans also keep an event (start, duration, labels,
+    fields set inside the block, enclosing span) for the JSON lines
+    report, the newest max_events of them. Hot paths observe histograms
+    directly, without events.
+
+    Thread-safe: the fetch threads record into the same registry. Worker
+    processes (batch maps, thumbnails) record into their own copy, which
+    is not reported.
+    """
+
+    def __init__(self, max_events=MAX_SPAN_EVENTS):
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._started = time.perf_counter()
+            self.histograms = {}
+            self.counters = {}
+            self.events = deque(maxlen=self.max_events)
+            self.dropped_events = 0
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        """Add a value to the histogram name (bytes buckets for names ending in _bytes, latency buckets otherwise)."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(
+                    BYTES_BUCKETS if name.endswith('_bytes') else LATENCY_BUCKETS
+                )
+            histogram.observe(value)
+
+    def count(self, name, amount=1, **labels):
+        """Add to the counter name."""
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time a block as a span.
+
+        Yields a dictionary; values put into it (bytes, retries, ...) are
+        stored with the span's event.
+
+        Args:
+            name (str): Span name, the duration goes to the histogram <name>_seconds
+            **labels: Labels of the histogram and event (keep them low-cardinality)
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        fields = {}
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        started = time.perf_counter()
+        error = None
+        try:
+            yield fields
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            self.observe(f"{name}_seconds", seconds, **labels)
+            event = {
+                'type': 'span',
+                'name': name,
+                'start': round(started - self._started, 6),
+                'seconds': round(seconds, 6),
+            }
+            if parent:
+                event['parent'] = parent
+            if labels:
+                event['labels'] = labels
+            if fields:
+                event['fields'] = fields
+            if error:
+                event['error'] = error
+            with self._lock:
+                if len(self.events) == self.events.maxlen:
+                    self.dropped_events += 1
+                self.events.append(event)
+
+    def timed(self, name, **labels):
+        """Decorator recording every call of a function as a span."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self):
+        """
+        The run as JSON-serializable records: span events, then one record per histogram and counter, then run totals.
+
+        Returns:
+            list: Records, one per JSON line
+        """
+        with self._lock:
+            records = list(self.events)
+            dropped = self.dropped_events
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        for (name, labels), histogram in histograms:
+            records.append({'type': 'histogram', 'name': name, 'labels': dict(labels), **histogram.to_dict()})
+        for (name, labels), value in counters:
+            records.append({'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value})
+        records.append({
+            'type': 'run',
+            'started': round(self.started, 3),
+            'seconds': round(time.perf_counter() - self._started, 6),
+            'pid': os.getpid(),
+            'spans': sum(1 for record in records if record['type'] == 'span'),
+            'dropped_spans': dropped
+        })
+        return records
+
+    def prometheus(self):
+        """The histograms and counters in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            metric = PROMETHEUS_PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f"{metric}_bucket{label_text(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{metric}_sum{label_text(labels)} {histogram.sum!r}")
+            lines.append(f"{metric}_count{label_text(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            metric = PROMETHEUS_PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{label_text(labels)} {value}")
+        metric = PROMETHEUS_PREFIX + 'run_seconds'
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {time.perf_counter() - self._started!r}")
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path, prometheus_path=None):
+        """
+        Write the JSON lines report, and optionally the Prometheus text report.
+
+        Args:
+            path (str): JSON lines file
+            prometheus_path (str): Prometheus text file, e.g. for the node_exporter textfile collector (optional)
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in self.report():
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        if prometheus_path:
+            temp_path = f"{prometheus_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus())
+            os.replace(temp_path, prometheus_path)
+
+    def summary(self):
+        """Print the slowest stages and the per-page latencies."""
+        with self._lock:
+            histograms = sorted(
+                ((key, histogram) for key, histogram in self.histograms.items() if key[0].endswith('_seconds')),
+                key=lambda item: -item[1].sum
+            )
+            counters = sorted(self.counters.items())
+        print(f"[METRICS] {'stage':<28} {'count':>7} {'total':>9} {'mean':>9} {'max':>9}")
+        for (name, labels), histogram in histograms:
+            label = name[:-len('_seconds')] + ''.join(f" {label_value}" for _, label_value in labels)
+            print(f"[METRICS] {label:<28} {histogram.count:>7} {histogram.sum:>8.3f}s"
+                  f" {histogram.sum / histogram.count * 1000:>7.1f}ms {histogram.max * 1000:>7.1f}ms")
+        for (name, labels), value in counters:
+            label = name + ''.join(f" {label_value}" for _, label_value in labels)
+            print(f"[METRICS] {label:<28} {value:>7}")
+        print(f"[METRICS] run total {time.perf_counter() - self._started:.3f}s")
+
+# Registry of this process, shared by every module
+METRICS = Metrics()
+span = METRICS.span
+observe = METRICS.observe
+count = METRICS.count
+timed = METRICS.timed
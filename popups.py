@@ -0,0 +1,279 @@
+import math
+
+# Contact links shown in a popup, in order: (contact_urls key, link colour, label)
+CONTACT_LINKS = (
+    ('website', '#0066cc', '🌐 Website'),
+    ('facebook', '#1877f2', '📘 Facebook'),
+    ('instagram', '#e4405f', '📷 Instagram'),
+    ('line', '#00b900', '💬 Line'),
+)
+
+# Per-category parts of the popup: title tag with colour and icon, indentation before the contact links
+CATEGORY_STYLES = {
+    'restaurant': ('<h4 style="margin: 0 0 10px 0; color: #00aa00;">🍽️ ', '            '),
+    'accommodation': ('<h4 style="margin: 0 0 10px 0; color: #cc0000;">🏨 ', '                '),
+}
+
+def image_strip_html(urls, width, height, radius, border, indent, alt, sources=None):
+    """
+    Clickable thumbnails that open the big image overlay.
+
+    With sources, each image is shown from its local thumbnail while the
+    overlay still opens the original URL, and broken images are left out.
+
+    Args:
+        urls (list): Image URLs
+        width (int): Thumbnail width in px
+        height (int): Thumbnail height in px
+        radius (int): Border radius in px
+        border (str): Border colour
+        indent (str): Indentation of each <img> tag
+        alt (str): Alt text
+        sources (dict): {url: thumbnail src, None when broken} from thumbnails.prepare_thumbnails (optional)
+
+    Returns:
+        str: <img> tags
+    """
+    if sources is None:
+        images = [(url, url) for url in urls]
+    else:
+        images = [(sources.get(url, url), url) for url in urls if sources.get(url, url) is not None]
+    return ''.join([
+        f"""
+{indent}<img src="{src}" style="width: {width}px; height: {height}px; object-fit: cover; border-radius: {radius}px; border: 1px solid {border}; cursor: pointer;" 
+{indent}     onerror="this.style.display='none';" 
+{indent}     onclick="showBigImage(this, '{url}')" 
+{indent}     onmouseout="hideBigImage()" 
+{indent}     alt="{alt}">
+{indent}"""
+        for src, url in images
+    ])
+
+def contact_links_html(contact_urls):
+    """Links for the contact URLs a seller has, see fetch_data.build_contact_urls."""
+    return ''.join([
+        f"""
+                <p style="margin: 3px 0; font-size: 11px;">
+                    <a href="{contact_urls[key]}" target="_blank" style="color: {color}; text-decoration: none;">
+                        {label} : {contact_urls[key]}
+                    </a>
+                </p>
+                """
+        for key, color, label in CONTACT_LINKS if contact_urls.get(key)
+    ])
+
+def seller_images_html(images, thumbnails=None):
+    """The first 3 seller images, or an empty string without images."""
+    if not images:
+        return ""
+    return f"""
+            <h6 style="margin: 10px 0 5px 0; color: #333;">📸 Seller Images:</h6>
+            <div style="display: flex; flex-wrap: wrap; gap: 5px; margin-bottom: 10px;">
+            {image_strip_html(images[:3], 80, 60, 4, '#ddd', ' ' * 16, 'Seller image', thumbnails and thumbnails['seller'])}</div>"""
+
+def room_card_html(room, thumbnails=None):
+    """Card with a room's name, price, number of rooms and first 2 images."""
+    images_html = ""
+    if room.get('images'):
+        images_html = f"""
+                    <div style="display: flex; flex-wrap: wrap; gap: 3px; margin-top: 5px;">
+                    {image_strip_html(room['images'][:2], 60, 45, 3, '#ccc', ' ' * 24, 'Room image', thumbnails and thumbnails['room'])}</div>"""
+    return f"""
+                <div style="border: 1px solid #ddd;width: 250px; margin: 8px 0; padding: 10px; border-radius: 6px; background: #f9f9f9;">
+                    <p style="margin: 2px 0; font-size: 11px;"><strong>🏠 {room.get('name', 'N/A')}</strong></p>
+                    <p style="margin: 2px 0; font-size: 11px;">💰 Price: {room.get('price', 'N/A')} บาท</p>
+                    <p style="margin: 2px 0; font-size: 11px;">🛏️ Rooms: {room.get('numberOfRoom', 'N/A')}</p>
+                    {images_html}
+                </div>
+                """
+
+def build_seller_popup(seller, distance_km=None, thumbnails=None):
+    """
+    Build the popup HTML for one seller.
+
+    Restaurants and accommodations share one layout built from the partials
+    above, accommodations add their room cards.
+
+    Args:
+        seller (dict): Seller information dictionary
+        distance_km (float): Distance to the target shown in the popup (optional)
+        thumbnails (dict): Local thumbnails from thumbnails.prepare_thumbnails (optional)
+
+    Returns:
+        str: Popup HTML
+    """
+    is_restaurant = seller.get('business_category') == 'restaurant'
+    title_html, links_indent = CATEGORY_STYLES['restaurant' if is_restaurant else 'accommodation']
+
+    # Format address safely to avoid octal escape sequence issues
+    address = seller['address']
+    address_no = str(address['no']).replace('\\', '/') if address['no'] else ''
+    address_moo = str(address['moo']) if address['moo'] else ''
+
+    # Distance to the target, shown below the mobile number
+    distance_html = ""
+    if distance_km is not None and not math.isnan(distance_km):
+        distance_html = f"""<p style="margin: 5px 0; font-size: 12px;"><strong>📏 Distance to target:</strong> {distance_km:.1f} km</p>"""
+
+    # Room cards (only for accommodations)
+    rooms_html = ""
+    if not is_restaurant:
+        rooms = seller['rooms']
+        rooms_html = f"""
+            <hr style="margin: 10px 0; border: 1px solid #ddd;">
+            <h5 style="margin: 10px 0 5px 0; color: #333;">🏠 Available Rooms ({len(rooms)}):</h5>
+            {''.join([room_card_html(room, thumbnails) for room in rooms])}"""
+
+    images = seller['images']
+    return f"""
+            <div style="width: 300px; max-height: 800px; overflow-y: auto;">
+                {title_html}{seller['name_th']}</h4>
+                <p style="margin: 5px 0; font-size: 12px;"><strong>English:</strong> {seller['name_en']}</p>
+                <p style="margin: 5px 0; font-size: 12px;"><strong>Address:</strong> {address_no} หมู่ {address_moo}</p>
+                <p style="margin: 5px 0; font-size: 12px;"><strong>District:</strong> {address['district']}, {address['province']}</p>
+                <p style="margin: 5px 0; font-size: 12px;"><strong>📱 Mobile:</strong> {seller['contact']['mobile']}</p>
+                {distance_html}
+                
+                <!-- Contact Links -->
+                <div style="margin: 10px 0;">
+                    <h6 style="margin: 5px 0; color: #333;">📞 Contact Links:</h6>
+{links_indent}{contact_links_html(seller.get('contact_urls', {}))}
+            </div>
+            
+            <p style="margin: 5px 0; font-size: 12px;"><strong>Images:</strong> {len(images)}</p>
+            {seller_images_html(images, thumbnails)}{rooms_html}
+        </div>
+        """
+
+def build_seller_tooltip(seller, i, distance_km=None):
+    """Tooltip text for a seller marker, e.g. '🏨 #3: name (1.2 km)'."""
+    icon_symbol = '🍽️' if seller.get('business_category') == 'restaurant' else '🏨'
+    distance_label = ""
+    if distance_km is not None and not math.isnan(distance_km):
+        distance_label = f" ({distance_km:.1f} km)"
+    return f"{icon_symbol} #{i}: {seller['name_th']}{distance_label}"
+
+def popup_image_sources(urls, sources):
+    """Image URLs for renderSellerPopup, as [thumbnail src, url] pairs where a thumbnail exists."""
+    if sources is None:
+        return urls
+    return [
+        [sources[url], url] if sources.get(url) else url
+        for url in urls if sources.get(url, url) is not None
+    ]
+
+def build_seller_popup_data(seller, distance_km=None, thumbnails=None):
+    """
+    Collect the fields renderSellerPopup needs to build a seller's popup in the browser.
+    
+    Values are formatted the way build_seller_popup formats them, and only
+    the images the popup shows are kept. With thumbnails, images become
+    [thumbnail src, url] pairs and broken images are dropped.
+    
+    Args:
+        seller (dict): Seller information dictionary
+        distance_km (float): Distance to the target shown in the popup (optional)
+        thumbnails (dict): Local thumbnails from thumbnails.prepare_thumbnails (optional)
+    
+    Returns:
+        dict: Popup data for one seller
+    """
+    is_restaurant = seller.get('business_category') == 'restaurant'
+    address = seller['address']
+    contact_urls = seller.get('contact_urls', {})
+    return {
+        'restaurant': is_restaurant,
+        'name_th': str(seller['name_th']),
+        'name_en': str(seller['name_en']),
+        'address_no': str(address['no']).replace('\\', '/') if address['no'] else '',
+        'moo': str(address['moo']) if address['moo'] else '',
+        'district': str(address['district']),
+        'province': str(address['province']),
+        'mobile': str(seller['contact']['mobile']),
+        'distance': None if distance_km is None or math.isnan(distance_km) else f"{distance_km:.1f}",
+        'contact_urls': {key: url for key, url in contact_urls.items() if url},
+        'image_count': len(seller['images']),
+        'images': popup_image_sources(seller['images'][:3], thumbnails and thumbnails['seller']),
+        'rooms': [] if is_restaurant else [
+            [str(room.get('name', 'N/A')), str(room.get('price', 'N/A')), str(room.get('numberOfRoom', 'N/A')),
+             popup_image_sources((room.get('images') or [])[:2], thumbnails and thumbnails['room'])]
+            for room in seller['rooms']
+        ]
+    }
+
+# Client-side popup renderer for lazy popups, builds the same markup as build_seller_popup
+SELLER_POPUP_JS = """
+function escapeSellerHtml(value) {
+    return String(value).replace(/[&<>"']/g, function (c) {
+        return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+    });
+}
+
+function sellerImagesHtml(urls, width, height, radius, border, alt) {
+    var html = '';
+    for (var i = 0; i < urls.length; i++) {
+        // [thumbnail src, url] when a local thumbnail exists
+        var url = escapeSellerHtml(typeof urls[i] === 'string' ? urls[i] : urls[i][1]);
+        var src = typeof urls[i] === 'string' ? url : escapeSellerHtml(urls[i][0]);
+        html += '<img src="' + src + '" style="width: ' + width + 'px; height: ' + height + 'px; object-fit: cover; '
+            + 'border-radius: ' + radius + 'px; border: 1px solid ' + border + '; cursor: pointer;" '
+            + 'onerror="this.style.display=\\'none\\';" onclick="showBigImage(this, \\'' + url + '\\')" '
+            + 'onmouseout="hideBigImage()" alt="' + alt + '">';
+    }
+    return html;
+}
+
+var SELLER_CONTACT_LINKS = [
+    ['website', '#0066cc', '🌐 Website'],
+    ['facebook', '#1877f2', '📘 Facebook'],
+    ['instagram', '#e4405f', '📷 Instagram'],
+    ['line', '#00b900', '💬 Line']
+];
+
+function renderSellerPopup(d) {
+    var p = '<p style="margin: 5px 0; font-size: 12px;">';
+    var html = '<div style="width: 300px; max-height: 800px; overflow-y: auto;">'
+        + '<h4 style="margin: 0 0 10px 0; color: ' + (d.restaurant ? '#00aa00' : '#cc0000') + ';">'
+        + (d.restaurant ? '🍽️ ' : '🏨 ') + escapeSellerHtml(d.name_th) + '</h4>'
+        + p + '<strong>English:</strong> ' + escapeSellerHtml(d.name_en) + '</p>'
+        + p + '<strong>Address:</strong> ' + escapeSellerHtml(d.address_no) + ' หมู่ ' + escapeSellerHtml(d.moo) + '</p>'
+        + p + '<strong>District:</strong> ' + escapeSellerHtml(d.district) + ', ' + escapeSellerHtml(d.province) + '</p>'
+        + p + '<strong>📱 Mobile:</strong> ' + escapeSellerHtml(d.mobile) + '</p>';
+    if (d.distance !== null) {
+        html += p + '<strong>📏 Distance to target:</strong> ' + d.distance + ' km</p>';
+    }
+    html += '<div style="margin: 10px 0;"><h6 style="margin: 5px 0; color: #333;">📞 Contact Links:</h6>';
+    for (var i = 0; i < SELLER_CONTACT_LINKS.length; i++) {
+        var link = SELLER_CONTACT_LINKS[i];
+        var url = d.contact_urls[link[0]];
+        if (url) {
+            url = escapeSellerHtml(url);
+            html += '<p style="margin: 3px 0; font-size: 11px;"><a href="' + url + '" target="_blank" '
+                + 'style="color: ' + link[1] + '; text-decoration: none;">' + link[2] + ' : ' + url + '</a></p>';
+        }
+    }
+    html += '</div>' + p + '<strong>Images:</strong> ' + d.image_count + '</p>';
+    if (d.images.length) {
+        html += '<h6 style="margin: 10px 0 5px 0; color: #333;">📸 Seller Images:</h6>'
+            + '<div style="display: flex; flex-wrap: wrap; gap: 5px; margin-bottom: 10px;">'
+            + sellerImagesHtml(d.images, 80, 60, 4, '#ddd', 'Seller image') + '</div>';
+    }
+    if (!d.restaurant) {
+        html += '<hr style="margin: 10px 0; border: 1px solid #ddd;">'
+            + '<h5 style="margin: 10px 0 5px 0; color: #333;">🏠 Available Rooms (' + d.rooms.length + '):</h5>';
+        for (var r = 0; r < d.rooms.length; r++) {
+            var room = d.rooms[r];
+            html += '<div style="border: 1px solid #ddd;width: 250px; margin: 8px 0; padding: 10px; border-radius: 6px; background: #f9f9f9;">'
+                + '<p style="margin: 2px 0; font-size: 11px;"><strong>🏠 ' + escapeSellerHtml(room[0]) + '</strong></p>'
+                + '<p style="margin: 2px 0; font-size: 11px;">💰 Price: ' + escapeSellerHtml(room[1]) + ' บาท</p>'
+                + '<p style="margin: 2px 0; font-size: 11px;">🛏️ Rooms: ' + escapeSellerHtml(room[2]) + '</p>';
+            if (room[3].length) {
+                html += '<div style="display: flex; flex-wrap: wrap; gap: 3px; margin-top: 5px;">'
+                    + sellerImagesHtml(room[3], 60, 45, 3, '#ccc', 'Room image') + '</div>';
+            }
+            html += '</div>';
+        }
+    }
+    return html + '</div>';
+}
+"""
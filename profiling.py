@@ -0,0 +1,165 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# Profiles are written to PROFILE_DIR/<stage>.pstats, <stage>_profile.txt, <stage>_alloc.txt and <stage>.collapsed
+PROFILE_DIR = 'profiles'
+
+# Functions listed in the text profile, and allocation sites listed in the allocation report
+PROFILE_TOP = 30
+ALLOCATION_TOP = 25
+
+# Stack frames kept per allocation, more frames show more callers but slow the traced code further
+TRACEMALLOC_FRAMES = 8
+
+# Seconds between stack samples for the collapsed-stack (flamegraph) files
+SAMPLE_INTERVAL = 0.005
+
+class StackSampler:
+    """
+    Samples the Python stacks of every thread at a fixed interval, for flamegraphs.
+
+    Unlike cProfile, which only sees the thread it is enabled in, the
+    sampler also sees the fetch worker threads. The result is written in
+    the collapsed-stack format ('outer;inner;leaf count' per line) read by
+    flamegraph.pl, speedscope and inferno.
+
+    Args:
+        interval (float): Seconds between samples
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+class StageProfiler:
+    """
+    cProfile and tracemalloc reports per pipeline stage.
+
+    Every stage gets its own profiler and allocation snapshot pair, so a
+    report shows what that stage alone spent time and memory on. Nothing
+    of this module runs unless a StageProfiler is created.
+
+    Args:
+        directory (str): Report directory (default: profiles)
+        collapsed (bool): Also sample stacks into a collapsed-stack file per stage
+        top (int): Functions in the text profile
+        allocation_top (int): Allocation sites in the allocation report
+    """
+
+    def __init__(self, directory=PROFILE_DIR, collapsed=False, top=PROFILE_TOP, allocation_top=ALLOCATION_TOP):
+        self.directory = directory
+        self.collapsed = collapsed
+        self.top = top
+        self.allocation_top = allocation_top
+        self.stages = []
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile a block as one stage and write its reports when it ends.
+
+        Args:
+            name (str): Stage name, used in the report file names
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        sampler = StackSampler() if self.collapsed else None
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        if sampler:
+            sampler.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if sampler:
+                sampler.stop()
+            seconds = time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            self._write_reports(name, seconds, profiler, before, after, peak, sampler)
+            self.stages.append((name, seconds, peak))
+            print(f"[PROFILE] {name}: {seconds:.2f}s, peak {peak / 2**20:.1f} MB traced -> {self.directory}/{name}.*")
+
+    def _write_reports(self, name, seconds, profiler, before, after, peak, sampler):
+        base = os.path.join(self.directory, name)
+        profiler.dump_stats(f"{base}.pstats")
+
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+        with open(f"{base}_profile.txt", 'w', encoding='utf-8') as f:
+            f.write(f"Stage {name}: {seconds:.3f}s (main thread only, see {name}.collapsed for worker threads)\n")
+            f.write(text.getvalue())
+
+        # Allocations the stage made and still held at its end, plus its peak
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+        ]
+        differences = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'traceback')
+        with open(f"{base}_alloc.txt", 'w', encoding='utf-8') as f:
+            f.write(f"Stage {name}: peak {peak / 2**20:.1f} MB traced, "
+                    f"{sum(stat.size_diff for stat in differences) / 2**20:+.1f} MB held at the end\n\n")
+            for number, stat in enumerate(differences[:self.allocation_top], 1):
+                f.write(f"#{number}: {stat.size_diff / 2**10:+.1f} KiB in {stat.count_diff:+d} blocks "
+                        f"({stat.size / 2**10:.1f} KiB held)\n")
+                for line in stat.traceback.format(most_recent_first=True):
+                    f.write(f"    {line}\n")
+                f.write("\n")
+
+        if sampler:
+            sampler.write(f"{base}.collapsed")
+
+    def close(self):
+        """Stop tracing and print the per-stage summary."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        for name, seconds, peak in self.stages:
+            print(f"[PROFILE] {name:<14} {seconds:>8.2f}s  {peak / 2**20:>8.1f} MB peak")
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+
+# Manifest stored next to each map, <map>_manifest.sqlite
+MANIFEST_SUFFIX = '_manifest.sqlite'
+
+# Modules whose code shapes the map HTML, any change to them regenerates every fragment and map
+RENDERER_MODULES = ('run_maps.py', 'popups.py', 'render_manifest.py', 'tile_cache.py')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fragments (
+    digest TEXT PRIMARY KEY,
+    fragment TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def renderer_digest():
+    """Hash of the renderer source files, so fragments rendered by older code are never reused."""
+    digest = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in RENDERER_MODULES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def seller_content(seller):
+    """Canonical JSON of a seller dictionary/record, the input of its content hash."""
+    data = seller.to_dict() if hasattr(seller, 'to_dict') else seller
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def manifest_path(output):
+    """Manifest file of a map file, e.g. sellers_map.html -> sellers_map_manifest.sqlite."""
+    return os.path.splitext(output)[0] + MANIFEST_SUFFIX
+
+class RenderManifest:
+    """
+    Rendered seller fragments of the last run of one map, for incremental regeneration.
+
+    A fragment is the expensive, per-seller part of the map: the popup HTML
+    or popup data, encoded the way the page embeds it. Fragments are keyed
+    by a hash of the seller's data, the distance shown and the render
+    variant (render mode, lazy popups, thumbnails, renderer code), so an
+    unchanged seller reuses its fragment wherever it moves in the list.
+
+    The page digest covers the renderer code, the map parameters and every
+    seller's fragment hash, position and tooltip. When it matches the digest
+    stored for the output file, the file is not written again.
+
+    Args:
+        output (str): Map HTML file the manifest belongs to
+        path (str): Manifest file (default: <output>_manifest.sqlite)
+    """
+
+    def __init__(self, output, path=None):
+        self.output = output
+        self.path = path or manifest_path(output)
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # One query for all fragments, lookups during rendering are dictionary hits
+        self._fragments = dict(self._conn.execute("SELECT digest, fragment FROM fragments"))
+        self._meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self._new = {}
+        self._used = set()
+        self._renderer = renderer_digest()
+        self._variant = None
+        self._page = None
+        self.reused = 0
+        self.rendered = 0
+
+    def begin(self, variant, **params):
+        """
+        Start a run.
+
+        Args:
+            variant (dict): Everything besides the seller and distance that changes a fragment
+            **params: Map parameters that change the page but not the fragments (target, zoom, ...)
+        """
+        self._variant = hashlib.sha1(
+            (self._renderer + json.dumps(variant, sort_keys=True, ensure_ascii=False, default=str)).encode('utf-8')
+        ).hexdigest()
+        self._page = hashlib.sha1(self._variant.encode('ascii'))
+        self.update(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str))
+        self._new = {}
+        self._used = set()
+        self.reused = 0
+        self.rendered = 0
+
+    def fragment(self, seller, distance_km, build, *page_parts):
+        """
+        Return a seller's fragment from the last run, or build and record it.
+
+        Args:
+            seller (dict): Seller dictionary/record
+            distance_km (float): Distance to the target shown in the popup (None/NaN when not shown)
+            build (callable): Builds the fragment string when it is not cached
+            *page_parts: Per-seller values outside the fragment that also change the page (position, tooltip)
+
+        Returns:
+            str: Fragment
+        """
+        distance = '' if distance_km is None or math.isnan(distance_km) else f"{distance_km:.1f}"
+        digest = hashlib.sha1(
+            f"{self._variant}\x1f{distance}\x1f{seller_content(seller)}".encode('utf-8')
+        ).hexdigest()
+        fragment = self._fragments.get(digest)
+        if fragment is None:
+            fragment = self._new.get(digest)
+        if fragment is None:
+            fragment = build()
+            self._new[digest] = fragment
+            self.rendered += 1
+        else:
+            self.reused += 1
+        self._used.add(digest)
+        self.update(digest, *page_parts)
+        return fragment
+
+    def update(self, *parts):
+        """Add values to the page digest."""
+        self._page.update('\x1f'.join(map(str, parts)).encode('utf-8') + b'\x1e')
+
+    @property
+    def digest(self):
+        return self._page.hexdigest()
+
+    def unchanged(self):
+        """True if the last run wrote the same page to the output file, and the file is still there as written."""
+        if self._meta.get('digest') != self.digest:
+            return False
+        try:
+            return os.path.getsize(self.output) == int(self._meta.get('size', -1))
+        except OSError:
+            return False
+
+    def commit(self):
+        """Store this run's fragments and the written page's digest, dropping fragments no seller used."""
+        stale = [(digest,) for digest in self._fragments if digest not in self._used]
+        size = os.path.getsize(self.output) if os.path.exists(self.output) else -1
+        self._conn.execute("BEGIN")
+        self._conn.executemany("DELETE FROM fragments WHERE digest = ?", stale)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO fragments (digest, fragment) VALUES (?, ?)", self._new.items()
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [('digest', self.digest), ('size', str(size))]
+        )
+        self._conn.execute("COMMIT")
+        for (digest,) in stale:
+            del self._fragments[digest]
+        self._fragments.update(self._new)
+        self._new = {}
+        self._meta.update(digest=self.digest, size=str(size))
+
+    def close(self):
+        self._conn.close()
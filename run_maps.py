@@ -1,45 +1,670 @@
 import folium
 import webbrowser
 import os
+import heapq
+import json
+import math
+import time
+import numpy as np
+from branca.element import Element, MacroElement
+from folium.plugins import MarkerCluster
+from folium.utilities import escape_backticks
+from jinja2 import Template
+from collections.abc import Sequence
 from fetch_data import call_api
+from geo import haversine_km
+from popups import SELLER_POPUP_JS, build_seller_popup, build_seller_popup_data, build_seller_tooltip
+from spatial_index import SpatialIndex
+from tile_cache import tile_url
+from metrics import observe, span, timed
 
-def create_sellers_map_with_target(sellers_info, target_lat, target_lon, zoom_start=10):
+# 'markers': one marker per seller, 'cluster': client-side clustering fed from a compact array,
+# 'geojson': one GeoJSON FeatureCollection drawn as circle markers on a canvas
+RENDER_MODES = ('markers', 'cluster', 'geojson')
+
+# Circle marker style per business category in 'geojson' mode, in the popup title colours
+GEOJSON_STYLES = {
+    'restaurant': {'radius': 6, 'color': '#ffffff', 'weight': 1, 'fillColor': '#00aa00', 'fillOpacity': 0.9},
+    'accommodation': {'radius': 6, 'color': '#ffffff', 'weight': 1, 'fillColor': '#cc0000', 'fillOpacity': 0.9},
+}
+
+class RawScript(Element):
+    """
+    Script text added to the page as is.
+    
+    branca compiles every rendered script as a Jinja template again, which
+    takes seconds for megabytes of seller data; this element skips that.
+    """
+    
+    def __init__(self, script):
+        super().__init__()
+        self.script = script
+    
+    def render(self, **kwargs):
+        return self.script
+
+# withPopupData(callback) for the seller layer templates: parses the embedded popup data, or loads the
+# sidecar script, the first time a popup opens and passes it to callback
+_POPUP_DATA_LOADER = """
+                var popupData = null;
+                var waiting = [];
+                function withPopupData(callback) {
+                    if (popupData) {
+                        callback(popupData);
+                        return;
+                    }
+                    waiting.push(callback);
+                    if (waiting.length > 1) {
+                        return;
+                    }
+                    {%- if this.popup_data_src %}
+                    var script = document.createElement('script');
+                    script.src = {{ this.popup_data_src|tojson }};
+                    script.onload = function () {
+                        popupData = window[{{ this.popup_data_global|tojson }}];
+                        waiting.splice(0).forEach(function (waiter) { waiter(popupData); });
+                    };
+                    document.head.appendChild(script);
+                    {%- else %}
+                    popupData = JSON.parse(document.getElementById({{ (this.get_name() ~ '_popup_data')|tojson }}).textContent);
+                    waiting.splice(0).forEach(function (waiter) { waiter(popupData); });
+                    {%- endif %}
+                }"""
+
+class SellerMarker(MacroElement):
+    """
+    One seller marker with its icon, popup and tooltip, rendered by one precompiled template.
+    
+    Produces the same script as folium.Marker with a folium.Icon,
+    folium.Popup and tooltip. Those are four elements per seller whose
+    rendered scripts branca compiles again as new Jinja templates, which
+    made up most of the time to save a map; this element renders once and
+    adds the script as is.
+    
+    Args:
+        location (list): [lat, lon]
+        popup_html (str): Popup HTML
+        tooltip (str): Tooltip text
+        color (str): Marker colour
+        icon (str): Glyphicon name
+    """
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.marker(
+                {{ this.location|tojson }},
+                {}
+            ).addTo({{ this._parent.get_name() }});
+        
+    
+            var {{ this.icon_name }} = L.AwesomeMarkers.icon(
+                {{ this.icon_options|tojson }}
+            );
+            {{ this.get_name() }}.setIcon({{ this.icon_name }});
+        
+    
+        var {{ this.popup_name }} = L.popup({"maxWidth": 300});
+
+        
+            
+                var {{ this.html_name }} = $(`<div id="{{ this.html_name }}" style="width: 100.0%; height: 100.0%;">{{ this.popup_html }}</div>`)[0];
+                {{ this.popup_name }}.setContent({{ this.html_name }});
+            
+        
+
+        {{ this.get_name() }}.bindPopup({{ this.popup_name }})
+        ;
+
+        
+    
+    
+            {{ this.get_name() }}.bindTooltip(
+                `<div>
+                     {{ this.tooltip }}
+                 </div>`,
+                {"sticky": true}
+            );
+        {% endmacro %}""")
+    
+    def __init__(self, location, popup_html, tooltip, color, icon):
+        super().__init__()
+        self._name = 'Marker'
+        self.location = [float(location[0]), float(location[1])]
+        self.popup_html = escape_backticks(popup_html).replace('\n', ' ')
+        self.tooltip = tooltip
+        self.icon_options = {
+            'extraClasses': 'fa-rotate-0', 'icon': icon, 'iconColor': 'white', 'markerColor': color, 'prefix': 'glyphicon'
+        }
+        self.icon_name = f"icon_{self._generate_id()}"
+        self.popup_name = f"popup_{self._generate_id()}"
+        self.html_name = f"html_{self._generate_id()}"
+    
+    def render(self, **kwargs):
+        self.get_root().script.add_child(
+            RawScript(self._template.module.script(self, kwargs)), name=self.get_name()
+        )
+
+class SellerMarkerLayer(MarkerCluster):
+    """
+    Seller markers built in the browser from one array of seller rows.
+    
+    Each row is [lat, lon, is_restaurant, tooltip, popup], where popup is
+    the popup HTML, or with lazy popups the seller's key in the popup data.
+    The markers, icons and popups are created by a single JavaScript loop
+    instead of one folium.Marker/Popup/Icon object (and block of generated
+    JavaScript) per seller, in the same red/green colours as the regular markers.
+    
+    With lazy popups, the popup data of all sellers is one JSON object,
+    embedded in the page or loaded from a sidecar script file the first time
+    a popup opens, and renderSellerPopup builds the popup when it is opened.
+    
+    Args:
+        rows (list): JSON-encoded seller rows, see add_seller_row
+        cluster (bool): Group nearby markers with Leaflet.markercluster (default: True)
+        popup_data (list): JSON-encoded '"key":{...}' popup data entries for lazy popups, see add_seller_row
+        popup_data_src (str): Sidecar script holding the popup data, relative to the HTML file (default: embedded)
+    """
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var rows = {{ this.get_name() }}_rows;
+                {%- if this.cluster %}
+                var layer = L.markerClusterGroup({{ this.options|tojson }});
+                {%- else %}
+                var layer = L.featureGroup();
+                {%- endif %}
+                {%- if this.lazy %}""" + _POPUP_DATA_LOADER + """
+                function openPopup(e) {
+                    var key = this.sellerKey;
+                    withPopupData(function (data) {
+                        e.popup.setContent(renderSellerPopup(data[key]));
+                    });
+                }
+                {%- endif %}
+                for (var i = 0; i < rows.length; i++) {
+                    var row = rows[i];
+                    var isRestaurant = row[2] === 1;
+                    var marker = L.marker([row[0], row[1]], {
+                        icon: L.AwesomeMarkers.icon({
+                            extraClasses: 'fa-rotate-0',
+                            icon: isRestaurant ? 'cutlery' : 'home',
+                            iconColor: 'white',
+                            markerColor: isRestaurant ? 'green' : 'red',
+                            prefix: 'glyphicon'
+                        })
+                    });
+                    marker.bindTooltip('<div>' + row[3] + '</div>', {sticky: true});
+                    {%- if this.lazy %}
+                    marker.sellerKey = row[4];
+                    marker.bindPopup('Loading...', {maxWidth: 300});
+                    marker.on('popupopen', openPopup);
+                    {%- else %}
+                    marker.bindPopup(row[4], {maxWidth: 300});
+                    {%- endif %}
+                    layer.addLayer(marker);
+                }
+                layer.addTo({{ this._parent.get_name() }});
+                return layer;
+            })();
+        {% endmacro %}""")
+    
+    def __init__(self, rows, cluster=True, popup_data=None, popup_data_src=None, control=False, **kwargs):
+        super().__init__(control=control, **kwargs)
+        self._name = 'SellerMarkerLayer'
+        self.cluster = cluster
+        self.lazy = popup_data is not None
+        self.popup_data_src = popup_data_src
+        # Joined when the page is rendered, so a map that is never saved (unchanged manifest) skips the copy
+        self.rows = rows
+        self.popup_data = popup_data
+    
+    @property
+    def rows_json(self):
+        return self.join_rows(self.rows)
+    
+    @property
+    def popup_data_json(self):
+        return '{' + ',\n'.join(self.popup_data) + '}' if self.lazy else None
+    
+    @property
+    def popup_data_global(self):
+        """
+        Global the sidecar script assigns the popup data to.
+        
+        Named after the sidecar file rather than the layer's random element
+        name, so a page the manifest kept still finds a rewritten sidecar.
+        """
+        return f"seller_popup_data:{self.popup_data_src}"
+    
+    @staticmethod
+    def join_rows(rows):
+        """JSON array of the encoded rows."""
+        return '[' + ',\n'.join(rows) + ']'
+    
+    @staticmethod
+    def encode_row(row):
+        """
+        JSON-encode one row for embedding in a <script> block.
+        
+        Rows are encoded as they are added so only one copy of the popups is
+        held, and without ASCII escapes so Thai text stays 3 bytes per character.
+        """
+        return json.dumps(row, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    
+    def write_popup_data(self, path):
+        """
+        Write the popup data as a sidecar script, loaded by the page the first time a popup opens.
+        
+        Args:
+            path (str): Script file, popup_data_src must point at it relative to the HTML file
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"window[{json.dumps(self.popup_data_global, ensure_ascii=False)}] = {self.popup_data_json};\n")
+    
+    def render(self, **kwargs):
+        figure = self.get_root()
+        # The rows (and embedded popup data) go in ahead of the layer script, outside the template
+        figure.script.add_child(
+            RawScript(f"var {self.get_name()}_rows = {self.rows_json};"), name=f"{self.get_name()}_rows"
+        )
+        if self.lazy:
+            figure.script.add_child(RawScript(SELLER_POPUP_JS), name='seller_popup_renderer')
+            if not self.popup_data_src:
+                figure.html.add_child(RawScript(
+                    f'<script type="application/json" id="{self.get_name()}_popup_data">{self.popup_data_json}</script>'
+                ), name=f"{self.get_name()}_popup_data")
+        super().render(**kwargs)
+
+class SellerGeoJsonLayer(SellerMarkerLayer):
+    """
+    All sellers as one GeoJSON FeatureCollection, drawn as circle markers on a canvas.
+    
+    Each feature is a Point with 'category', 'tooltip' and 'popup'
+    properties (popup is the popup HTML, or with lazy popups the seller's key
+    in the popup data). The markers share one canvas renderer instead of a
+    DOM icon each, are coloured by a per-category style function, and the
+    tooltip and popup are bound once on the layer rather than per marker,
+    which keeps tens of thousands of sellers smooth to pan and zoom. The
+    layer can be toggled in the layer control.
+    
+    Args:
+        features (list): JSON-encoded GeoJSON features, see add_seller_row
+        popup_data (list): JSON-encoded '"key":{...}' popup data entries for lazy popups, see add_seller_row
+        popup_data_src (str): Sidecar script holding the popup data, relative to the HTML file (default: embedded)
+        name (str): Name in the layer control
+    """
+    
+    # Leaflet draws circle markers itself, the marker cluster plugin is not needed
+    default_js = []
+    default_css = []
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var styles = {{ this.styles|tojson }};
+                var renderer = L.canvas({padding: 0.5});
+                var layer = L.geoJSON({{ this.get_name() }}_rows, {
+                    pointToLayer: function (feature, latlng) {
+                        return L.circleMarker(latlng, {renderer: renderer});
+                    },
+                    style: function (feature) {
+                        return styles[feature.properties.category] || styles.accommodation;
+                    }
+                });
+                layer.bindTooltip(function (marker) {
+                    return '<div>' + marker.feature.properties.tooltip + '</div>';
+                }, {sticky: true});
+                {%- if this.lazy %}""" + _POPUP_DATA_LOADER + """
+                layer.bindPopup(function (marker) {
+                    var node = document.createElement('div');
+                    node.textContent = 'Loading...';
+                    withPopupData(function (data) {
+                        node.innerHTML = renderSellerPopup(data[marker.feature.properties.popup]);
+                        if (layer.isPopupOpen()) {
+                            layer.getPopup().update();
+                        }
+                    });
+                    return node;
+                }, {maxWidth: 300});
+                {%- else %}
+                layer.bindPopup(function (marker) {
+                    return marker.feature.properties.popup;
+                }, {maxWidth: 300});
+                {%- endif %}
+                layer.addTo({{ this._parent.get_name() }});
+                return layer;
+            })();
+        {% endmacro %}""")
+    
+    def __init__(self, features, popup_data=None, popup_data_src=None, name='🏪 Sellers'):
+        super().__init__(
+            features, cluster=False, popup_data=popup_data, popup_data_src=popup_data_src, control=True, name=name
+        )
+        self._name = 'SellerGeoJsonLayer'
+        self.styles = GEOJSON_STYLES
+    
+    @staticmethod
+    def join_rows(rows):
+        """FeatureCollection of the encoded features."""
+        return '{"type":"FeatureCollection","features":[' + ',\n'.join(rows) + ']}'
+
+class SellerViewportLayer(MacroElement):
+    """
+    Sellers loaded from a map server for the visible area instead of being embedded in the page.
+    
+    On every pan or zoom the page asks viewport_url for the sellers inside
+    the map bounds ('?bbox=west,south,east,north&zoom=z', see map_server)
+    and draws them as canvas circle markers in the GeoJSON mode colours.
+    Where the server answers with clusters (too many sellers in view), a
+    count is shown that zooms in when clicked. Popups are fetched from
+    popup_url when opened and built by renderSellerPopup. Markers that stay
+    in view are kept, so an open popup survives the map panning to fit it.
+    
+    Args:
+        viewport_url (str): URL answering bounding-box queries with {"sellers": rows, "clusters": [[lat, lon, count]]}
+        popup_url (str): URL answering '?id=<seller number>' with the seller's popup data
+    """
+    
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var map = {{ this._parent.get_name() }};
+                var styles = {{ this.styles|tojson }};
+                var renderer = L.canvas({padding: 0.5});
+                var sellers = L.featureGroup().addTo(map);
+                var clusters = L.featureGroup().addTo(map);
+                var shown = {};
+                var request = 0;
+                sellers.bindTooltip(function (marker) {
+                    return '<div>' + marker.tooltip + '</div>';
+                }, {sticky: true});
+                sellers.bindPopup(function (marker) {
+                    var node = document.createElement('div');
+                    node.textContent = 'Loading...';
+                    fetch({{ this.popup_url|tojson }} + '?id=' + marker.sellerKey)
+                        .then(function (response) { return response.json(); })
+                        .then(function (data) {
+                            node.innerHTML = renderSellerPopup(data);
+                            if (sellers.isPopupOpen()) {
+                                sellers.getPopup().update();
+                            }
+                        });
+                    return node;
+                }, {maxWidth: 300});
+                function load() {
+                    var current = ++request;
+                    fetch({{ this.viewport_url|tojson }} + '?bbox=' + map.getBounds().toBBoxString() + '&zoom=' + map.getZoom())
+                        .then(function (response) { return response.json(); })
+                        .then(function (data) {
+                            if (current !== request) {
+                                return;
+                            }
+                            var next = {};
+                            data.sellers.forEach(function (row) {
+                                var marker = shown[row[4]];
+                                if (!marker) {
+                                    marker = L.circleMarker([row[0], row[1]], {renderer: renderer});
+                                    marker.setStyle(row[2] === 1 ? styles.restaurant : styles.accommodation);
+                                    marker.tooltip = row[3];
+                                    marker.sellerKey = row[4];
+                                    sellers.addLayer(marker);
+                                }
+                                next[row[4]] = marker;
+                            });
+                            Object.keys(shown).forEach(function (key) {
+                                if (!next[key]) {
+                                    sellers.removeLayer(shown[key]);
+                                }
+                            });
+                            shown = next;
+                            clusters.clearLayers();
+                            data.clusters.forEach(function (cluster) {
+                                var size = cluster[2] < 100 ? 30 : cluster[2] < 1000 ? 38 : 46;
+                                L.marker([cluster[0], cluster[1]], {
+                                    icon: L.divIcon({
+                                        className: 'seller-viewport-cluster',
+                                        iconSize: [size, size],
+                                        html: '<div style="width: ' + size + 'px; height: ' + size + 'px; line-height: ' + size + 'px; '
+                                            + 'border-radius: 50%; background: rgba(0, 102, 204, 0.8); color: white; '
+                                            + 'text-align: center; font-weight: bold; font-size: 12px;">' + cluster[2] + '</div>'
+                                    })
+                                }).on('click', function (e) {
+                                    map.setView(e.latlng, map.getZoom() + 2);
+                                }).addTo(clusters);
+                            });
+                        });
+                }
+                map.on('moveend', load);
+                load();
+                return sellers;
+            })();
+        {% endmacro %}""")
+    
+    def __init__(self, viewport_url, popup_url):
+        super().__init__()
+        self._name = 'SellerViewportLayer'
+        self.viewport_url = viewport_url
+        self.popup_url = popup_url
+        self.styles = GEOJSON_STYLES
+    
+    def render(self, **kwargs):
+        self.get_root().script.add_child(RawScript(SELLER_POPUP_JS), name='seller_popup_renderer')
+        super().render(**kwargs)
+
+def add_seller_marker(google_map, seller, i, distance_km=None, thumbnails=None, manifest=None):
+    """
+    Add one seller marker with its popup to the map.
+    
+    Args:
+        google_map: Folium map object
+        seller (dict): Seller information dictionary
+        i (int): Seller number shown in the tooltip
+        distance_km (float): Distance to the target shown in the tooltip and popup (optional)
+        thumbnails (dict): Local image thumbnails from thumbnails.prepare_thumbnails (optional)
+        manifest (RenderManifest): Reuse the popup rendered by the last run when the seller is unchanged (optional)
+    
+    Returns:
+        str: 'restaurant' or 'accommodation' for the marker added, or None if the seller has no coordinates
+    """
+    lat = seller['location']['latitude']
+    lon = seller['location']['longitude']
+    
+    if lat and lon:
+        is_restaurant = seller.get('business_category') == 'restaurant'
+        tooltip = build_seller_tooltip(seller, i, distance_km)
+        
+        def build():
+            started = time.perf_counter()
+            popup = build_seller_popup(seller, distance_km, thumbnails)
+            observe('popup_build_seconds', time.perf_counter() - started)
+            return popup
+        
+        # Add marker with popup
+        SellerMarker(
+            [lat, lon],
+            manifest.fragment(seller, distance_km, build, lat, lon, tooltip) if manifest is not None else build(),
+            tooltip,
+            color='green' if is_restaurant else 'red',
+            icon='cutlery' if is_restaurant else 'home'
+        ).add_to(google_map)
+        
+        return 'restaurant' if is_restaurant else 'accommodation'
+
+def add_seller_row(rows, seller, i, distance_km=None, popup_data=None, thumbnails=None, geojson=False, manifest=None):
+    """
+    Append one seller as a compact row for SellerMarkerLayer, or a GeoJSON feature for SellerGeoJsonLayer.
+    
+    Runs of whitespace in the popup HTML are collapsed, which the browser
+    does anyway, making the embedded popups about a quarter smaller. With
+    popup_data, the row only carries the seller's key and the popup fields
+    go to popup_data instead. The row is put together from separately
+    encoded parts, so the encoded popup can come from the manifest.
+    
+    Args:
+        rows (list): Encoded rows of the layer
+        seller (dict): Seller information dictionary
+        i (int): Seller number shown in the tooltip, also the popup data key
+        distance_km (float): Distance to the target shown in the tooltip and popup (optional)
+        popup_data (list): Encoded popup data entries for lazy popups (default: popup HTML in the row)
+        thumbnails (dict): Local image thumbnails from thumbnails.prepare_thumbnails (optional)
+        geojson (bool): Append a GeoJSON Point feature instead of a row (default: False)
+        manifest (RenderManifest): Reuse the popup encoded by the last run when the seller is unchanged (optional)
+    
+    Returns:
+        str: 'restaurant' or 'accommodation' for the row added, or None if the seller has no coordinates
+    """
+    lat = seller['location']['latitude']
+    lon = seller['location']['longitude']
+    
+    if lat and lon:
+        is_restaurant = seller.get('business_category') == 'restaurant'
+        tooltip = build_seller_tooltip(seller, i, distance_km)
+        
+        def build():
+            started = time.perf_counter()
+            if popup_data is not None:
+                popup = SellerMarkerLayer.encode_row(build_seller_popup_data(seller, distance_km, thumbnails))
+            else:
+                # str.split() collapses the same Unicode whitespace as re.sub(r"\s+") at a fraction of the cost
+                popup = SellerMarkerLayer.encode_row(' '.join(build_seller_popup(seller, distance_km, thumbnails).split()))
+            observe('popup_build_seconds', time.perf_counter() - started)
+            return popup
+        
+        popup = manifest.fragment(seller, distance_km, build, lat, lon, tooltip) if manifest is not None else build()
+        if popup_data is not None:
+            popup_data.append(f'"{i}":{popup}')
+            popup = i
+        
+        encode = SellerMarkerLayer.encode_row
+        if geojson:
+            rows.append(
+                f'{{"type":"Feature","geometry":{{"type":"Point","coordinates":[{encode(lon)},{encode(lat)}]}},'
+                f'"properties":{{"category":"{"restaurant" if is_restaurant else "accommodation"}",'
+                f'"tooltip":{encode(tooltip)},"popup":{popup}}}}}'
+            )
+        else:
+            rows.append(f'[{encode(lat)},{encode(lon)},{1 if is_restaurant else 0},{encode(tooltip)},{popup}]')
+        return 'restaurant' if is_restaurant else 'accommodation'
+
+def add_nearest_list(google_map, nearest):
+    """
+    Add a panel listing the sellers nearest to the target.
+    
+    Args:
+        google_map: Folium map object
+        nearest (list): (seller_number, seller, distance_km) tuples, nearest first
+    """
+    rows = ""
+    for seller_number, seller, distance_km in nearest:
+        icon_symbol = '🍽️' if seller.get('business_category') == 'restaurant' else '🏨'
+        rows += f"""
+            <li style="margin: 3px 0;">{icon_symbol} #{seller_number}: {seller['name_th']} <strong>{distance_km:.1f} km</strong></li>
+        """
+    google_map.get_root().html.add_child(folium.Element(f"""
+        <div style="position: fixed; bottom: 20px; left: 20px; z-index: 1000; max-height: 300px; overflow-y: auto;
+                    background: white; border: 2px solid #333; border-radius: 8px; padding: 10px;
+                    box-shadow: 0 4px 8px rgba(0,0,0,0.3); font-size: 12px;">
+            <h5 style="margin: 0 0 5px 0; color: #0066cc;">📏 Nearest to target</h5>
+            <ol style="margin: 0; padding-left: 20px;">{rows}</ol>
+        </div>
+    """))
+
+@timed('render_map')
+def create_sellers_map_with_target(sellers_info, target_lat, target_lon, zoom_start=10, max_radius_km=None, nearest_count=0,
+                                   spatial_index=None, render_mode='markers', lazy_popups=False, popup_data_file=None,
+                                   thumbnails=None, manifest=None, viewport_url=None, popup_url=None,
+                                   tile_proxy=None):
     """
     Create Google Maps with markers for all sellers and target location.
     
+    sellers_info can also be an iterator such as fetch_data.iter_sellers or
+    iter_categories. Markers are then added as sellers arrive, while later
+    pages are still being fetched, and the map is fitted to the sellers at the end.
+    
     Args:
-        sellers_info (list): List of seller information dictionaries
+        sellers_info (list): List of seller information dictionaries (or SellerRecord/SellerBatch), or an iterator of them
         target_lat (float): Target latitude
         target_lon (float): Target longitude
         zoom_start (int): Initial zoom level (default: 10)
+        max_radius_km (float): Only show sellers within this distance of the target (default: no limit)
+        nearest_count (int): Size of the list of sellers nearest to the target (default: 0, no list)
+        spatial_index (SpatialIndex): Index built from sellers_info, e.g. spatial_index.load_or_build_index (default: built here)
+        render_mode (str): 'markers' for one marker per seller, 'cluster' for client-side marker clustering,
+            or 'geojson' for one GeoJSON layer of canvas circle markers (default: 'markers')
+        lazy_popups (bool): Build popups in the browser when opened, from one JSON object of popup data, instead of inlining their HTML (default: False)
+        popup_data_file (str): With lazy_popups, write the popup data to this script file, next to the HTML file, instead of embedding it (default: embedded)
+        thumbnails (dict): Local image thumbnails from thumbnails.prepare_thumbnails, shown instead of the remote images (default: remote images)
+        manifest (RenderManifest): Manifest of the output file, see render_manifest; popups of unchanged sellers
+            are reused from the last run and save_and_open_map skips writing an unchanged map (default: render everything)
+        viewport_url (str): Load the sellers in view from this map_server URL instead of embedding them (default: embedded)
+        popup_url (str): With viewport_url, the URL the popup data is fetched from
+        tile_proxy (str): Load the map tiles through this tile_cache proxy, '' for the server serving the page (default: from Google)
     """
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render_mode {render_mode!r}, expected one of {RENDER_MODES}")
     
-    if not sellers_info:
+    streaming = not isinstance(sellers_info, Sequence)
+    if streaming and viewport_url:
+        raise ValueError("viewport_url needs the full seller list, not an iterator")
+    
+    if not streaming and not sellers_info:
         print("No sellers data available")
         return None
     
-    # Calculate center point (average of all coordinates including target)
-    total_lat = target_lat
-    total_lon = target_lon
-    valid_coords = 1  # Start with target location
-    
-    for seller in sellers_info:
-        if seller['location']['latitude'] and seller['location']['longitude']:
-            total_lat += seller['location']['latitude']
-            total_lon += seller['location']['longitude']
-            valid_coords += 1
+    # Radius, nearest and centroid queries go through the spatial index instead of scanning every seller
+    distances = None
+    indices = None
+    if not streaming:
+        index = spatial_index or SpatialIndex.from_sellers(sellers_info)
+        if max_radius_km is not None:
+            indices, distances = index.radius(target_lat, target_lon, max_radius_km, with_distances=True)
+            print(f"{len(indices)} of {len(sellers_info)} sellers within {max_radius_km} km of the target")
+            if not len(indices):
+                print("No sellers data available within the radius")
+                return None
+        else:
+            distances = haversine_km(index.latitude, index.longitude, target_lat, target_lon)
     
-    center_lat = total_lat / valid_coords
-    center_lon = total_lon / valid_coords
-    
-    print(f"Creating Google Maps with {len(sellers_info)} sellers + target location")
-    print(f"Center coordinates: {center_lat}, {center_lon}")
+    if streaming:
+        # Sellers are not known yet, start on the target and fit the bounds once they are in
+        center_lat = target_lat
+        center_lon = target_lon
+        print("Creating Google Maps, adding sellers while they are fetched")
+    else:
+        # Calculate center point (average of all coordinates including target)
+        total_lat, total_lon, valid_coords = index.centroid(indices)
+        center_lat = (total_lat + target_lat) / (valid_coords + 1)
+        center_lon = (total_lon + target_lon) / (valid_coords + 1)
+        
+        # Nearest sellers from the index, numbered by their position on the map
+        nearest = []
+        if nearest_count:
+            nearest_ids, nearest_distances = index.nearest(target_lat, target_lon, nearest_count)
+            if indices is not None:
+                positions = np.searchsorted(indices, nearest_ids)
+                nearest = [
+                    (int(position) + 1, sellers_info[seller_id], float(distance))
+                    for position, seller_id, distance in zip(positions, nearest_ids, nearest_distances)
+                    if distance <= max_radius_km
+                ]
+            else:
+                nearest = [
+                    (int(seller_id) + 1, sellers_info[seller_id], float(distance))
+                    for seller_id, distance in zip(nearest_ids, nearest_distances)
+                ]
+        
+        if indices is not None:
+            sellers_info = [sellers_info[i] for i in indices]
+        
+        print(f"Creating Google Maps with {len(sellers_info)} sellers + target location")
+        print(f"Center coordinates: {center_lat}, {center_lon}")
     
     # Create Google Maps with multiple tile layers
     google_map = folium.Map(
         location=[center_lat, center_lon], 
         zoom_start=zoom_start,
-        tiles='https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}',
+        tiles=tile_url('m', tile_proxy),
         attr='Google Maps'
     )
     
@@ -58,232 +683,118 @@ def create_sellers_map_with_target(sellers_info, target_lat, target_lon, zoom_st
         icon=folium.Icon(color='blue', icon='flag')
     ).add_to(google_map)
     
+    # With a map server the page fetches the sellers in view itself, none are embedded
+    if viewport_url:
+        SellerViewportLayer(viewport_url, popup_url).add_to(google_map)
+        sellers_info = ()
+    
     # Add markers for each seller with different colors
     accommodation_count = 0
     restaurant_count = 0
+    seller_count = 0
+    bounds = [[target_lat, target_lon], [target_lat, target_lon]]
+    nearest_heap = []  # (-distance, seller_number, seller) of the nearest sellers seen while streaming
+    layer_rows = [] if not viewport_url and (render_mode != 'markers' or lazy_popups) else None
+    popup_data = [] if lazy_popups else None
+    if manifest is not None:
+        manifest.begin(
+            {
+                'popup': 'html' if layer_rows is None else 'data' if lazy_popups else 'row',
+                'thumbnails': thumbnails
+            },
+            target=[target_lat, target_lon], zoom_start=zoom_start, max_radius_km=max_radius_km,
+            nearest_count=nearest_count, render_mode=render_mode, lazy_popups=lazy_popups, tile_proxy=tile_proxy,
+            popup_data_src=os.path.basename(popup_data_file) if lazy_popups and popup_data_file else None
+        )
     
     for i, seller in enumerate(sellers_info, 1):
-        lat = seller['location']['latitude']
-        lon = seller['location']['longitude']
+        seller_count = i
+        if distances is not None:
+            distance_km = float(distances[i - 1])
+        else:
+            lat = seller['location']['latitude']
+            lon = seller['location']['longitude']
+            distance_km = float(haversine_km(lat, lon, target_lat, target_lon)) if lat and lon else math.nan
+            if max_radius_km is not None and not distance_km <= max_radius_km:
+                continue
+            if nearest_count and not math.isnan(distance_km):
+                heapq.heappush(nearest_heap, (-distance_km, i, seller))
+                if len(nearest_heap) > nearest_count:
+                    heapq.heappop(nearest_heap)
         
-        if lat and lon:
-            # Create seller images HTML
-            seller_images_html = ""
-            if seller['images']:
-                seller_images_html = f"""
-                <h6 style="margin: 10px 0 5px 0; color: #333;">📸 Seller Images:</h6>
-                <div style="display: flex; flex-wrap: wrap; gap: 5px; margin-bottom: 10px;">
-                """
-                for img_url in seller['images'][:3]:  # Show first 3 images
-                    seller_images_html += f"""
-                    <img src="{img_url}" style="width: 80px; height: 60px; object-fit: cover; border-radius: 4px; border: 1px solid #ddd; cursor: pointer;" 
-                         onerror="this.style.display='none';" 
-                         onclick="showBigImage(this, '{img_url}')" 
-                         onmouseout="hideBigImage()" 
-                         alt="Seller image">
-                    """
-                seller_images_html += "</div>"
-            
-            # Determine if this is accommodation or restaurant based on business category
-            is_restaurant = seller.get('business_category') == 'restaurant'
-            
-            # Create room details HTML (only for accommodations)
-            room_details = ""
-            if not is_restaurant:
-                for room in seller['rooms']:
-                    # Create room images HTML
-                    room_images_html = ""
-                    if room.get('images'):
-                        room_images_html = f"""
-                        <div style="display: flex; flex-wrap: wrap; gap: 3px; margin-top: 5px;">
-                        """
-                        for img_url in room['images'][:2]:  # Show first 2 images per room
-                            room_images_html += f"""
-                            <img src="{img_url}" style="width: 60px; height: 45px; object-fit: cover; border-radius: 3px; border: 1px solid #ccc; cursor: pointer;" 
-                                 onerror="this.style.display='none';" 
-                                 onclick="showBigImage(this, '{img_url}')" 
-                                 onmouseout="hideBigImage()" 
-                                 alt="Room image">
-                            """
-                        room_images_html += "</div>"
-                    
-                    room_details += f"""
-                    <div style="border: 1px solid #ddd;width: 250px; margin: 8px 0; padding: 10px; border-radius: 6px; background: #f9f9f9;">
-                        <p style="margin: 2px 0; font-size: 11px;"><strong>🏠 {room.get('name', 'N/A')}</strong></p>
-                        <p style="margin: 2px 0; font-size: 11px;">💰 Price: {room.get('price', 'N/A')} บาท</p>
-                        <p style="margin: 2px 0; font-size: 11px;">🛏️ Rooms: {room.get('numberOfRoom', 'N/A')}</p>
-                        {room_images_html}
-                    </div>
-                    """
-            
-            # Create popup content
-            if is_restaurant:
-                restaurant_count += 1
-                icon_color = 'green'
-                icon_symbol = '🍽️'
-                title_color = '#00aa00'
-                # Format address safely to avoid octal escape sequence issues
-                address_no = str(seller['address']['no']).replace('\\', '/') if seller['address']['no'] else ''
-                address_moo = str(seller['address']['moo']) if seller['address']['moo'] else ''
-                
-                popup_content = f"""
-                <div style="width: 300px; max-height: 800px; overflow-y: auto;">
-                    <h4 style="margin: 0 0 10px 0; color: {title_color};">🍽️ {seller['name_th']}</h4>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>English:</strong> {seller['name_en']}</p>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>Address:</strong> {address_no} หมู่ {address_moo}</p>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>District:</strong> {seller['address']['district']}, {seller['address']['province']}</p>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>📱 Mobile:</strong> {seller['contact']['mobile']}</p>
-                    
-                    <!-- Contact Links -->
-                    <div style="margin: 10px 0;">
-                        <h6 style="margin: 5px 0; color: #333;">📞 Contact Links:</h6>
-                """
-                    
-                # Use pre-calculated contact URLs from fetch_data.py
-                contact_urls = seller.get('contact_urls', {})
-                
-                # Add contact links to popup content
-                if contact_urls.get('website'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['website']}" target="_blank" style="color: #0066cc; text-decoration: none;">
-                            🌐 Website : {contact_urls['website']}
-                        </a>
-                    </p>
-                    """
-                
-                if contact_urls.get('facebook'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['facebook']}" target="_blank" style="color: #1877f2; text-decoration: none;">
-                            📘 Facebook : {contact_urls['facebook']}
-                        </a>
-                    </p>
-                    """
-                
-                if contact_urls.get('instagram'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['instagram']}" target="_blank" style="color: #e4405f; text-decoration: none;">
-                            📷 Instagram : {contact_urls['instagram']}
-                        </a>
-                    </p>
-                    """
-                
-                if contact_urls.get('line'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['line']}" target="_blank" style="color: #00b900; text-decoration: none;">
-                            💬 Line : {contact_urls['line']}
-                        </a>
-                    </p>
-                    """
-                
-                popup_content += f"""
-                </div>
-                
-                <p style="margin: 5px 0; font-size: 12px;"><strong>Images:</strong> {len(seller['images'])}</p>
-                {seller_images_html}
-            </div>
-            """
-            else:
-                accommodation_count += 1
-                icon_color = 'red'
-                icon_symbol = '🏨'
-                title_color = '#cc0000'
-                # Format address safely to avoid octal escape sequence issues
-                address_no = str(seller['address']['no']).replace('\\', '/') if seller['address']['no'] else ''
-                address_moo = str(seller['address']['moo']) if seller['address']['moo'] else ''
-                
-                popup_content = f"""
-                <div style="width: 300px; max-height: 800px; overflow-y: auto;">
-                    <h4 style="margin: 0 0 10px 0; color: {title_color};">{icon_symbol} {seller['name_th']}</h4>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>English:</strong> {seller['name_en']}</p>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>Address:</strong> {address_no} หมู่ {address_moo}</p>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>District:</strong> {seller['address']['district']}, {seller['address']['province']}</p>
-                    <p style="margin: 5px 0; font-size: 12px;"><strong>📱 Mobile:</strong> {seller['contact']['mobile']}</p>
-                    
-                    <!-- Contact Links -->
-                    <div style="margin: 10px 0;">
-                        <h6 style="margin: 5px 0; color: #333;">📞 Contact Links:</h6>
-                    """
-                    
-                # Use pre-calculated contact URLs from fetch_data.py
-                contact_urls = seller.get('contact_urls', {})
-                
-                # Add contact links to popup content
-                if contact_urls.get('website'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['website']}" target="_blank" style="color: #0066cc; text-decoration: none;">
-                            🌐 Website : {contact_urls['website']}
-                        </a>
-                    </p>
-                    """
-                
-                if contact_urls.get('facebook'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['facebook']}" target="_blank" style="color: #1877f2; text-decoration: none;">
-                            📘 Facebook : {contact_urls['facebook']}
-                        </a>
-                    </p>
-                    """
-                
-                if contact_urls.get('instagram'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['instagram']}" target="_blank" style="color: #e4405f; text-decoration: none;">
-                            📷 Instagram : {contact_urls['instagram']}
-                        </a>
-                    </p>
-                    """
-                
-                if contact_urls.get('line'):
-                    popup_content += f"""
-                    <p style="margin: 3px 0; font-size: 11px;">
-                        <a href="{contact_urls['line']}" target="_blank" style="color: #00b900; text-decoration: none;">
-                            💬 Line : {contact_urls['line']}
-                        </a>
-                    </p>
-                    """
-                
-                popup_content += f"""
-                </div>
-                
-                <p style="margin: 5px 0; font-size: 12px;"><strong>Images:</strong> {len(seller['images'])}</p>
-                {seller_images_html}
-                <hr style="margin: 10px 0; border: 1px solid #ddd;">
-                <h5 style="margin: 10px 0 5px 0; color: #333;">🏠 Available Rooms ({len(seller['rooms'])}):</h5>
-                {room_details}
-            </div>
-            """
-            
-            # Add marker with popup
-            folium.Marker(
-                [lat, lon],
-                popup=folium.Popup(popup_content, max_width=300),
-                tooltip=f"{icon_symbol} #{i}: {seller['name_th']}",
-                icon=folium.Icon(color=icon_color, icon='cutlery' if is_restaurant else 'home')
-            ).add_to(google_map)
+        if layer_rows is not None:
+            category = add_seller_row(
+                layer_rows, seller, i, distance_km, popup_data, thumbnails, geojson=render_mode == 'geojson',
+                manifest=manifest
+            )
+        else:
+            category = add_seller_marker(google_map, seller, i, distance_km, thumbnails, manifest)
+        if category == 'restaurant':
+            restaurant_count += 1
+        elif category:
+            accommodation_count += 1
+        
+        # Track the bounds of everything added so a streamed map can be fitted at the end
+        if category:
+            lat = seller['location']['latitude']
+            lon = seller['location']['longitude']
+            bounds[0] = [min(bounds[0][0], lat), min(bounds[0][1], lon)]
+            bounds[1] = [max(bounds[1][0], lat), max(bounds[1][1], lon)]
+    
+    if layer_rows is not None:
+        popup_data_src = os.path.basename(popup_data_file) if lazy_popups and popup_data_file else None
+        if render_mode == 'geojson':
+            seller_layer = SellerGeoJsonLayer(layer_rows, popup_data=popup_data, popup_data_src=popup_data_src)
+        else:
+            seller_layer = SellerMarkerLayer(
+                layer_rows, cluster=render_mode == 'cluster', popup_data=popup_data, popup_data_src=popup_data_src
+            )
+        seller_layer.add_to(google_map)
+    
+    if streaming:
+        if not seller_count:
+            print("No sellers data available")
+            return None
+        google_map.fit_bounds(bounds)
+        print(f"Added {accommodation_count + restaurant_count} of {seller_count} streamed sellers to the map")
+    
+    # List of the sellers nearest to the target
+    if nearest_count:
+        if streaming:
+            nearest = [(i, seller, -distance) for distance, i, seller in sorted(nearest_heap, reverse=True)]
+        if nearest:
+            add_nearest_list(google_map, nearest)
+            if manifest is not None:
+                manifest.update(*[(number, seller['name_th'], f"{distance:.1f}") for number, seller, distance in nearest])
+    
+    if manifest is not None:
+        print(f"[MANIFEST] {manifest.reused} sellers reused from the last run, {manifest.rendered} rendered")
+    
+    # The popup data sidecar, written after the nearest list so the manifest knows whether the page changed
+    if layer_rows is not None and lazy_popups and popup_data_file:
+        if manifest is not None and manifest.unchanged() and os.path.exists(popup_data_file):
+            print(f"Popup data unchanged, '{popup_data_file}' not rewritten")
+        else:
+            seller_layer.write_popup_data(popup_data_file)
+            print(f"Popup data saved as '{popup_data_file}'")
     
     # Add satellite view option
     folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
+        tiles=tile_url('s', tile_proxy),
         attr='Google Satellite',
         name='🛰️ Satellite'
     ).add_to(google_map)
     
     # Add terrain view option
     folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}',
+        tiles=tile_url('p', tile_proxy),
         attr='Google Terrain',
         name='🗺️ Terrain'
     ).add_to(google_map)
     
     # Add hybrid view option (satellite with labels)
     folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}',
+        tiles=tile_url('y', tile_proxy),
         attr='Google Hybrid',
         name='🛰️ Hybrid (Satellite + Labels)'
     ).add_to(google_map)
@@ -410,16 +921,29 @@ def create_sellers_map_with_target(sellers_info, target_lat, target_lon, zoom_st
     
     return google_map
 
-def save_and_open_map(map_obj, filename):
+def save_and_open_map(map_obj, filename, manifest=None, open_browser=True):
     """
     Save the map as HTML and optionally open it in a browser.
     
     Args:
         map_obj: Folium map object
         filename (str): Name of the HTML file to save
+        manifest (RenderManifest): Manifest the map was created with; the file is not rewritten when the page is unchanged (optional)
+        open_browser (bool): Open the saved map in the default browser (False for headless runs)
     """
-    map_obj.save(filename)
-    print(f"Map saved as '{filename}'")
+    if manifest is not None and manifest.unchanged():
+        print(f"Map unchanged since the last run, '{filename}' not rewritten")
+    else:
+        with span('save_map') as fields:
+            map_obj.save(filename)
+            fields['bytes'] = os.path.getsize(filename)
+        observe('map_file_bytes', fields['bytes'])
+        print(f"Map saved as '{filename}'")
+        if manifest is not None:
+            manifest.commit()
+    
+    if not open_browser:
+        return
     
     # Try to open the file in the default browser
     try:
@@ -0,0 +1,325 @@
+import csv
+import os
+import time
+
+import numpy as np
+
+from seller_record import CATEGORIES, SellerBatch, SellerRecord
+
+# Directory of the exported tables: sellers, rooms and images, one file each
+EXPORT_DIR = 'sellers_export'
+
+# File extension per format. Arrow IPC files are memory-mapped when loaded, Parquet files are
+# smaller but decoded on load, CSV needs no pyarrow (empty cells load as None)
+EXPORT_FORMATS = {'arrow': '.arrow', 'parquet': '.parquet', 'csv': '.csv'}
+
+# Normalized tables: (column, type). Rows of rooms and images point back at their seller (and room)
+# by row number, so the loader joins them without a lookup; the ids are there for analytics joins.
+SELLER_COLUMNS = (
+    ('seller_id', 'int'), ('name_th', 'str'), ('name_en', 'str'), ('business_category', 'str'),
+    ('address_no', 'str'), ('moo', 'str'), ('district', 'str'), ('sub_district', 'str'),
+    ('province', 'str'), ('postal_code', 'str'),
+    ('latitude', 'float'), ('longitude', 'float'), ('location_type', 'str'),
+    ('mobile', 'str'), ('email', 'str'), ('additional', 'str'),
+    ('website', 'str'), ('facebook', 'str'), ('instagram', 'str'), ('line', 'str'),
+    ('room_count', 'int'), ('image_count', 'int')
+)
+ROOM_COLUMNS = (
+    ('seller_row', 'int'), ('seller_id', 'int'), ('room_id', 'int'), ('seller_branch_id', 'int'),
+    ('name', 'str'), ('number_of_room', 'int'), ('price', 'str'), ('image_count', 'int')
+)
+IMAGE_COLUMNS = (
+    ('seller_row', 'int'), ('seller_id', 'int'), ('room_row', 'int'), ('room_id', 'int'),
+    ('position', 'int'), ('url', 'str')
+)
+TABLES = {'sellers': SELLER_COLUMNS, 'rooms': ROOM_COLUMNS, 'images': IMAGE_COLUMNS}
+
+# Seller fields per column, (dictionary key, field) for the nested ones
+_SELLER_FIELDS = {
+    'seller_id': ('id',), 'name_th': ('name_th',), 'name_en': ('name_en',),
+    'business_category': ('business_category',),
+    'address_no': ('address', 'no'), 'moo': ('address', 'moo'), 'district': ('address', 'district'),
+    'sub_district': ('address', 'sub_district'), 'province': ('address', 'province'),
+    'postal_code': ('address', 'postal_code'),
+    'latitude': ('location', 'latitude'), 'longitude': ('location', 'longitude'),
+    'location_type': ('location', 'type'),
+    'mobile': ('contact', 'mobile'), 'email': ('contact', 'email'), 'additional': ('contact', 'additional'),
+    'website': ('contact', 'website'), 'facebook': ('contact', 'facebook'),
+    'instagram': ('contact', 'instagram'), 'line': ('contact', 'line')
+}
+_ROOM_FIELDS = {
+    'room_id': 'id', 'seller_branch_id': 'sellerBranchId', 'name': 'name',
+    'number_of_room': 'numberOfRoom', 'price': 'price'
+}
+
+def default_format():
+    """Arrow when pyarrow is installed, CSV otherwise."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'csv'
+    return 'arrow'
+
+def _coerce(value, kind):
+    """A value as its column type, so a column holds one type (None stays None)."""
+    if value is None:
+        return None
+    if kind == 'str':
+        return value if isinstance(value, str) else str(value)
+    if kind == 'int':
+        return int(value)
+    return float(value)
+
+def build_tables(sellers_info):
+    """
+    Normalize sellers into seller, room and image columns.
+
+    Args:
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+
+    Returns:
+        dict: table name -> {column: list of values}
+    """
+    tables = {name: {column: [] for column, _ in columns} for name, columns in TABLES.items()}
+    sellers, rooms, images = tables['sellers'], tables['rooms'], tables['images']
+    seller_kinds, room_kinds = dict(SELLER_COLUMNS), dict(ROOM_COLUMNS)
+
+    for seller_row, seller in enumerate(sellers_info):
+        parts = {'address': seller['address'] or {}, 'location': seller['location'] or {},
+                 'contact': seller['contact'] or {}}
+        seller_id = seller.get('id')
+        for column, field in _SELLER_FIELDS.items():
+            value = seller.get(field[0]) if len(field) == 1 else parts[field[0]].get(field[1])
+            sellers[column].append(_coerce(value, seller_kinds[column]))
+
+        seller_images = seller.get('images') or []
+        seller_rooms = seller.get('rooms') or []
+        sellers['room_count'].append(len(seller_rooms))
+        sellers['image_count'].append(len(seller_images))
+        for position, url in enumerate(seller_images):
+            images['seller_row'].append(seller_row)
+            images['seller_id'].append(seller_id)
+            images['room_row'].append(-1)
+            images['room_id'].append(None)
+            images['position'].append(position)
+            images['url'].append(url)
+
+        for room in seller_rooms:
+            room_row = len(rooms['seller_row'])
+            room_images = room.get('images') or []
+            rooms['seller_row'].append(seller_row)
+            rooms['seller_id'].append(seller_id)
+            for column, key in _ROOM_FIELDS.items():
+                rooms[column].append(_coerce(room.get(key), room_kinds[column]))
+            rooms['image_count'].append(len(room_images))
+            for position, url in enumerate(room_images):
+                images['seller_row'].append(seller_row)
+                images['seller_id'].append(seller_id)
+                images['room_row'].append(room_row)
+                images['room_id'].append(rooms['room_id'][-1])
+                images['position'].append(position)
+                images['url'].append(url)
+    return tables
+
+def _write_table(path, columns, table, format):
+    temp_path = f"{path}.tmp"
+    if format == 'csv':
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([column for column, _ in columns])
+            writer.writerows(zip(*(table[column] for column, _ in columns)))
+    else:
+        import pyarrow as pa
+        types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+        arrow_table = pa.table({column: pa.array(table[column], type=types[kind]) for column, kind in columns})
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(arrow_table, temp_path)
+        else:
+            # Uncompressed, so the loader maps the column buffers instead of decoding them
+            with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+    os.replace(temp_path, path)
+
+def export_sellers(sellers_info, directory=EXPORT_DIR, format=None):
+    """
+    Write sellers, their rooms and their images as columnar tables.
+
+    Files are replaced atomically, and tables of another format left in the
+    directory by an earlier export are removed so the loader cannot mix them.
+
+    Args:
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+        directory (str): Output directory (default: sellers_export)
+        format (str): 'arrow', 'parquet' or 'csv' (default: arrow when pyarrow is installed, else csv)
+
+    Returns:
+        dict: table name -> file path
+    """
+    format = format or default_format()
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of {', '.join(EXPORT_FORMATS)}")
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    tables = build_tables(sellers_info)
+    paths = {}
+    for name, columns in TABLES.items():
+        paths[name] = os.path.join(directory, name + EXPORT_FORMATS[format])
+        _write_table(paths[name], columns, tables[name], format)
+        for other, extension in EXPORT_FORMATS.items():
+            stale = os.path.join(directory, name + extension)
+            if other != format and os.path.exists(stale):
+                os.remove(stale)
+    size = sum(os.path.getsize(path) for path in paths.values())
+    print(f"[EXPORT] {len(tables['sellers']['seller_id'])} sellers, {len(tables['rooms']['room_id'])} rooms, "
+          f"{len(tables['images']['url'])} images as {format} in {directory}/ "
+          f"({size / 2**20:.1f} MB, {time.perf_counter() - started:.2f}s)")
+    return paths
+
+def _read_csv(path, columns):
+    kinds = dict(columns)
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        values = list(zip(*reader)) or [()] * len(header)
+    table = {}
+    for column, cells in zip(header, values):
+        kind = kinds.get(column, 'str')
+        if kind == 'str':
+            table[column] = [cell if cell else None for cell in cells]
+        else:
+            convert = int if kind == 'int' else float
+            table[column] = [convert(cell) if cell else None for cell in cells]
+    return table
+
+def _read_tables(directory):
+    """The exported tables and their format: pyarrow Tables (memory-mapped for Arrow) or dicts of lists for CSV."""
+    for format, extension in EXPORT_FORMATS.items():
+        paths = {name: os.path.join(directory, name + extension) for name in TABLES}
+        if not os.path.exists(paths['sellers']):
+            continue
+        if format == 'csv':
+            return format, {name: _read_csv(path, TABLES[name]) for name, path in paths.items()}
+        import pyarrow as pa
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            return format, {name: pq.read_table(path, memory_map=True) for name, path in paths.items()}
+        return format, {name: pa.ipc.open_file(pa.memory_map(path)).read_all() for name, path in paths.items()}
+    raise FileNotFoundError(f"No exported sellers in {directory}")
+
+def _column_list(table, column):
+    return table.column(column).to_pylist() if hasattr(table, 'column') else table[column]
+
+def _column_array(table, column, dtype, fill):
+    """A column as a NumPy array, nulls replaced by fill (without a copy for Arrow columns that have no nulls)."""
+    if hasattr(table, 'column'):
+        values = table.column(column)
+        if values.null_count:
+            import pyarrow.compute as pc
+            values = pc.fill_null(values, fill)
+        return np.asarray(values.to_numpy(), dtype=dtype)
+    return np.fromiter((fill if value is None else value for value in table[column]), dtype=dtype,
+                       count=len(table[column]))
+
+class ExportedSellerBatch(SellerBatch):
+    """
+    SellerBatch over exported seller tables.
+
+    Ids, coordinates and category codes are read straight from the columns,
+    so the batch is ready for the spatial index, distance filters and the
+    viewport server without touching the text columns. SellerRecords are
+    built from the columns the first time a seller is accessed.
+
+    Args:
+        tables (dict): 'sellers', 'rooms' and 'images' tables from _read_tables
+    """
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._records = None
+        sellers = tables['sellers']
+        self.ids = _column_array(sellers, 'seller_id', np.int64, -1)
+        self.latitude = _column_array(sellers, 'latitude', np.float64, np.nan)
+        self.longitude = _column_array(sellers, 'longitude', np.float64, np.nan)
+
+        if hasattr(sellers, 'column'):
+            # Category codes from the dictionary-encoded column, without a Python string per seller
+            encoded = sellers.column('business_category').combine_chunks().dictionary_encode()
+            names = encoded.dictionary.to_pylist()
+            indices = encoded.indices
+            if indices.null_count:
+                # Sellers without a category get a code of their own, as in SellerBatch
+                indices = indices.fill_null(len(names))
+                names.append(None)
+            codes = np.asarray(indices.to_numpy(), dtype=np.int64)
+        else:
+            names = sorted({category for category in sellers['business_category']}, key=str)
+            index = {category: code for code, category in enumerate(names)}
+            codes = np.fromiter((index[category] for category in sellers['business_category']), dtype=np.int64,
+                                count=len(self.ids))
+        self.categories = list(CATEGORIES)
+        for category in names:
+            if category not in self.categories:
+                self.categories.append(category)
+        remap = np.array([self.categories.index(category) for category in names] or [0], dtype=np.int8)
+        self.category_codes = remap[codes] if len(codes) else np.zeros(0, dtype=np.int8)
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = self._build_records()
+        return self._records
+
+    def _build_records(self):
+        sellers, rooms, images = self._tables['sellers'], self._tables['rooms'], self._tables['images']
+        count = len(self.ids)
+        seller_images = [[] for _ in range(count)]
+        room_images = [[] for _ in range(rooms.num_rows if hasattr(rooms, 'num_rows') else len(rooms['room_id']))]
+        for seller_row, room_row, url in zip(_column_list(images, 'seller_row'), _column_list(images, 'room_row'),
+                                             _column_list(images, 'url')):
+            (room_images[room_row] if room_row >= 0 else seller_images[seller_row]).append(url)
+
+        seller_rooms = [[] for _ in range(count)]
+        room_columns = [_column_list(rooms, column) for column in ('seller_row', *_ROOM_FIELDS)]
+        for room_row, (seller_row, *values) in enumerate(zip(*room_columns)):
+            room = dict(zip(_ROOM_FIELDS.values(), values))
+            room['images'] = room_images[room_row]
+            seller_rooms[seller_row].append(room)
+
+        columns = {column: _column_list(sellers, column) for column in _SELLER_FIELDS}
+        records = []
+        for row in range(count):
+            seller_info = {'address': {}, 'location': {}, 'contact': {}}
+            for column, field in _SELLER_FIELDS.items():
+                if len(field) == 1:
+                    seller_info[field[0]] = columns[column][row]
+                else:
+                    seller_info[field[0]][field[1]] = columns[column][row]
+            seller_info['rooms'] = seller_rooms[row]
+            seller_info['images'] = seller_images[row]
+            records.append(SellerRecord(seller_info))
+        return records
+
+    def __len__(self):
+        return len(self.ids)
+
+def load_sellers(directory=EXPORT_DIR):
+    """
+    Load exported sellers as a compact batch the map renderer accepts.
+
+    Arrow files are memory-mapped, so loading costs little beyond opening
+    the files however many sellers they hold; records are built on first
+    use. Parquet and CSV files are read in full.
+
+    Args:
+        directory (str): Directory written by export_sellers
+
+    Returns:
+        ExportedSellerBatch: Dict-compatible sellers with their coordinate and category arrays
+    """
+    started = time.perf_counter()
+    format, tables = _read_tables(directory)
+    batch = ExportedSellerBatch(tables)
+    print(f"[EXPORT] Loaded {len(batch)} sellers ({format}) from {directory}/ "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return batch
@@ -0,0 +1,271 @@
+import os
+import sys
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+# Category codes used by SellerBatch, unknown categories are appended after these
+CATEGORIES = ('accommodation', 'restaurant')
+
+def _intern(value):
+    """Intern repeated strings (provinces, districts, categories, prices) so sellers share one copy."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _pack_urls(urls):
+    """
+    Pack image URLs into (shared prefix, newline-joined suffixes).
+
+    Two strings per seller or room instead of one str object per URL plus a list.
+    """
+    if not urls:
+        return None, None
+    prefix = os.path.commonprefix(urls) if len(urls) > 1 else urls[0]
+    prefix = prefix[:prefix.rfind('/') + 1]
+    return _intern(prefix), '\n'.join(url[len(prefix):] for url in urls)
+
+def _unpack_urls(prefix, suffixes):
+    if suffixes is None:
+        return []
+    return [prefix + suffix for suffix in suffixes.split('\n')]
+
+class RoomRecord(Mapping):
+    """
+    Compact, read-only room with the same keys as a room dict from the API.
+
+    Args:
+        room (dict): Room dictionary from the API ('id', 'sellerBranchId', 'name', 'numberOfRoom', 'price', 'images')
+    """
+
+    __slots__ = ('id', 'seller_branch_id', 'name', 'number_of_room', 'price', '_image_prefix', '_image_suffixes')
+
+    _KEYS = ('id', 'sellerBranchId', 'name', 'numberOfRoom', 'price', 'images')
+
+    def __init__(self, room):
+        self.id = room.get('id')
+        self.seller_branch_id = room.get('sellerBranchId')
+        self.name = _intern(room.get('name'))
+        self.number_of_room = room.get('numberOfRoom')
+        self.price = _intern(room.get('price'))
+        self._image_prefix, self._image_suffixes = _pack_urls(room.get('images'))
+
+    @property
+    def images(self):
+        return _unpack_urls(self._image_prefix, self._image_suffixes)
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        if key == 'sellerBranchId':
+            return self.seller_branch_id
+        if key == 'name':
+            return self.name
+        if key == 'numberOfRoom':
+            return self.number_of_room
+        if key == 'price':
+            return self.price
+        if key == 'images':
+            return self.images
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def to_dict(self):
+        return {key: self[key] for key in self._KEYS}
+
+class SellerRecord(Mapping):
+    """
+    Compact, read-only seller backed by __slots__ instead of nested dicts.
+
+    Behaves like the seller_info dictionary from fetch_data.parse_seller:
+    seller['location']['latitude'], seller['address']['district'],
+    seller.get('contact_urls', {}) and so on work unchanged, with the nested
+    dictionaries built on access. Repeated strings are interned and image
+    URLs are packed, so tens of thousands of sellers fit in a fraction of
+    the memory the dictionaries need.
+
+    Args:
+        seller_info (dict): Seller dictionary as returned by fetch_data.parse_seller
+    """
+
+    __slots__ = (
+        'id', 'name_th', 'name_en', 'business_category',
+        'address_no', 'moo', 'district', 'sub_district', 'province', 'postal_code',
+        'longitude', 'latitude', 'location_type',
+        'mobile', 'email', 'additional', 'website', 'facebook', 'instagram', 'line',
+        'rooms', '_image_prefix', '_image_suffixes'
+    )
+
+    _KEYS = ('id', 'name_th', 'name_en', 'business_category', 'address', 'location', 'contact', 'rooms', 'images', 'contact_urls')
+
+    def __init__(self, seller_info):
+        address = seller_info.get('address') or {}
+        location = seller_info.get('location') or {}
+        contact = seller_info.get('contact') or {}
+        self.id = seller_info.get('id')
+        self.name_th = seller_info.get('name_th')
+        self.name_en = seller_info.get('name_en')
+        self.business_category = _intern(seller_info.get('business_category'))
+        self.address_no = address.get('no')
+        self.moo = _intern(address.get('moo'))
+        self.district = _intern(address.get('district'))
+        self.sub_district = _intern(address.get('sub_district'))
+        self.province = _intern(address.get('province'))
+        self.postal_code = _intern(address.get('postal_code'))
+        self.longitude = location.get('longitude')
+        self.latitude = location.get('latitude')
+        self.location_type = _intern(location.get('type'))
+        self.mobile = contact.get('mobile')
+        self.email = contact.get('email')
+        self.additional = _intern(contact.get('additional'))
+        self.website = _intern(contact.get('website'))
+        self.facebook = _intern(contact.get('facebook'))
+        self.instagram = _intern(contact.get('instagram'))
+        self.line = _intern(contact.get('line'))
+        self.rooms = tuple(RoomRecord(room) for room in seller_info.get('rooms') or ())
+        self._image_prefix, self._image_suffixes = _pack_urls(seller_info.get('images'))
+
+    @classmethod
+    def from_dict(cls, seller_info):
+        """Return seller_info as a SellerRecord, records are returned unchanged."""
+        return seller_info if isinstance(seller_info, cls) else cls(seller_info)
+
+    @property
+    def address(self):
+        return {
+            'no': self.address_no,
+            'moo': self.moo,
+            'district': self.district,
+            'sub_district': self.sub_district,
+            'province': self.province,
+            'postal_code': self.postal_code
+        }
+
+    @property
+    def location(self):
+        return {'longitude': self.longitude, 'latitude': self.latitude, 'type': self.location_type}
+
+    @property
+    def contact(self):
+        return {
+            'mobile': self.mobile,
+            'email': self.email,
+            'additional': self.additional,
+            'website': self.website,
+            'facebook': self.facebook,
+            'instagram': self.instagram,
+            'line': self.line
+        }
+
+    @property
+    def contact_urls(self):
+        # Derived from the contact fields on access rather than stored per seller
+        from fetch_data import build_contact_urls
+        return build_contact_urls(self.contact)
+
+    @property
+    def images(self):
+        return _unpack_urls(self._image_prefix, self._image_suffixes)
+
+    def __getitem__(self, key):
+        if key in ('id', 'name_th', 'name_en', 'business_category', 'address', 'location', 'contact', 'images', 'contact_urls'):
+            return getattr(self, key)
+        if key == 'rooms':
+            return list(self.rooms)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __repr__(self):
+        return f"SellerRecord(id={self.id!r}, name_th={self.name_th!r}, business_category={self.business_category!r})"
+
+    def to_dict(self):
+        """Return the seller as the nested dictionary fetch_data.parse_seller produces."""
+        seller_info = {key: self[key] for key in self._KEYS}
+        seller_info['rooms'] = [room.to_dict() for room in self.rooms]
+        return seller_info
+
+class SellerBatch(Sequence):
+    """
+    Columnar batch of sellers for vectorized work on large seller sets.
+
+    Ids, coordinates and category codes live in NumPy arrays. The detailed
+    fields stay in SellerRecord objects, so the batch is still a sequence
+    of dict-compatible sellers that create_sellers_map_with_target accepts.
+
+    Args:
+        sellers (iterable): seller_info dictionaries or SellerRecord objects
+
+    Attributes:
+        ids (np.ndarray): int64 seller ids (-1 when missing)
+        latitude (np.ndarray): float64 latitudes (NaN when missing)
+        longitude (np.ndarray): float64 longitudes (NaN when missing)
+        category_codes (np.ndarray): int8 index into categories
+        categories (list): Category names, CATEGORIES first
+    """
+
+    def __init__(self, sellers):
+        self.records = [SellerRecord.from_dict(seller) for seller in sellers]
+        count = len(self.records)
+        self.categories = list(CATEGORIES)
+        for record in self.records:
+            if record.business_category not in self.categories:
+                self.categories.append(record.business_category)
+        category_index = {category: code for code, category in enumerate(self.categories)}
+
+        self.ids = np.fromiter(
+            (record.id if record.id is not None else -1 for record in self.records), dtype=np.int64, count=count
+        )
+        self.latitude = np.fromiter(
+            (record.latitude if record.latitude is not None else np.nan for record in self.records),
+            dtype=np.float64, count=count
+        )
+        self.longitude = np.fromiter(
+            (record.longitude if record.longitude is not None else np.nan for record in self.records),
+            dtype=np.float64, count=count
+        )
+        self.category_codes = np.fromiter(
+            (category_index[record.business_category] for record in self.records), dtype=np.int8, count=count
+        )
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def has_location(self):
+        """Boolean mask of sellers with both coordinates (the map skips the others)."""
+        return ~(np.isnan(self.latitude) | np.isnan(self.longitude)) & (self.latitude != 0) & (self.longitude != 0)
+
+    def category_mask(self, category):
+        """Boolean mask of sellers in a business category."""
+        if category not in self.categories:
+            return np.zeros(len(self), dtype=bool)
+        return self.category_codes == self.categories.index(category)
+
+    def to_dicts(self):
+        """Return the sellers as plain seller_info dictionaries (e.g. for JSON)."""
+        return [record.to_dict() for record in self.records]
+
+def compact_sellers(sellers_info):
+    """
+    Convert a list of seller_info dictionaries into a SellerBatch.
+
+    Args:
+        sellers_info (list): Seller dictionaries from call_api / fetch_sellers
+
+    Returns:
+        SellerBatch: Compact, dict-compatible batch of the same sellers
+    """
+    return SellerBatch(sellers_info)
@@ -0,0 +1,509 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import zlib
+
+from cache_store import _format_bytes, _format_time
+from render_manifest import seller_content
+
+# SQLite file holding every snapshot, next to the API cache
+SNAPSHOT_DB = 'seller_snapshots.sqlite'
+
+# Coordinates that moved less than this are not reported as moved (rounding, re-geocoding noise)
+MOVE_THRESHOLD_M = 10.0
+
+# Name prefixes of the sellers on the changes map
+CHANGE_MARKERS = {'added': '🆕', 'removed': '❌', 'changed': '✏️'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    digest TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    digest TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at REAL NOT NULL,
+    label TEXT,
+    sellers INTEGER NOT NULL,
+    members TEXT NOT NULL REFERENCES members (digest)
+);
+"""
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:20]
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+class SnapshotStore:
+    """
+    Timestamped snapshots of fetched sellers, stored without repeating unchanged sellers.
+
+    A seller is stored once per distinct content, keyed by the hash of its
+    canonical JSON; a snapshot is the list of (seller key, content hash)
+    pairs, itself stored once per distinct list. A day on which nothing
+    changed costs one row, a day on which a few sellers changed costs those
+    sellers plus the compressed list.
+
+    Args:
+        path (str): SQLite database file (default: seller_snapshots.sqlite)
+    """
+
+    def __init__(self, path=SNAPSHOT_DB):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def take(self, sellers_info, label=None):
+        """
+        Store the sellers as a new snapshot.
+
+        Args:
+            sellers_info (list): Seller dictionaries/records, or a SellerBatch
+            label (str): Free text stored with the snapshot, e.g. the query (optional)
+
+        Returns:
+            int: Snapshot id
+        """
+        started = time.perf_counter()
+        members = {}
+        contents = {}
+        for seller in sellers_info:
+            content = seller_content(seller)
+            digest = _digest(content)
+            seller_id = seller.get('id')
+            # Sellers without an id can only be matched by content, so a change shows as removed + added
+            key = str(seller_id) if seller_id is not None else f"content:{digest}"
+            members[key] = digest
+            contents[digest] = content
+
+        members_blob = _pack(sorted(members.items()))
+        members_digest = hashlib.sha1(members_blob).hexdigest()
+        # Only contents not stored by an earlier snapshot are compressed and written
+        known = {
+            digest for digest, in self._conn.execute(
+                "SELECT digest FROM records WHERE digest IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(contents)),)
+            )
+        }
+        new = [(digest, zlib.compress(content.encode('utf-8')))
+               for digest, content in contents.items() if digest not in known]
+        self._conn.execute("BEGIN")
+        self._conn.executemany("INSERT OR IGNORE INTO records (digest, value) VALUES (?, ?)", new)
+        self._conn.execute("INSERT OR IGNORE INTO members (digest, value) VALUES (?, ?)",
+                           (members_digest, members_blob))
+        snapshot_id = self._conn.execute(
+            "INSERT INTO snapshots (taken_at, label, sellers, members) VALUES (?, ?, ?, ?)",
+            (time.time(), label, len(members), members_digest)
+        ).lastrowid
+        self._conn.execute("COMMIT")
+        print(f"[SNAPSHOT] #{snapshot_id}: {len(members)} sellers, {len(new)} new or changed records stored "
+              f"({len(members) - len(new)} deduplicated) in {time.perf_counter() - started:.2f}s")
+        return snapshot_id
+
+    def snapshots(self):
+        """Return the snapshots, oldest first, as dicts with id, taken_at, label and sellers."""
+        return [
+            {'id': snapshot_id, 'taken_at': taken_at, 'label': label, 'sellers': sellers}
+            for snapshot_id, taken_at, label, sellers in self._conn.execute(
+                "SELECT id, taken_at, label, sellers FROM snapshots ORDER BY id"
+            )
+        ]
+
+    def snapshot(self, snapshot_id):
+        row = self._conn.execute(
+            "SELECT id, taken_at, label, sellers FROM snapshots WHERE id = ?", (snapshot_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No snapshot #{snapshot_id}")
+        return dict(zip(('id', 'taken_at', 'label', 'sellers'), row))
+
+    def previous(self, snapshot_id):
+        """
+        Id of the newest earlier snapshot with the same label, None for the first one of its query.
+
+        Snapshots of other queries (other provinces or categories) are skipped,
+        their sellers would all show up as added or removed.
+        """
+        row = self._conn.execute(
+            "SELECT MAX(id) FROM snapshots WHERE id < ? AND label IS (SELECT label FROM snapshots WHERE id = ?)",
+            (snapshot_id, snapshot_id)
+        ).fetchone()
+        return row[0]
+
+    def members(self, snapshot_id):
+        """Seller key -> content hash of a snapshot."""
+        row = self._conn.execute(
+            "SELECT members.value FROM snapshots JOIN members ON members.digest = snapshots.members "
+            "WHERE snapshots.id = ?", (snapshot_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No snapshot #{snapshot_id}")
+        return dict(_unpack(row[0]))
+
+    def records(self, digests):
+        """Content hash -> seller dictionary, for the given hashes only."""
+        return {
+            digest: json.loads(zlib.decompress(value))
+            for digest, value in self._conn.execute(
+                "SELECT digest, value FROM records WHERE digest IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(digests)),)
+            )
+        }
+
+    def diff(self, old_id, new_id):
+        """
+        Compare two snapshots, in time linear in their seller counts.
+
+        Both snapshots are indexed by seller key; only the sellers whose
+        content hash differs are loaded and compared field by field.
+
+        Args:
+            old_id (int): Earlier snapshot
+            new_id (int): Later snapshot
+
+        Returns:
+            SnapshotDiff: Added, removed and changed sellers
+        """
+        old, new = self.members(old_id), self.members(new_id)
+        added = [key for key in new if key not in old]
+        removed = [key for key in old if key not in new]
+        changed = [key for key, digest in new.items() if key in old and old[key] != digest]
+        records = self.records(
+            {new[key] for key in added} | {old[key] for key in removed}
+            | {new[key] for key in changed} | {old[key] for key in changed}
+        )
+        return SnapshotDiff(
+            self.snapshot(old_id),
+            self.snapshot(new_id),
+            added=[records[new[key]] for key in added],
+            removed=[records[old[key]] for key in removed],
+            changed=[(records[old[key]], records[new[key]]) for key in changed],
+            unchanged=len(new) - len(added) - len(changed)
+        )
+
+    def prune(self, keep):
+        """
+        Delete all but the newest keep snapshots, and the records only they used.
+
+        Args:
+            keep (int): Snapshots to keep, at least 1 so the next fetch still has one to compare with
+
+        Returns:
+            tuple: (snapshots deleted, records deleted)
+
+        Raises:
+            ValueError: If keep is less than 1
+        """
+        if keep < 1:
+            raise ValueError(f"keep must be at least 1, got {keep}")
+        self._conn.execute("BEGIN")
+        deleted = self._conn.execute(
+            "DELETE FROM snapshots WHERE id NOT IN (SELECT id FROM snapshots ORDER BY id DESC LIMIT ?)", (keep,)
+        ).rowcount
+        self._conn.execute("DELETE FROM members WHERE digest NOT IN (SELECT members FROM snapshots)")
+        used = set()
+        for blob, in self._conn.execute("SELECT value FROM members"):
+            used.update(digest for _, digest in _unpack(blob))
+        stored = [digest for digest, in self._conn.execute("SELECT digest FROM records")]
+        unused = [(digest,) for digest in stored if digest not in used]
+        self._conn.executemany("DELETE FROM records WHERE digest = ?", unused)
+        self._conn.execute("COMMIT")
+        self._conn.execute("VACUUM")
+        return deleted, len(unused)
+
+    def stats(self):
+        """Return snapshot, record and seller-list counts and the database size."""
+        counts = {
+            table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('snapshots', 'records', 'members')
+        }
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        return {'path': self.path, **counts, 'bytes': page_size * page_count}
+
+    def close(self):
+        self._conn.close()
+
+def _seller_summary(seller):
+    location = seller.get('location') or {}
+    return {
+        'id': seller.get('id'),
+        'name': seller.get('name_th') or seller.get('name_en'),
+        'category': seller.get('business_category'),
+        'location': [location.get('latitude'), location.get('longitude')]
+    }
+
+def _room_summary(room):
+    return {'room_id': room.get('id'), 'name': room.get('name'), 'price': room.get('price'),
+            'numberOfRoom': room.get('numberOfRoom')}
+
+def _room_details(room):
+    return {key: value for key, value in room.items() if key not in ('price', 'numberOfRoom')}
+
+def compare_sellers(old, new):
+    """
+    Field-level changes of one seller between two snapshots.
+
+    Rooms are matched by id: changed prices and room counts, added and
+    removed rooms are listed; other changed fields are named only.
+
+    Returns:
+        dict: Change entry (moved coordinates are added by SnapshotDiff, which measures them in one pass)
+    """
+    entry = _seller_summary(new)
+    old_rooms = {room.get('id'): room for room in old.get('rooms') or []}
+    new_rooms = {room.get('id'): room for room in new.get('rooms') or []}
+    rooms = []
+    for room_id, room in new_rooms.items():
+        before = old_rooms.get(room_id)
+        if before is None:
+            continue
+        change = {key: [before.get(key), room.get(key)] for key in ('price', 'numberOfRoom')
+                  if before.get(key) != room.get(key)}
+        if change:
+            rooms.append({'room_id': room_id, 'name': room.get('name'), **change})
+    if rooms:
+        entry['rooms'] = rooms
+    rooms_added = [_room_summary(room) for room_id, room in new_rooms.items() if room_id not in old_rooms]
+    rooms_removed = [_room_summary(room) for room_id, room in old_rooms.items() if room_id not in new_rooms]
+    if rooms_added:
+        entry['rooms_added'] = rooms_added
+    if rooms_removed:
+        entry['rooms_removed'] = rooms_removed
+
+    fields = sorted(
+        key for key in set(old) | set(new)
+        if key not in ('rooms', 'location', 'contact_urls') and old.get(key) != new.get(key)
+    )
+    if (old.get('location') or {}).get('type') != (new.get('location') or {}).get('type'):
+        fields.append('location')
+    # Room changes besides price and room count (name, images, ...)
+    if any(room_id in old_rooms and _room_details(old_rooms[room_id]) != _room_details(room)
+           for room_id, room in new_rooms.items()):
+        fields.append('rooms')
+    if fields:
+        entry['fields'] = fields
+    return entry
+
+class SnapshotDiff:
+    """
+    Sellers added, removed and changed between two snapshots.
+
+    Attributes:
+        old (dict): Earlier snapshot (id, taken_at, label, sellers)
+        new (dict): Later snapshot
+        added (list): Seller dictionaries only in the later snapshot
+        removed (list): Seller dictionaries only in the earlier snapshot
+        changed (list): Change entries (see compare_sellers), each with 'moved' when the coordinates moved
+        unchanged (int): Sellers in both snapshots with the same content
+    """
+
+    def __init__(self, old, new, added, removed, changed, unchanged):
+        from geo import haversine_km
+        import numpy as np
+
+        self.old = old
+        self.new = new
+        self.added = added
+        self.removed = removed
+        self.unchanged = unchanged
+        self._changed_sellers = [after for _, after in changed]
+        self.changed = [compare_sellers(before, after) for before, after in changed]
+
+        # Moved coordinates, measured for all changed sellers at once
+        coordinates = np.array([
+            [(before.get('location') or {}).get('latitude'), (before.get('location') or {}).get('longitude'),
+             (after.get('location') or {}).get('latitude'), (after.get('location') or {}).get('longitude')]
+            for before, after in changed
+        ], dtype=np.float64).reshape(-1, 4)
+        meters = haversine_km(coordinates[:, 0], coordinates[:, 1], coordinates[:, 2], coordinates[:, 3]) * 1000
+        for entry, row, distance in zip(self.changed, coordinates, meters):
+            lost_or_found = np.isnan(row[0]) != np.isnan(row[2])
+            if lost_or_found or distance >= MOVE_THRESHOLD_M:
+                entry['moved'] = {
+                    'from': [None if np.isnan(value) else float(value) for value in row[:2]],
+                    'to': [None if np.isnan(value) else float(value) for value in row[2:]],
+                    'meters': None if np.isnan(distance) else round(float(distance), 1)
+                }
+        # Sellers whose only difference is below the move threshold are not reported
+        kept = [(entry, seller) for entry, seller in zip(self.changed, self._changed_sellers)
+                if set(entry) - {'id', 'name', 'category', 'location'}]
+        self.unchanged += len(self.changed) - len(kept)
+        self.changed = [entry for entry, _ in kept]
+        self._changed_sellers = [seller for _, seller in kept]
+
+    def summary(self):
+        return {
+            'added': len(self.added),
+            'removed': len(self.removed),
+            'changed': len(self.changed),
+            'moved': sum(1 for entry in self.changed if 'moved' in entry),
+            'price_or_room_changes': sum(1 for entry in self.changed
+                                         if {'rooms', 'rooms_added', 'rooms_removed'} & set(entry)),
+            'unchanged': self.unchanged
+        }
+
+    def write(self, path):
+        """
+        Write the changes as JSON lines: a header with both snapshots and the counts, then one line per seller.
+
+        Args:
+            path (str): Changes file, e.g. changes.jsonl
+        """
+        def snapshot(info):
+            return {'id': info['id'], 'taken_at': _format_time(info['taken_at']), 'label': info['label']}
+
+        with open(path, 'w', encoding='utf-8') as f:
+            header = {'from': snapshot(self.old), 'to': snapshot(self.new), **self.summary()}
+            lines = [header]
+            lines += [{'change': 'added', **_seller_summary(seller)} for seller in self.added]
+            lines += [{'change': 'removed', **_seller_summary(seller)} for seller in self.removed]
+            lines += [{'change': 'changed', **entry} for entry in self.changed]
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n')
+        print(f"[SNAPSHOT] Changes #{self.old['id']} -> #{self.new['id']} written to {path}")
+
+    def sellers(self):
+        """The added, removed and changed sellers for a map, their names prefixed with CHANGE_MARKERS."""
+        marked = []
+        for change, sellers in (('added', self.added), ('changed', self._changed_sellers), ('removed', self.removed)):
+            for seller in sellers:
+                seller = dict(seller)
+                seller['name_th'] = f"{CHANGE_MARKERS[change]} {seller.get('name_th') or ''}".strip()
+                marked.append(seller)
+        return marked
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"[SNAPSHOT] #{self.old['id']} ({_format_time(self.old['taken_at'])}) -> "
+              f"#{self.new['id']} ({_format_time(self.new['taken_at'])}): "
+              f"{summary['added']} added, {summary['removed']} removed, {summary['changed']} changed "
+              f"({summary['moved']} moved, {summary['price_or_room_changes']} with room changes), "
+              f"{summary['unchanged']} unchanged")
+
+def save_changes_map(changes, output, target_lat, target_lon, **map_kwargs):
+    """
+    Map of only the added, removed and changed sellers.
+
+    Args:
+        changes (SnapshotDiff): Diff to show
+        output (str): Map HTML file
+        target_lat (float): Target latitude
+        target_lon (float): Target longitude
+        **map_kwargs: Further create_sellers_map_with_target arguments (zoom_start, render_mode, tile_proxy, ...)
+
+    Returns:
+        bool: True if a map was written, False when nothing changed
+    """
+    sellers = changes.sellers()
+    if not sellers:
+        print("[SNAPSHOT] No changes, changes map not written")
+        return False
+    from run_maps import create_sellers_map_with_target, save_and_open_map
+    changes_map = create_sellers_map_with_target(sellers, target_lat, target_lon, **map_kwargs)
+    save_and_open_map(changes_map, output, open_browser=False)
+    return True
+
+def snapshot_and_diff(sellers_info, label=None, changes_file=None, changes_map=None, target=None, path=SNAPSHOT_DB,
+                      **map_kwargs):
+    """
+    Store a fetch as a snapshot and report the changes since the previous one.
+
+    Args:
+        sellers_info (list): Fetched seller dictionaries
+        label (str): Snapshot label (optional)
+        changes_file (str): Write the changes here (optional)
+        changes_map (str): Write a map of the changed sellers here (optional, needs target)
+        target (tuple): (latitude, longitude) of the changes map
+        path (str): Snapshot database
+        **map_kwargs: Further create_sellers_map_with_target arguments
+
+    Returns:
+        SnapshotDiff: Changes since the previous snapshot, None for the first snapshot
+    """
+    store = SnapshotStore(path)
+    try:
+        snapshot_id = store.take(sellers_info, label)
+        previous_id = store.previous(snapshot_id)
+        if previous_id is None:
+            print("[SNAPSHOT] First snapshot of this query, nothing to compare with yet")
+            return None
+        changes = store.diff(previous_id, snapshot_id)
+    finally:
+        store.close()
+    changes.print_summary()
+    if changes_file:
+        changes.write(changes_file)
+    if changes_map:
+        save_changes_map(changes, changes_map, target[0], target[1], **map_kwargs)
+    return changes
+
+def main(argv=None):
+    """Command line interface to list, compare and prune snapshots."""
+    parser = argparse.ArgumentParser(description="List, compare and prune the seller snapshots")
+    parser.add_argument('--db', default=SNAPSHOT_DB, help=f"snapshot database (default: {SNAPSHOT_DB})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list the snapshots")
+    diff = commands.add_parser('diff', help="compare two snapshots (default: the latest and the one before of its query)")
+    diff.add_argument('old', type=int, nargs='?', help="earlier snapshot id (default: the previous one with the same label)")
+    diff.add_argument('new', type=int, nargs='?', help="later snapshot id (default: the latest)")
+    diff.add_argument('--output', help="write the changes as JSON lines")
+    diff.add_argument('--map', help="write a map of the changed sellers")
+    diff.add_argument('--target', nargs=2, type=float, metavar=('LAT', 'LON'), help="target of the map")
+    prune = commands.add_parser('prune', help="keep only the newest snapshots")
+    prune.add_argument('--keep', type=int, required=True, help="newest snapshots to keep (at least 1)")
+    commands.add_parser('stats', help="show snapshot and record counts")
+    args = parser.parse_args(argv)
+    if args.command == 'prune' and args.keep < 1:
+        parser.error("--keep must be at least 1")
+
+    store = SnapshotStore(args.db)
+    try:
+        if args.command == 'list':
+            for snapshot in store.snapshots():
+                print(f"#{snapshot['id']:<5} {_format_time(snapshot['taken_at'])}  {snapshot['sellers']:>7} sellers"
+                      f"  {snapshot['label'] or ''}")
+        elif args.command == 'diff':
+            snapshots = [snapshot['id'] for snapshot in store.snapshots()]
+            new = args.new or (snapshots[-1] if snapshots else None)
+            old = args.old or (store.previous(new) if new else None)
+            if old is None or new is None:
+                print("Need two snapshots of the same query to compare")
+                return 1
+            changes = store.diff(old, new)
+            changes.print_summary()
+            if args.output:
+                changes.write(args.output)
+            if args.map:
+                if not args.target:
+                    print("--map needs --target LAT LON")
+                    return 1
+                save_changes_map(changes, args.map, *args.target)
+        elif args.command == 'prune':
+            deleted, records = store.prune(args.keep)
+            print(f"Removed {deleted} snapshots and {records} records no longer used")
+        elif args.command == 'stats':
+            stats = store.stats()
+            print(f"Database: {stats['path']}")
+            print(f"Snapshots: {stats['snapshots']}, distinct seller lists: {stats['members']}, "
+                  f"distinct seller records: {stats['records']}")
+            print(f"Size: {_format_bytes(stats['bytes'])}")
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.exit(main())
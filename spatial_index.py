@@ -0,0 +1,249 @@
+import hashlib
+import math
+import os
+
+import numpy as np
+
+from cache_store import CACHE_DB
+from geo import EARTH_RADIUS_KM, haversine_km, nearest_indices, seller_coordinates
+
+# Index of the last seller set, stored next to the API cache and rebuilt when the coordinates change
+INDEX_FILE = os.path.join(os.path.dirname(CACHE_DB), 'seller_index.npz')
+
+# Grid cell size in degrees (~5.5 km), small enough that a query only touches a few cells
+GRID_CELL_DEGREES = 0.05
+
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def coordinates_digest(latitude, longitude):
+    """Hash of the coordinate arrays, used to tell whether a stored index still matches the sellers."""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(latitude, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(longitude, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+class SpatialIndex:
+    """
+    Uniform lat/lon grid over seller coordinates.
+
+    Points are sorted by grid cell (row-major), so the points of a run of
+    cells in one grid row are contiguous and a bounding box is answered with
+    two binary searches per grid row it spans, instead of a scan over every
+    seller. Radius and k-nearest queries narrow down to a bounding box first
+    and compute exact haversine distances only for the candidates.
+
+    Query results are indices into the seller list the index was built from.
+    Sellers without coordinates (missing or 0, like the map skips) are not indexed.
+
+    Args:
+        latitude (np.ndarray): Seller latitudes in degrees (NaN when missing)
+        longitude (np.ndarray): Seller longitudes in degrees (NaN when missing)
+        cell_degrees (float): Grid cell size in degrees (default: GRID_CELL_DEGREES)
+    """
+
+    def __init__(self, latitude, longitude, cell_degrees=GRID_CELL_DEGREES):
+        latitude = np.array(latitude, dtype=np.float64)
+        longitude = np.array(longitude, dtype=np.float64)
+        missing = np.isnan(latitude) | np.isnan(longitude) | (latitude == 0) | (longitude == 0)
+        latitude[missing] = np.nan
+        longitude[missing] = np.nan
+
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell_degrees = cell_degrees
+        self.columns = int(math.ceil(360 / cell_degrees)) + 1
+        self.digest = coordinates_digest(latitude, longitude)
+
+        valid = np.flatnonzero(~missing)
+        keys = self._cell_keys(latitude[valid], longitude[valid])
+        sort = np.argsort(keys, kind='stable')
+        self.keys = keys[sort]
+        self.order = valid[sort]
+
+    @classmethod
+    def from_sellers(cls, sellers, cell_degrees=GRID_CELL_DEGREES):
+        """
+        Build an index over a seller list.
+
+        Args:
+            sellers: List of seller dictionaries/records, or a SellerBatch
+            cell_degrees (float): Grid cell size in degrees
+
+        Returns:
+            SpatialIndex: Index whose query results are positions in sellers
+        """
+        latitude, longitude = seller_coordinates(sellers)
+        return cls(latitude, longitude, cell_degrees)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _rows(self, latitude):
+        return np.floor((np.asarray(latitude) + 90) / self.cell_degrees).astype(np.int64)
+
+    def _columns(self, longitude):
+        return np.floor((np.asarray(longitude) + 180) / self.cell_degrees).astype(np.int64)
+
+    def _cell_keys(self, latitude, longitude):
+        return self._rows(latitude) * self.columns + self._columns(longitude)
+
+    def centroid(self, indices=None):
+        """
+        Sum and count of the indexed coordinates, optionally only for some sellers.
+
+        Returns:
+            tuple: (latitude_sum, longitude_sum, count)
+        """
+        if indices is None:
+            latitude = self.latitude[self.order]
+            longitude = self.longitude[self.order]
+        else:
+            latitude = self.latitude[indices]
+            longitude = self.longitude[indices]
+            valid = ~np.isnan(latitude)
+            latitude = latitude[valid]
+            longitude = longitude[valid]
+        return float(latitude.sum()), float(longitude.sum()), len(latitude)
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Sellers inside a bounding box.
+
+        Args:
+            min_lat (float): South edge
+            min_lon (float): West edge
+            max_lat (float): North edge
+            max_lon (float): East edge
+
+        Returns:
+            np.ndarray: Seller indices inside the box, in their original order
+        """
+        if not len(self.order) or min_lat > max_lat or min_lon > max_lon:
+            return np.empty(0, dtype=np.intp)
+        min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+        min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+
+        rows = np.arange(self._rows(min_lat), self._rows(max_lat) + 1, dtype=np.int64) * self.columns
+        starts = np.searchsorted(self.keys, rows + self._columns(min_lon), side='left')
+        ends = np.searchsorted(self.keys, rows + self._columns(max_lon), side='right')
+        candidates = np.concatenate([self.order[start:end] for start, end in zip(starts, ends) if end > start] or [[]])
+        candidates = candidates.astype(np.intp)
+
+        latitude = self.latitude[candidates]
+        longitude = self.longitude[candidates]
+        inside = (latitude >= min_lat) & (latitude <= max_lat) & (longitude >= min_lon) & (longitude <= max_lon)
+        return np.sort(candidates[inside])
+
+    def radius(self, target_lat, target_lon, radius_km, with_distances=False):
+        """
+        Sellers within radius_km of a point.
+
+        Args:
+            target_lat (float): Centre latitude
+            target_lon (float): Centre longitude
+            radius_km (float): Radius in km
+            with_distances (bool): Also return the distances (default: False)
+
+        Returns:
+            np.ndarray: Seller indices in their original order, or (indices, distances) with with_distances
+        """
+        angle = radius_km / EARTH_RADIUS_KM
+        delta_lat = math.degrees(angle)
+        if abs(target_lat) + delta_lat >= 90 or angle >= math.pi / 2:
+            delta_lon = 180.0
+        else:
+            # Widest longitude span of the circle, reached north/south of the centre's parallel
+            delta_lon = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(target_lat)))))
+        candidates = self.bbox(target_lat - delta_lat, target_lon - delta_lon, target_lat + delta_lat, target_lon + delta_lon)
+
+        distances = haversine_km(self.latitude[candidates], self.longitude[candidates], target_lat, target_lon)
+        inside = distances <= radius_km
+        if with_distances:
+            return candidates[inside], distances[inside]
+        return candidates[inside]
+
+    def nearest(self, target_lat, target_lon, k=10):
+        """
+        The k sellers nearest to a point.
+
+        Searches a growing radius, starting at one grid cell, until it holds
+        at least k sellers; the k nearest are then the k closest candidates.
+
+        Args:
+            target_lat (float): Point latitude
+            target_lon (float): Point longitude
+            k (int): Number of sellers (default: 10)
+
+        Returns:
+            tuple: (indices, distances_km) nearest first
+        """
+        k = min(k, len(self.order))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        radius_km = self.cell_degrees * _KM_PER_DEGREE
+        while True:
+            candidates, distances = self.radius(target_lat, target_lon, radius_km, with_distances=True)
+            if len(candidates) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                break
+            radius_km *= 4
+        selected = nearest_indices(distances, k)
+        return candidates[selected], distances[selected]
+
+    def save(self, path=INDEX_FILE):
+        """Write the index to an .npz file (written to a temporary file first, then replaced)."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(
+                f, latitude=self.latitude, longitude=self.longitude, keys=self.keys, order=self.order,
+                cell_degrees=self.cell_degrees, columns=self.columns, digest=self.digest
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        """Read an index written by save()."""
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.latitude = data['latitude']
+            index.longitude = data['longitude']
+            index.keys = data['keys']
+            index.order = data['order']
+            index.cell_degrees = float(data['cell_degrees'])
+            index.columns = int(data['columns'])
+            index.digest = str(data['digest'])
+        return index
+
+def load_or_build_index(sellers, path=INDEX_FILE, cell_degrees=GRID_CELL_DEGREES):
+    """
+    Load the stored index if it was built from the same coordinates, otherwise build and store a new one.
+
+    Args:
+        sellers: List of seller dictionaries/records, or a SellerBatch
+        path (str): Index file (default: seller_index.npz next to the API cache)
+        cell_degrees (float): Grid cell size in degrees
+
+    Returns:
+        SpatialIndex: Index over sellers
+    """
+    latitude, longitude = seller_coordinates(sellers)
+    missing = np.isnan(latitude) | np.isnan(longitude) | (latitude == 0) | (longitude == 0)
+    digest = coordinates_digest(np.where(missing, np.nan, latitude), np.where(missing, np.nan, longitude))
+
+    if path and os.path.exists(path):
+        try:
+            index = SpatialIndex.load(path)
+            if index.digest == digest and index.cell_degrees == cell_degrees:
+                print(f"[INDEX] Loaded spatial index of {len(index)} sellers from {path}")
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[INDEX] Could not load {path}: {e}")
+
+    index = SpatialIndex(latitude, longitude, cell_degrees)
+    if path:
+        try:
+            index.save(path)
+            print(f"[INDEX] Built spatial index of {len(index)} sellers, saved to {path}")
+        except OSError as e:
+            print(f"[INDEX] Could not save {path}: {e}")
+    return index
@@ -0,0 +1,314 @@
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+from PIL import Image, ImageOps, features
+
+from api_client import CONNECT_TIMEOUT, READ_TIMEOUT, VERIFY_SSL, create_session
+from cache_store import CacheStore
+
+# Thumbnails are stored under THUMBNAIL_DIR/<2 hex>/<source sha256>_<w>x<h>.<ext>, the index maps image URLs to digests
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_INDEX = 'index.sqlite'
+
+# Size cap for all thumbnail files, least recently used files are deleted past it
+MAX_THUMBNAIL_BYTES = 200 * 1024 * 1024
+
+# Downloads in flight, and processes generating thumbnails (None = one per CPU)
+DOWNLOAD_WORKERS = 8
+THUMBNAIL_PROCESSES = None
+
+# Twice the size the popups show (80x60 seller images, 60x45 room images) for sharp thumbnails on high-DPI screens
+THUMBNAIL_SIZES = {'seller': (160, 120), 'room': (120, 90)}
+THUMBNAIL_QUALITY = 75
+
+# Images popups show per seller and per room (see popups.py)
+SELLER_IMAGES_SHOWN = 3
+ROOM_IMAGES_SHOWN = 2
+
+# A URL that failed to download or decode is not retried for this many seconds
+FAILED_IMAGE_TTL = 24 * 60 * 60
+
+# Larger downloads are treated as broken rather than held in memory
+MAX_IMAGE_BYTES = 25 * 1024 * 1024
+
+def thumbnail_format():
+    """WebP when this Pillow build can write it, JPEG otherwise."""
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+def make_thumbnail(data, size, image_format='WEBP', quality=THUMBNAIL_QUALITY):
+    """
+    Decode an image and return a thumbnail cropped to size, like CSS object-fit: cover.
+
+    Runs in a worker process.
+
+    Args:
+        data (bytes): Source image
+        size (tuple): (width, height) in px
+        image_format (str): Pillow format name, 'WEBP' or 'JPEG'
+        quality (int): Encoder quality
+
+    Returns:
+        bytes: Encoded thumbnail
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder downscale while decoding, far cheaper than decoding full size
+        image.draft('RGB', (size[0] * 2, size[1] * 2))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        thumbnail = ImageOps.fit(image, size, Image.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.save(output, image_format, quality=quality)
+    return output.getvalue()
+
+def collect_image_jobs(sellers):
+    """
+    Image URLs the popups show, with the kinds of thumbnail each one needs.
+
+    Args:
+        sellers (iterable): Seller dictionaries/records
+
+    Returns:
+        dict: {url: set of 'seller'/'room'}
+    """
+    jobs = {}
+    for seller in sellers:
+        for url in seller['images'][:SELLER_IMAGES_SHOWN]:
+            jobs.setdefault(url, set()).add('seller')
+        if seller.get('business_category') == 'restaurant':
+            continue
+        for room in seller['rooms']:
+            for url in (room.get('images') or [])[:ROOM_IMAGES_SHOWN]:
+                jobs.setdefault(url, set()).add('room')
+    return jobs
+
+class ThumbnailCache:
+    """
+    Content-addressed thumbnail files plus an index from image URL to source digest.
+
+    The same image under different URLs is stored once. A thumbnail file's
+    modification time is its last use, files are evicted oldest first.
+
+    Args:
+        directory (str): Cache directory (default: thumbnails)
+        max_bytes (int): Size cap for thumbnail files (None disables eviction)
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=MAX_THUMBNAIL_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.image_format, self.extension = thumbnail_format()
+        os.makedirs(directory, exist_ok=True)
+        self.index = CacheStore(os.path.join(directory, THUMBNAIL_INDEX), max_bytes=None)
+
+    def path(self, digest, kind):
+        size = THUMBNAIL_SIZES[kind]
+        return os.path.join(self.directory, digest[:2], f"{digest}_{size[0]}x{size[1]}.{self.extension}")
+
+    def lookup(self, url, kind):
+        """
+        Return (status, path) for an image URL: ('hit', path), ('broken', None) or ('miss', None).
+        """
+        entry = self.index.get(url)
+        if entry is None:
+            return 'miss', None
+        if entry.get('error'):
+            return 'broken', None
+        path = self.path(entry['digest'], kind)
+        if not os.path.exists(path):
+            if self.index.get(self._failure_key(entry['digest'], kind)):
+                return 'broken', None
+            return 'miss', None
+        os.utime(path)
+        return 'hit', path
+
+    def record(self, url, digest):
+        self.index.set(url, {'digest': digest})
+
+    def record_failure(self, url, error):
+        self.index.set(url, {'error': str(error)}, ttl=FAILED_IMAGE_TTL)
+
+    def _failure_key(self, digest, kind):
+        return f"failed:{digest}_{kind}"
+
+    def record_resize_failure(self, digest, kind, error):
+        """Mark one thumbnail size of a downloaded image as broken, the image's other sizes are kept."""
+        self.index.set(self._failure_key(digest, kind), {'error': str(error)}, ttl=FAILED_IMAGE_TTL)
+
+    def store(self, digest, kind, data):
+        """Write a thumbnail file atomically, returns its path."""
+        path = self.path(digest, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return path
+
+    def evict(self, keep=()):
+        """
+        Delete least recently used thumbnails until the files fit in max_bytes.
+
+        Args:
+            keep (iterable): Paths that must not be deleted (used by the current map)
+
+        Returns:
+            int: Number of files deleted
+        """
+        if not self.max_bytes:
+            return 0
+        keep = set(keep)
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith(THUMBNAIL_INDEX):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def close(self):
+        self.index.close()
+
+def download_image(session, url):
+    """Download one image, returns (digest, data)."""
+    response = session.get(
+        url, headers={'Accept': 'image/*'}, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), verify=VERIFY_SSL, stream=True
+    )
+    with response:
+        response.raise_for_status()
+        data = response.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"image larger than {MAX_IMAGE_BYTES} bytes")
+    return hashlib.sha256(data).hexdigest(), data
+
+def prepare_thumbnails(sellers, directory=THUMBNAIL_DIR, base_dir='.', download_workers=DOWNLOAD_WORKERS,
+                       processes=THUMBNAIL_PROCESSES, max_bytes=MAX_THUMBNAIL_BYTES):
+    """
+    Make sure every image the popups show has a local thumbnail.
+
+    Cached thumbnails are reused without any request. Missing ones are
+    downloaded by a bounded thread pool and resized in a process pool as
+    the downloads finish.
+
+    Args:
+        sellers (iterable): Seller dictionaries/records
+        directory (str): Thumbnail cache directory (default: thumbnails)
+        base_dir (str): Directory of the map HTML file, thumbnail paths are made relative to it
+        download_workers (int): Downloads in flight (default: 8)
+        processes (int): Thumbnail processes (default: one per CPU)
+        max_bytes (int): Size cap for the thumbnail cache
+
+    Returns:
+        dict: {'seller': {url: src}, 'room': {url: src}} with thumbnail paths relative to base_dir,
+            src is None for broken images
+    """
+    started = time.perf_counter()
+    cache = ThumbnailCache(directory, max_bytes)
+    thumbnails = {}
+    pending = {}
+    for url, kinds in collect_image_jobs(sellers).items():
+        for kind in kinds:
+            status, path = cache.lookup(url, kind)
+            if status == 'hit':
+                thumbnails[url, kind] = path
+            elif status == 'broken':
+                thumbnails[url, kind] = None
+            else:
+                pending.setdefault(url, []).append(kind)
+
+    cached = len(thumbnails)
+    generated = 0
+    downloaded_bytes = 0
+    if pending:
+        print(f"[THUMBS] Downloading {len(pending)} images for {sum(map(len, pending.values()))} thumbnails...")
+        session = create_session(pool_size=download_workers)
+        resizes = ProcessPoolExecutor(max_workers=processes)
+        resubmitted = set()
+
+        def submit_resize(url, kind, digest, data):
+            nonlocal resizes
+            try:
+                resize = resizes.submit(make_thumbnail, data, THUMBNAIL_SIZES[kind], cache.image_format)
+            except BrokenProcessPool:
+                # Replace a pool broken by a dead worker so the remaining images are still resized
+                resizes.shutdown(wait=False)
+                resizes = ProcessPoolExecutor(max_workers=processes)
+                resize = resizes.submit(make_thumbnail, data, THUMBNAIL_SIZES[kind], cache.image_format)
+            running[resize] = (url, kind, digest, data)
+
+        try:
+            with ThreadPoolExecutor(max_workers=download_workers) as downloads:
+                running = {downloads.submit(download_image, session, url): (url, None, None, None) for url in pending}
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url, kind, digest, data = running.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool as e:
+                            # A dead worker takes every resize in flight with it, give each one more try
+                            if (url, kind) not in resubmitted:
+                                resubmitted.add((url, kind))
+                                submit_resize(url, kind, digest, data)
+                            else:
+                                print(f"[THUMBS] Resize of {url} lost with its worker process: {e}")
+                                thumbnails[url, kind] = None
+                            continue
+                        except (requests.RequestException, OSError, ValueError, SyntaxError,
+                                Image.DecompressionBombError) as e:
+                            # PIL raises SyntaxError for some truncated or corrupt images
+                            if kind is None:
+                                cache.record_failure(url, e)
+                                for failed_kind in pending[url]:
+                                    thumbnails[url, failed_kind] = None
+                            else:
+                                cache.record_resize_failure(digest, kind, e)
+                                thumbnails[url, kind] = None
+                            continue
+
+                        if kind is None:
+                            # A finished download, hand it to the resize processes
+                            digest, data = result
+                            downloaded_bytes += len(data)
+                            cache.record(url, digest)
+                            for thumb_kind in pending[url]:
+                                path = cache.path(digest, thumb_kind)
+                                if os.path.exists(path):
+                                    # Same image already cached under another URL
+                                    thumbnails[url, thumb_kind] = path
+                                    continue
+                                submit_resize(url, thumb_kind, digest, data)
+                        else:
+                            thumbnails[url, kind] = cache.store(digest, kind, result)
+                            generated += 1
+        finally:
+            resizes.shutdown()
+        session.close()
+
+    removed = cache.evict(keep=[path for path in thumbnails.values() if path])
+    cache.close()
+
+    broken = sum(1 for path in thumbnails.values() if path is None)
+    print(f"[THUMBS] {len(thumbnails)} thumbnails: {cached} cached, {generated} generated, {broken} broken"
+          f" ({downloaded_bytes / 2**20:.1f} MB downloaded, {removed} evicted) in {time.perf_counter() - started:.2f}s")
+
+    sources = {kind: {} for kind in THUMBNAIL_SIZES}
+    for (url, kind), path in thumbnails.items():
+        sources[kind][url] = os.path.relpath(path, base_dir).replace(os.sep, '/') if path else None
+    return sources
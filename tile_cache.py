@@ -0,0 +1,426 @@
+import argparse
+import math
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from api_client import CONNECT_TIMEOUT, READ_TIMEOUT, create_session
+from cache_store import _format_bytes
+
+# Tiles are stored as TILE_DIR/<layer>/<z>/<x>/<y>.tile, a file's modification time is its last use
+TILE_DIR = 'tiles'
+
+# Size cap for all tiles, least recently used tiles are deleted past it (down to EVICT_TO of the cap)
+MAX_TILE_BYTES = 500 * 1024 * 1024
+EVICT_TO = 0.9
+
+# Upstream tile URL, and the layers the maps use: street, satellite, terrain, hybrid
+TILE_SOURCE_URL = 'https://mt1.google.com/vt/lyrs={layer}&x={x}&y={y}&z={z}'
+TILE_LAYERS = ('m', 's', 'p', 'y')
+MAX_ZOOM = 22
+
+# Address of the tile proxy started with `python tile_cache.py serve`
+TILE_PROXY_HOST = '127.0.0.1'
+TILE_PROXY_PORT = 8766
+
+# Downloads in flight while pre-warming, and the most tiles one pre-warm may fetch
+PREWARM_WORKERS = 4
+MAX_PREWARM_TILES = 20000
+
+# Browsers may keep proxied tiles this long without asking again
+TILE_MAX_AGE = 7 * 24 * 60 * 60
+
+_TILE_PATH = re.compile(r'^/tiles/(?P<layer>[a-z]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)(?:\.\w+)?$')
+
+def tile_url(layer, proxy_url=None):
+    """
+    Leaflet tile URL template of a layer, straight from the tile source or through a tile proxy.
+
+    Args:
+        layer (str): Layer code from TILE_LAYERS
+        proxy_url (str): Base URL of a tile proxy, '' for the server the page came from (default: no proxy)
+
+    Returns:
+        str: URL template with {x}, {y} and {z} placeholders
+    """
+    if proxy_url is None:
+        return TILE_SOURCE_URL.format(layer=layer, x='{x}', y='{y}', z='{z}')
+    return f"{proxy_url.rstrip('/')}/tiles/{layer}/{{z}}/{{x}}/{{y}}"
+
+def tile_content_type(data):
+    """Content type of a tile from its first bytes (the source mixes PNG and JPEG)."""
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+def tiles_in_bbox(min_lat, min_lon, max_lat, max_lon, zoom):
+    """
+    Web Mercator tiles covering a bounding box at one zoom.
+
+    Args:
+        min_lat (float): South edge
+        min_lon (float): West edge
+        max_lat (float): North edge
+        max_lon (float): East edge
+        zoom (int): Zoom level
+
+    Returns:
+        list: (x, y) tiles, row by row from the north-west corner
+    """
+    def tile_xy(lat, lon):
+        lat = max(min(lat, 85.05112878), -85.05112878)
+        n = 2 ** zoom
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    west, north = tile_xy(max_lat, min_lon)
+    east, south = tile_xy(min_lat, max_lon)
+    return [(x, y) for y in range(north, south + 1) for x in range(west, east + 1)]
+
+class TileCache:
+    """
+    On-disk z/x/y store of map tiles, filled from the tile source on a miss.
+
+    The total size is counted once when the cache is opened and kept up to
+    date as tiles are added, so the directory is only walked again when
+    the cap is passed; eviction then deletes the least recently used tiles
+    until the cache is down to EVICT_TO of the cap.
+
+    Args:
+        directory (str): Cache directory (default: tiles)
+        max_bytes (int): Size cap for all tiles (None disables eviction)
+        source_url (str): Upstream URL template with {layer}, {x}, {y} and {z}
+    """
+
+    def __init__(self, directory=TILE_DIR, max_bytes=MAX_TILE_BYTES, source_url=TILE_SOURCE_URL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.source_url = source_url
+        self.session = create_session()
+        self.session.headers['Accept'] = 'image/*'
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.bytes = sum(size for _, size, _ in self._files())
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def path(self, layer, z, x, y):
+        return os.path.join(self.directory, layer, str(z), str(x), f"{y}.tile")
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tile'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def get(self, layer, z, x, y, fetch=True):
+        """
+        Return a tile from the cache, fetching and storing it on a miss.
+
+        Args:
+            layer (str): Layer code from TILE_LAYERS
+            z (int): Zoom
+            x (int): Column
+            y (int): Row
+            fetch (bool): Fetch missing tiles from the source (default: True)
+
+        Returns:
+            bytes: Tile image, None if it is missing and not fetched
+
+        Raises:
+            requests.RequestException: The source failed
+        """
+        path = self.path(layer, z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return data
+        except FileNotFoundError:
+            pass
+        if not fetch:
+            return None
+
+        with self._lock:
+            self.misses += 1
+        try:
+            response = self.session.get(
+                self.source_url.format(layer=layer, x=x, y=y, z=z), timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+            )
+            response.raise_for_status()
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+        self.store(layer, z, x, y, response.content)
+        return response.content
+
+    def store(self, layer, z, x, y, data):
+        """Write a tile atomically and evict old tiles if the cache passed its cap."""
+        path = self.path(layer, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            # A tile fetched again (e.g. by two requests at once) replaces the old file, count only the difference
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_path, path)
+            self.bytes += len(data) - replaced
+            if self.max_bytes and self.bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO))
+
+    def _evict(self, target_bytes):
+        """Delete least recently used tiles until the cache fits in target_bytes, with the lock held."""
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self.bytes = total
+        return removed
+
+    def evict(self, max_bytes=None):
+        """
+        Delete least recently used tiles until the cache fits.
+
+        Args:
+            max_bytes (int): Size to fit in (default: the cache's cap)
+
+        Returns:
+            int: Number of tiles deleted
+        """
+        with self._lock:
+            return self._evict(max_bytes if max_bytes is not None else self.max_bytes or self.bytes)
+
+    def clear(self):
+        """Delete every tile, returns the number deleted."""
+        return self.evict(0)
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'tiles': sum(1 for _ in self._files()),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes
+        }
+
+    def close(self):
+        self.session.close()
+
+def tile_response(cache, path):
+    """
+    Answer a /tiles/<layer>/<z>/<x>/<y> request from a tile cache.
+
+    Args:
+        cache (TileCache): Tile cache
+        path (str): Request path
+
+    Returns:
+        tuple: (HTTP status, body bytes, content type)
+    """
+    match = _TILE_PATH.match(path)
+    if not match:
+        return 404, b'not found', 'text/plain'
+    layer = match['layer']
+    z, x, y = int(match['z']), int(match['x']), int(match['y'])
+    if layer not in TILE_LAYERS or z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return 404, b'not found', 'text/plain'
+    try:
+        data = cache.get(layer, z, x, y)
+    except requests.RequestException as e:
+        return 502, f"tile source failed: {e}".encode('utf-8'), 'text/plain'
+    return 200, data, tile_content_type(data)
+
+def send_tile(handler, cache):
+    """Send a tile_response through a BaseHTTPRequestHandler."""
+    status, body, content_type = tile_response(cache, handler.path.split('?', 1)[0])
+    handler.send_response(status)
+    handler.send_header('Content-Type', content_type)
+    handler.send_header('Content-Length', str(len(body)))
+    if status == 200:
+        handler.send_header('Cache-Control', f'max-age={TILE_MAX_AGE}')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.end_headers()
+    handler.wfile.write(body)
+
+class TileProxy(ThreadingHTTPServer):
+    """
+    Local tile proxy in front of a TileCache, for maps made with tile_url(layer, proxy_url).
+
+    Args:
+        address (tuple): (host, port) to listen on
+        cache (TileCache): Tile cache the tiles are served from
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, cache):
+        super().__init__(address, TileRequestHandler)
+        self.cache = cache
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        send_tile(self, self.server.cache)
+
+    def log_message(self, format, *args):
+        pass
+
+def prewarm(cache, min_lat, min_lon, max_lat, max_lon, zooms, layers=TILE_LAYERS, workers=PREWARM_WORKERS,
+            max_tiles=MAX_PREWARM_TILES, padding=0.1):
+    """
+    Fetch every tile of a bounding box over a zoom range that the cache does not hold yet.
+
+    Args:
+        cache (TileCache): Tile cache to fill
+        min_lat (float): South edge
+        min_lon (float): West edge
+        max_lat (float): North edge
+        max_lon (float): East edge
+        zooms (tuple): (lowest, highest) zoom, inclusive
+        layers (iterable): Layer codes (default: all four map layers)
+        workers (int): Downloads in flight
+        max_tiles (int): Stop adding zooms once this many tiles are needed
+        padding (float): Extra margin around the box, as a share of its size
+
+    Returns:
+        dict: Tile counts {'tiles', 'cached', 'fetched', 'failed'}
+    """
+    started = time.perf_counter()
+    pad_lat = (max_lat - min_lat) * padding
+    pad_lon = (max_lon - min_lon) * padding
+    box = (min_lat - pad_lat, min_lon - pad_lon, max_lat + pad_lat, max_lon + pad_lon)
+
+    jobs = []
+    for zoom in range(zooms[0], zooms[1] + 1):
+        tiles = tiles_in_bbox(*box, zoom)
+        if len(jobs) + len(tiles) * len(layers) > max_tiles:
+            print(f"[TILES] Stopping at zoom {zoom - 1}, zoom {zoom} would pass {max_tiles} tiles")
+            break
+        jobs.extend((layer, zoom, x, y) for layer in layers for x, y in tiles)
+
+    missing = [job for job in jobs if not os.path.exists(cache.path(*job))]
+    counts = {'tiles': len(jobs), 'cached': len(jobs) - len(missing), 'fetched': 0, 'failed': 0}
+    if missing:
+        print(f"[TILES] Pre-warming {len(missing)} of {len(jobs)} tiles...")
+
+        def fetch(job):
+            try:
+                cache.get(*job)
+                return True
+            except requests.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for ok in executor.map(fetch, missing):
+                counts['fetched' if ok else 'failed'] += 1
+    print(f"[TILES] {counts['tiles']} tiles: {counts['cached']} cached, {counts['fetched']} fetched, "
+          f"{counts['failed']} failed in {time.perf_counter() - started:.2f}s")
+    return counts
+
+def prewarm_sellers(cache, sellers_info, zooms, target=None, **kwargs):
+    """
+    Pre-warm the tiles around a seller set (and the target), see prewarm.
+
+    Args:
+        cache (TileCache): Tile cache to fill
+        sellers_info (list): Seller dictionaries/records, or a SellerBatch
+        zooms (tuple): (lowest, highest) zoom, inclusive
+        target (tuple): (latitude, longitude) included in the box (optional)
+        **kwargs: Further prewarm arguments
+
+    Returns:
+        dict: Tile counts from prewarm, None if there is nothing to cover
+    """
+    # NumPy is only needed here, the proxy and the cache commands start without it
+    import numpy as np
+    from geo import seller_coordinates
+
+    latitude, longitude = seller_coordinates(sellers_info)
+    valid = ~np.isnan(latitude)
+    latitude, longitude = list(latitude[valid]), list(longitude[valid])
+    if target is not None:
+        latitude.append(target[0])
+        longitude.append(target[1])
+    if not latitude:
+        return None
+    return prewarm(cache, min(latitude), min(longitude), max(latitude), max(longitude), zooms, **kwargs)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local tile proxy and cache for the map layers")
+    parser.add_argument('--dir', default=TILE_DIR, help=f"cache directory (default: {TILE_DIR})")
+    parser.add_argument('--max-mb', type=float, default=MAX_TILE_BYTES / 2**20, help="size cap in MB")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="run the tile proxy")
+    serve.add_argument('--host', default=TILE_PROXY_HOST)
+    serve.add_argument('--port', type=int, default=TILE_PROXY_PORT)
+    warm = commands.add_parser('prewarm', help="fetch the tiles of a bounding box")
+    warm.add_argument('bbox', help="south,west,north,east")
+    warm.add_argument('--zooms', default='8-14', help="zoom range, e.g. 8-14")
+    warm.add_argument('--layers', default=''.join(TILE_LAYERS), help="layer codes, e.g. ms")
+    commands.add_parser('stats', help="show tile count and size")
+    commands.add_parser('clear', help="delete every tile")
+    args = parser.parse_args(argv)
+
+    cache = TileCache(args.dir, int(args.max_mb * 2**20))
+    try:
+        if args.command == 'serve':
+            server = TileProxy((args.host, args.port), cache)
+            print(f"[TILES] Serving tiles from {args.dir} at {server.url}/tiles/<layer>/<z>/<x>/<y> (Ctrl+C to stop)")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            print(f"[TILES] {cache.hits} hits, {cache.misses} misses, {cache.errors} errors")
+        elif args.command == 'prewarm':
+            south, west, north, east = (float(value) for value in args.bbox.split(','))
+            low, _, high = args.zooms.partition('-')
+            prewarm(cache, south, west, north, east, (int(low), int(high or low)), layers=tuple(args.layers))
+        elif args.command == 'stats':
+            stats = cache.stats()
+            print(f"Tile cache: {stats['directory']}")
+            print(f"Tiles: {stats['tiles']}")
+            print(f"Size: {_format_bytes(stats['bytes'])}"
+                  + (f" of {_format_bytes(stats['max_bytes'])}" if stats['max_bytes'] else ""))
+        elif args.command == 'clear':
+            print(f"Removed {cache.clear()} tiles")
+    finally:
+        cache.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.exit(main())